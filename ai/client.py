@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import httpx
+from openai import OpenAI
+
+from utils.metrics import Histogram, registry, LATENCY_BUCKETS
+
+
+class OpenAIClientManager:
+    """
+    One lazily built OpenAI client per process, shared by every
+    AIService / provider instance.
+
+    The client sits on a tuned httpx connection pool with keep-alive, so
+    hot paths reuse TLS connections instead of handshaking per call.
+    Nothing is built at import time: with preload_app the master never
+    opens a socket, and a forked child drops any inherited client (without
+    closing it, the sockets still belong to the parent) and builds its own
+    on first use.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        timeout: float = 30,
+        connect_timeout: float = 5,
+        max_connections: int = 16,
+        max_keepalive: int = 8,
+        keepalive_expiry: float = 60,
+        max_retries: int = 2
+    ):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = min(connect_timeout, timeout)
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.max_retries = max_retries
+
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    # ----------------------------------
+    # Lifecycle
+    # ----------------------------------
+    def get(self) -> OpenAI:
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = self._build()
+                self._pid = os.getpid()
+            return self._client
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+            if client is not None and self._pid == os.getpid():
+                client.close()
+
+    def _build(self) -> OpenAI:
+        api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY not set")
+
+        timeout = httpx.Timeout(self.timeout, connect=self.connect_timeout)
+        http_client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            event_hooks={"request": [self._on_request]}
+        )
+        self._stats["clients_built"] += 1
+        return OpenAI(
+            api_key=api_key,
+            http_client=http_client,
+            timeout=timeout,
+            max_retries=self.max_retries
+        )
+
+    def _after_fork(self) -> None:
+        # Runs in the child only; the parent still owns the sockets
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    # ----------------------------------
+    # Instrumentation
+    # ----------------------------------
+    def _reset_stats(self) -> None:
+        self._stats = {
+            "clients_built": 0,
+            "requests": 0,
+            "connections_opened": 0,
+            "tls_handshakes": 0,
+            "saturated": 0
+        }
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._acquire = Histogram(LATENCY_BUCKETS)
+        self._stats_lock = threading.Lock()
+
+    def _on_request(self, request: httpx.Request) -> None:
+        started = time.perf_counter()
+        waiting = [True]
+
+        def trace(event: str, info: Dict) -> None:
+            # Time to first byte written = pool wait + connect + TLS
+            if waiting[0] and event.endswith("send_request_headers.started"):
+                waiting[0] = False
+                with self._stats_lock:
+                    self._acquire.observe(time.perf_counter() - started)
+            elif event == "connection.connect_tcp.complete":
+                with self._stats_lock:
+                    self._stats["connections_opened"] += 1
+            elif event == "connection.start_tls.complete":
+                with self._stats_lock:
+                    self._stats["tls_handshakes"] += 1
+
+        request.extensions["trace"] = trace
+        with self._stats_lock:
+            self._stats["requests"] += 1
+
+    @contextmanager
+    def in_flight(self):
+        """
+        Track a call from request to the end of its response body
+        """
+        with self._stats_lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            if self._in_flight > self.max_connections:
+                self._stats["saturated"] += 1
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            requests = self._stats["requests"]
+            opened = self._stats["connections_opened"]
+            return {
+                **self._stats,
+                "reuse_rate": round(1 - opened / requests, 4) if requests else None,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "max_connections": self.max_connections,
+                "max_keepalive": self.max_keepalive,
+                "acquire_seconds": self._acquire.to_dict()
+            }
+
+    def prometheus(self) -> List[str]:
+        with self._stats_lock:
+            lines = [
+                f"openai_client_{name}_total {value}"
+                for name, value in self._stats.items()
+            ]
+            lines.append(f"openai_client_in_flight {self._in_flight}")
+            lines.extend(self._acquire.prometheus("openai_client_acquire_seconds", {}))
+            return lines
+
+
+client_manager = OpenAIClientManager(
+    timeout=float(os.getenv("AI_REQUEST_TIMEOUT", 30)),
+    max_connections=int(os.getenv("AI_HTTP_MAX_CONNECTIONS", 16)),
+    max_keepalive=int(os.getenv("AI_HTTP_MAX_KEEPALIVE", 8)),
+    keepalive_expiry=float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", 60)),
+    max_retries=int(os.getenv("AI_MAX_RETRIES", 2))
+)
+registry.register("openai_client", client_manager.stats, client_manager.prometheus)
@@ -0,0 +1,433 @@
+import json
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import registry
+
+
+class ExtractionError(ValueError):
+    pass
+
+
+# ----------------------------------
+# Schemas
+# ----------------------------------
+def _is_str(value):
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_str_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(v, str) for v in value)
+
+
+def _is_object_list(value):
+    return isinstance(value, list) and all(isinstance(v, dict) for v in value)
+
+
+_CHECKS = {
+    "str": _is_str,
+    "number": _is_number,
+    "list[str]": _is_str_list,
+    "list[object]": _is_object_list
+}
+
+
+class Schema:
+    """
+    Field rules compiled once into (name, check, nullable) triples.
+    A trailing "?" marks a rule as nullable.
+    """
+
+    def __init__(self, spec: Dict[str, str]):
+        self.fields = list(spec)
+        self._checks = [
+            (name, _CHECKS[rule.rstrip("?")], rule.endswith("?"))
+            for name, rule in spec.items()
+        ]
+
+    def errors(self, obj: Any) -> List[str]:
+        """
+        Names of fields that are missing or invalid
+        """
+        if not isinstance(obj, dict):
+            return list(self.fields)
+
+        bad = []
+        for name, check, nullable in self._checks:
+            value = obj.get(name)
+            if value is None and nullable and name in obj:
+                continue
+            if not check(value):
+                bad.append(name)
+        return bad
+
+
+MEAL_DAY_SCHEMA = Schema({
+    "id": "str",
+    "day": "str",
+    "breakfast": "str",
+    "lunch": "str",
+    "dinner": "str"
+})
+
+RECIPE_SCHEMA = Schema({
+    "title": "str",
+    "ingredients": "list[str]",
+    "steps": "list[str]",
+    "calories": "number?",
+    "cookingTimeMinutes": "number?",
+    "dietType": "str?",
+    "id": "str",
+    "groceries": "list[object]"
+})
+
+
+def normalize_day(day: Any) -> Any:
+    """
+    Fill in fields that never need the LLM (ids)
+    """
+    if isinstance(day, dict) and not _is_str(day.get("id")):
+        day["id"] = str(uuid.uuid4())
+    return day
+
+
+def day_key(day: Any) -> Optional[str]:
+    """
+    "Mon".."Sun" style key of a plan day (None-safe), or None if not a dict
+    """
+    if not isinstance(day, dict):
+        return None
+    return str(day.get("day") or "").strip()[:3].title()
+
+
+def normalize_recipe(recipe: Any, meal_name: Optional[str] = None) -> Any:
+    """
+    Fill in or coerce fields that never need the LLM
+    """
+    if not isinstance(recipe, dict):
+        return recipe
+
+    if not _is_str(recipe.get("id")):
+        recipe["id"] = str(uuid.uuid4())
+    if meal_name and not _is_str(recipe.get("title")):
+        recipe["title"] = meal_name
+
+    for field in ("calories", "cookingTimeMinutes"):
+        value = recipe.get(field)
+        if isinstance(value, str):
+            digits = "".join(ch for ch in value if ch.isdigit() or ch == ".")
+            try:
+                recipe[field] = int(float(digits))
+            except ValueError:
+                recipe[field] = None
+        elif field not in recipe:
+            recipe[field] = None
+
+    recipe.setdefault("dietType", None)
+
+    for item in recipe.get("groceries") or []:
+        if isinstance(item, dict) and not _is_str(item.get("id")):
+            item["id"] = str(uuid.uuid4())
+    return recipe
+
+
+# ----------------------------------
+# Stats
+# ----------------------------------
+class ExtractionStats:
+    """
+    Per-kind counters of parse outcomes and fragment retries
+    """
+
+    OUTCOMES = ("clean", "repaired", "failed", "retried", "retry_failed")
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(kind, dict.fromkeys(self.OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            result = {}
+            for kind, counts in self._counts.items():
+                parsed = counts["clean"] + counts["repaired"]
+                total = parsed + counts["failed"]
+                result[kind] = {
+                    **counts,
+                    "success_rate": round(parsed / total, 4) if total else None,
+                    "repair_rate": round(counts["repaired"] / total, 4) if total else None
+                }
+            return result
+
+
+extraction_stats = ExtractionStats()
+registry.register("llm_extraction", extraction_stats.stats)
+
+
+# ----------------------------------
+# Extraction
+# ----------------------------------
+_OPENERS = {"[": "]", "{": "}"}
+_SMART_DOUBLE = "“”„‟″"
+_SMART_SINGLE = "‘’"
+
+
+def _locate(text: str, expect: Optional[type]) -> Optional[str]:
+    """
+    Slice out the first JSON array/object; the rest of the text if truncated
+    """
+    wanted = {list: "[", dict: "{"}.get(expect)
+    if wanted:
+        start = text.find(wanted)
+    else:
+        starts = [i for i in (text.find("["), text.find("{")) if i >= 0]
+        start = min(starts) if starts else -1
+    if start < 0:
+        return None
+
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _repair(text: str) -> Any:
+    """
+    Fix smart quotes, raw newlines in strings, stray escaped newlines,
+    trailing commas and truncated tails, then parse
+    """
+    out = []
+    stack = []
+    cuts = []  # (position in out, closers needed) where a value may be dropped
+    in_string = False
+    smart_string = False
+    escape = False
+    i = 0
+
+    while i < len(text):
+        ch = text[i]
+
+        if in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif (ch == '"' and not smart_string) or (ch in _SMART_DOUBLE and smart_string):
+                in_string = False
+                out.append('"')
+            elif ch in _SMART_DOUBLE or ch == '"':
+                out.append('\\"')
+            elif ch in _SMART_SINGLE:
+                out.append("'")
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch in "\r\t":
+                out.append(" ")
+            else:
+                out.append(ch)
+
+        elif ch == '"' or ch in _SMART_DOUBLE:
+            in_string = True
+            smart_string = ch != '"'
+            out.append('"')
+        elif ch == "\\" and text[i + 1:i + 2] in ("n", "t", "r"):
+            i += 1
+        elif ch in _OPENERS:
+            stack.append(_OPENERS[ch])
+            out.append(ch)
+            cuts.append((len(out), "".join(reversed(stack))))
+        elif ch in "]}":
+            while out and out[-1] in " \n\r\t":
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+        elif ch == ",":
+            cuts.append((len(out), "".join(reversed(stack))))
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+
+    if in_string:
+        out.append('"')
+
+    body = "".join(out)
+    closers = "".join(reversed(stack))
+
+    try:
+        return json.loads(body + closers)
+    except json.JSONDecodeError:
+        pass
+
+    # Truncated mid-value: drop back to the last complete element
+    for position, needed in reversed(cuts):
+        try:
+            return json.loads(body[:position] + needed)
+        except json.JSONDecodeError:
+            continue
+
+    raise ExtractionError("Could not repair JSON returned by AI")
+
+
+def _loads(text: str) -> Tuple[Any, str]:
+    """
+    (value, "clean" | "repaired"); ExtractionError if beyond repair
+    """
+    try:
+        return json.loads(text), "clean"
+    except json.JSONDecodeError:
+        return _repair(text), "repaired"
+
+
+def extract_json(text: Any, expect: Optional[type] = None, kind: str = "json") -> Any:
+    """
+    Locate, parse and if needed repair the first JSON value in `text`.
+    Outcomes are recorded in `extraction_stats` under `kind`.
+    """
+    if not isinstance(text, str) or not text.strip():
+        extraction_stats.record(kind, "failed")
+        raise ExtractionError("Empty response from AI")
+
+    candidate = _locate(text, expect)
+    if candidate is None:
+        extraction_stats.record(kind, "failed")
+        raise ExtractionError("No JSON value found in AI response")
+
+    try:
+        value, outcome = _loads(candidate)
+    except ExtractionError:
+        extraction_stats.record(kind, "failed")
+        raise
+
+    if expect is not None and not isinstance(value, expect):
+        extraction_stats.record(kind, "failed")
+        raise ExtractionError(f"Expected JSON {expect.__name__}, got {type(value).__name__}")
+
+    extraction_stats.record(kind, outcome)
+    return value
+
+
+# ----------------------------------
+# Streaming
+# ----------------------------------
+class JSONStreamParser:
+    """
+    Incremental parser for a streamed top-level JSON array or object.
+
+    Text is fed in chunks as it arrives from the LLM. Anything before the
+    first '[' or '{' (markdown fences, preamble) is skipped. Every
+    complete array element is returned as soon as its closing delimiter
+    arrives; for an object, each complete member is returned as a
+    (key, value) tuple. Elements go through the same parse-then-repair
+    path as extract_json; one that can't be repaired is skipped and
+    counted as failed under `kind`.
+    """
+
+    def __init__(self, kind: str = "stream"):
+        self.stats_kind = kind
+        self._buf = ""
+        self._pos = 0
+        self._start = None
+        self._kind = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        if self.done or not chunk:
+            return []
+
+        self._buf += chunk
+        items = []
+        buf = self._buf
+        i = self._pos
+
+        while i < len(buf):
+            ch = buf[i]
+
+            if self._kind is None:
+                if ch in "[{":
+                    self._kind = ch
+                    self._depth = 1
+                    self._start = i + 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buf[self._start:i], items)
+                    self.done = True
+                    break
+            elif ch == "," and self._depth == 1:
+                self._emit(buf[self._start:i], items)
+                self._start = i + 1
+            i += 1
+
+        # Drop consumed text so memory stays bounded by one element
+        if self._start is not None and self._start > 0:
+            self._buf = buf[self._start:]
+            i -= self._start
+            self._start = 0
+        self._pos = i
+        return items
+
+    def _emit(self, text: str, items: List[Any]) -> None:
+        text = text.strip()
+        if not text:
+            return
+        if self._kind == "{":
+            text = "{" + text + "}"
+        try:
+            value, outcome = _loads(text)
+        except ExtractionError:
+            extraction_stats.record(self.stats_kind, "failed")
+            return
+        extraction_stats.record(self.stats_kind, outcome)
+        if self._kind == "[":
+            items.append(value)
+        elif isinstance(value, dict):
+            items.extend(value.items())
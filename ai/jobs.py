@@ -0,0 +1,259 @@
+import os
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from database import db
+from ai.models import GenerationJob
+from ai.service import AIService
+from ai.pool import meal_plan_pool
+from ai.telemetry import LLMTelemetry
+from ai.resilience import Deadline
+from credits.service import CreditService, Reservation
+from meals.service import MealService
+from recipes.service import RecipeService
+
+logger = logging.getLogger(__name__)
+
+# Conditional, so it can't overwrite a job that finished meanwhile.
+# A running job's time counts from when a worker picked it up.
+_EXPIRE_SQL = text("""
+    UPDATE generation_jobs
+    SET status = 'failed', error = 'Job timed out', finished_at = :now
+    WHERE id = :id
+      AND (
+          (status = 'queued' AND created_at < :deadline)
+          OR (status = 'running' AND started_at < :deadline)
+      )
+    RETURNING user_id, payload
+""")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobService:
+    """
+    Asynchronous meal / recipe generation.
+
+    Jobs are persisted in `generation_jobs`, so any worker can answer a
+    poll. Each worker drains its own jobs through a bounded thread pool,
+    which keeps slow LLM calls off the request threads.
+    """
+
+    KINDS = ("meal", "recipe")
+
+    WORKERS = int(os.getenv("AI_JOB_WORKERS", 2))
+    QUEUE_SIZE = int(os.getenv("AI_JOB_QUEUE_SIZE", 32))
+    TIMEOUT = int(os.getenv("AI_JOB_TIMEOUT", 300))  # seconds
+
+    _executor = None
+    _slots = None
+    _pid = None
+    _lock = threading.Lock()
+    _ai_service = None
+
+    # ----------------------------------
+    # Worker pool (per process)
+    # ----------------------------------
+    @classmethod
+    def _pool(cls):
+        if cls._pid != os.getpid():
+            with cls._lock:
+                if cls._pid != os.getpid():
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=cls.WORKERS,
+                        thread_name_prefix="ai-job"
+                    )
+                    # Running + waiting jobs this worker will accept
+                    cls._slots = threading.BoundedSemaphore(cls.WORKERS + cls.QUEUE_SIZE)
+                    cls._ai_service = AIService()
+                    cls._pid = os.getpid()
+        return cls._executor, cls._slots
+
+    # ----------------------------------
+    # Public API
+    # ----------------------------------
+    @classmethod
+    def enqueue(cls, app, user_id, kind, payload):
+        """
+        Persist a queued job and hand it to the worker pool.
+        Raises JobQueueFull when this worker's queue is at capacity.
+        """
+        if kind not in cls.KINDS:
+            raise ValueError(f"Unknown job type: {kind}")
+
+        executor, slots = cls._pool()
+        if not slots.acquire(blocking=False):
+            raise JobQueueFull("Generation queue is full")
+
+        try:
+            job = GenerationJob(user_id=user_id, kind=kind, payload=payload)
+            db.session.add(job)
+            db.session.commit()
+            executor.submit(cls._run, app, job.id, LLMTelemetry.current())
+        except Exception:
+            slots.release()
+            db.session.rollback()
+            raise
+
+        return job
+
+    @classmethod
+    def get(cls, job_id, user_id):
+        """
+        The job if it belongs to `user_id`, else None
+        """
+        job = GenerationJob.query.get(job_id)
+        if not job or str(job.user_id) != str(user_id):
+            return None
+        if job.status in ("queued", "running") and cls._expire_if_stale(job.id):
+            db.session.refresh(job)
+        return job
+
+    @staticmethod
+    def to_dict(job):
+        return {
+            "job_id": str(job.id),
+            "type": job.kind,
+            "status": job.status,
+            "result": job.result,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at
+        }
+
+    # ----------------------------------
+    # Execution
+    # ----------------------------------
+    @classmethod
+    def _run(cls, app, job_id, tags):
+        # queued_at from the request, so queue wait covers time in the pool
+        token = LLMTelemetry.bind(**tags)
+        deadline = Deadline.bind(cls.TIMEOUT * 1000)
+        try:
+            with app.app_context():
+                cls._execute(job_id)
+        except Exception as e:
+            logger.exception("Generation job %s crashed: %s", job_id, e)
+        finally:
+            Deadline.unbind(deadline)
+            LLMTelemetry.unbind(token)
+            cls._slots.release()
+
+    @classmethod
+    def _execute(cls, job_id):
+        # Claim the job; one that expired while queued was settled by the expiry
+        claimed = GenerationJob.query.filter_by(id=job_id, status="queued").update(
+            {"status": "running", "started_at": datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if not claimed:
+            db.session.remove()
+            return
+
+        job = GenerationJob.query.get(job_id)
+        user_id, payload = job.user_id, job.payload
+        try:
+            if job.kind == "meal":
+                result = cls._generate_meal(user_id, payload)
+            else:
+                result = cls._generate_recipe(user_id, payload)
+            values = {"status": "succeeded", "result": result}
+        except Exception as e:
+            db.session.rollback()
+            values = {"status": "failed", "error": str(e)}
+
+        try:
+            # Only if still running: a poll may have expired it meanwhile,
+            # and that poll already released the credit
+            finished = GenerationJob.query.filter_by(id=job_id, status="running").update(
+                {**values, "finished_at": datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.session.commit()
+            if finished:
+                cls._settle_credits(job_id, user_id, payload, values["status"] == "succeeded")
+        finally:
+            db.session.remove()
+
+    @staticmethod
+    def _settle_credits(job_id, user_id, payload, succeeded: bool):
+        """
+        Charge the credit held when the job was created only if it succeeded
+        """
+        reservation_id = (payload or {}).get("reservation_id")
+        if not reservation_id:
+            return
+
+        reservation = Reservation(uuid.UUID(str(reservation_id)), user_id, 1)
+        try:
+            if succeeded:
+                CreditService().commit(reservation)
+            else:
+                CreditService().release(reservation)
+        except Exception as e:
+            # Left held; it expires on its own
+            logger.warning("Settling credits for job %s failed: %s", job_id, e)
+
+    @classmethod
+    def _generate_meal(cls, user_id, payload):
+        cuisine = payload.get("cuisine", "any")
+
+        meals = MealService.compose_plan(user_id, cuisine, payload.get("mode"))
+        if meals is None:
+            meals = meal_plan_pool.pop(cuisine)
+        if meals is None:
+            meals = cls._ai_service.generate_meal_plan(cuisine)
+
+        meal = MealService.save_meal(
+            user_id=user_id,
+            meals=meals,
+            cuisine=cuisine,
+            saved=False,
+            generated=True
+        )
+        return {"meal_id": str(meal.id), "meals": meals}
+
+    @classmethod
+    def _generate_recipe(cls, user_id, payload):
+        meal_name = payload.get("meal_name")
+        recipe_json = cls._ai_service.generate_recipe(meal_name)
+
+        recipe = RecipeService.save_recipe(
+            user_id=user_id,
+            title=recipe_json.get("title", meal_name),
+            content=recipe_json,
+            saved=False
+        )
+        return {"recipe_id": str(recipe.id), "recipe": recipe_json}
+
+    @classmethod
+    def _expire_if_stale(cls, job_id) -> bool:
+        """
+        Jobs whose worker died never finish; fail them after TIMEOUT
+        (queued since creation, running since pick-up) and release their
+        credit. True if this call expired the job.
+        """
+        now = datetime.utcnow()
+        try:
+            row = db.session.execute(_EXPIRE_SQL, {
+                "id": job_id,
+                "now": now,
+                "deadline": now - timedelta(seconds=cls.TIMEOUT)
+            }).first()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if row is not None:
+            cls._settle_credits(job_id, row.user_id, row.payload, False)
+        return row is not None
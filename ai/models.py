@@ -0,0 +1,26 @@
+from datetime import datetime
+from database import db
+import uuid
+from sqlalchemy.dialects.postgresql import UUID
+
+class GenerationJob(db.Model):
+    __tablename__ = "generation_jobs"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True,default=uuid.uuid4,
+    unique=True,
+    nullable=False)
+    user_id = db.Column(
+        UUID(as_uuid=True),
+        nullable=False,
+        index=True
+    )
+
+    kind = db.Column(db.String(20), nullable=False)  # meal / recipe
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued / running / succeeded / failed
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
@@ -0,0 +1,187 @@
+import os
+import logging
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Optional, Callable
+
+from ai.service import AIService, MealPlanCache
+from ai.telemetry import LLMTelemetry, telemetry
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class MealPlanPool:
+    """
+    Warm pool of ready-made 7-day plans for popular cuisines.
+
+    Requests pop a plan in O(1). A background refiller tops each cuisine
+    back up to `size` plans once it drops below `low_water`.
+    """
+
+    def __init__(
+        self,
+        cuisines: List[str],
+        size: int = 4,
+        low_water: int = 2,
+        interval: float = 30.0,
+        generate: Optional[Callable[[str], List[Dict]]] = None
+    ):
+        self.size = max(1, size)
+        self.low_water = min(max(0, low_water), self.size)
+        self.interval = interval
+        self._generate = generate
+
+        self._pools = {
+            MealPlanCache.normalize_cuisine(c): deque()
+            for c in cuisines if c.strip()
+        }
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.refill_seconds_total = 0.0
+        self.refill_seconds_last = None
+        self.refill_seconds_max = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._pools)
+
+    # ----------------------------------
+    # Request path
+    # ----------------------------------
+    def pop(self, cuisine: Optional[str]) -> Optional[List[Dict]]:
+        """
+        Take a ready plan for `cuisine`, or None if the cuisine is not
+        pooled or its pool is currently empty.
+        """
+        pool = self._pools.get(MealPlanCache.normalize_cuisine(cuisine))
+        if pool is None:
+            return None
+
+        self.start()
+
+        try:
+            plan = pool.popleft()
+        except IndexError:
+            plan = None
+
+        with self._lock:
+            if plan is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if len(pool) < self.low_water:
+            self._wake.set()
+
+        return plan
+
+    # ----------------------------------
+    # Background refill
+    # ----------------------------------
+    def start(self) -> None:
+        """
+        Start the refiller in this process. Safe to call repeatedly and
+        after a fork; threads do not survive gunicorn's fork.
+        """
+        if not self.enabled:
+            return
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="meal-plan-pool", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        generate = self._generate
+        if generate is None:
+            service = AIService()
+            generate = lambda cuisine: service.generate_meal_plan(cuisine, use_cache=False)
+
+        while True:
+            for cuisine, pool in self._pools.items():
+                if len(pool) >= self.low_water:
+                    continue
+                while len(pool) < self.size:
+                    if not self._refill_one(cuisine, pool, generate):
+                        break
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _refill_one(self, cuisine: str, pool: deque, generate) -> bool:
+        started = time.monotonic()
+        token = LLMTelemetry.bind(
+            endpoint="meal_pool.refill",
+            cuisine=telemetry.cuisine_bucket(cuisine),
+            queued_at=time.time()
+        )
+        try:
+            plan = generate(cuisine)
+        except Exception as e:
+            with self._lock:
+                self.refill_errors += 1
+            logger.warning("Meal pool refill failed for %s: %s", cuisine, e)
+            return False
+        finally:
+            LLMTelemetry.unbind(token)
+
+        elapsed = time.monotonic() - started
+        pool.append(plan)
+
+        with self._lock:
+            self.refills += 1
+            self.refill_seconds_total += elapsed
+            self.refill_seconds_last = elapsed
+            self.refill_seconds_max = max(self.refill_seconds_max, elapsed)
+        return True
+
+    # ----------------------------------
+    # Stats
+    # ----------------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": self.size,
+                "low_water": self.low_water,
+                "depth": {c: len(p) for c, p in self._pools.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "refills": self.refills,
+                "refill_errors": self.refill_errors,
+                "refill_latency_seconds": {
+                    "last": self.refill_seconds_last,
+                    "avg": (
+                        round(self.refill_seconds_total / self.refills, 3)
+                        if self.refills else None
+                    ),
+                    "max": self.refill_seconds_max
+                }
+            }
+
+
+# One pool per worker process, refilled after fork (see gunicorn.conf.py)
+meal_plan_pool = MealPlanPool(
+    cuisines=os.getenv("MEAL_POOL_CUISINES", "any,indian,italian,chinese,mexican").split(","),
+    size=int(os.getenv("MEAL_POOL_SIZE", 4)),
+    low_water=int(os.getenv("MEAL_POOL_LOW_WATER", 2)),
+    interval=float(os.getenv("MEAL_POOL_INTERVAL", 30))
+)
+registry.register("meal_pool", meal_plan_pool.stats)
@@ -0,0 +1,292 @@
+import os
+import re
+import json
+import math
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Iterator, Optional
+
+import openai
+
+from ai.client import client_manager, OpenAIClientManager
+
+
+class LLMProviderError(RuntimeError):
+    pass
+
+
+class LLMTimeoutError(LLMProviderError):
+    pass
+
+
+class LLMResult:
+    """
+    Completion text plus the token usage reported by the backend
+    """
+
+    __slots__ = ("content", "prompt_tokens", "completion_tokens", "model")
+
+    def __init__(self, content, prompt_tokens=0, completion_tokens=0, model=None):
+        self.content = content
+        self.prompt_tokens = prompt_tokens or 0
+        self.completion_tokens = completion_tokens or 0
+        self.model = model
+
+
+class LLMProvider:
+    """
+    Chat completion backend used by AIService
+    """
+
+    name = "base"
+
+    def complete(self, model: str, messages: List[Dict], temperature: float,
+                 timeout: Optional[float] = None) -> LLMResult:
+        raise NotImplementedError
+
+    def stream(self, model: str, messages: List[Dict], temperature: float,
+               timeout: Optional[float] = None) -> Iterator[str]:
+        raise NotImplementedError
+
+
+# ----------------------------------
+# OpenAI
+# ----------------------------------
+class OpenAIProvider(LLMProvider):
+    """
+    Calls go through the process-wide pooled client; nothing is
+    connected until the first request.
+    """
+
+    name = "openai"
+
+    def __init__(self, manager: Optional[OpenAIClientManager] = None):
+        if not (manager and manager.api_key) and not os.getenv("OPENAI_API_KEY"):
+            raise RuntimeError("OPENAI_API_KEY not set")
+
+        self.manager = manager or client_manager
+
+    def complete(self, model, messages, temperature, timeout=None):
+        with self.manager.in_flight(), self._errors():
+            response = self._client(timeout).chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature
+            )
+
+        usage = response.usage
+        return LLMResult(
+            content=response.choices[0].message.content,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            model=response.model
+        )
+
+    def stream(self, model, messages, temperature, timeout=None):
+        with self.manager.in_flight(), self._errors():
+            stream = self._client(timeout).chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                stream=True
+            )
+            # Closing returns the connection to the pool if the caller stops early
+            with stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+
+    def _client(self, timeout):
+        """
+        The pooled client; with a per-call timeout (set by LLMGuard, cut
+        to the deadline) SDK retries are off, since the guard retries
+        within the deadline itself
+        """
+        client = self.manager.get()
+        if timeout is None:
+            return client
+        return client.with_options(max_retries=0, timeout=timeout)
+
+    @staticmethod
+    @contextmanager
+    def _errors():
+        """
+        Map SDK transport errors onto provider errors the guard understands
+        """
+        try:
+            yield
+        except openai.APITimeoutError as e:
+            raise LLMTimeoutError(str(e)) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise LLMProviderError(str(e)) from e
+
+
+# ----------------------------------
+# Offline fake (load testing / CI)
+# ----------------------------------
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline backend that returns schema-valid meal plans
+    and recipes.
+
+    Latency is log-normal around `latency_ms` (median) with shape
+    `latency_sigma`; `failure_rate` of calls raise LLMProviderError after
+    waiting. Token counts are fixed when configured, otherwise estimated
+    at ~4 characters per token. A `seed` makes runs reproducible.
+    """
+
+    name = "fake"
+
+    DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    BREAKFASTS = ["Oats", "Poha", "Idli Sambar", "Upma", "Paratha", "Dosa", "Smoothie Bowl"]
+    LUNCHES = ["Dal Rice", "Rajma Chawal", "Veg Pulao", "Chole Kulche", "Curd Rice", "Khichdi", "Paneer Wrap"]
+    DINNERS = ["Roti Sabzi", "Palak Paneer", "Veg Biryani", "Mixed Veg Curry", "Dal Tadka", "Egg Curry", "Vegetable Soup"]
+
+    def __init__(
+        self,
+        latency_ms: float = 800,
+        latency_sigma: float = 0.5,
+        failure_rate: float = 0.0,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        stream_chunk: int = 24,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.stream_chunk = max(1, stream_chunk)
+        self._random = random.Random(seed)
+
+    def complete(self, model, messages, temperature, timeout=None):
+        content = self._respond(messages)
+        self._sleep(self._latency(), timeout)
+        self._maybe_fail()
+
+        return LLMResult(
+            content=content,
+            prompt_tokens=self._prompt_tokens(messages),
+            completion_tokens=self._completion_tokens(content),
+            model=f"fake-{model}"
+        )
+
+    def stream(self, model, messages, temperature, timeout=None):
+        content = self._respond(messages)
+        chunks = [
+            content[i:i + self.stream_chunk]
+            for i in range(0, len(content), self.stream_chunk)
+        ]
+        delay = self._latency() / max(1, len(chunks))
+
+        for i, chunk in enumerate(chunks):
+            # Like a read timeout: applies to each chunk
+            self._sleep(delay, timeout)
+            if i == 0:
+                self._maybe_fail()
+            yield chunk
+
+    # ----------------------------------
+    # Internal helpers
+    # ----------------------------------
+    def _latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        mu = math.log(self.latency_ms / 1000.0)
+        return self._random.lognormvariate(mu, self.latency_sigma)
+
+    @staticmethod
+    def _sleep(seconds: float, timeout: Optional[float]) -> None:
+        if timeout is not None and seconds > timeout:
+            time.sleep(max(0.0, timeout))
+            raise LLMTimeoutError("Fake provider timed out")
+        time.sleep(seconds)
+
+    def _maybe_fail(self) -> None:
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise LLMProviderError("Fake provider injected failure")
+
+    def _prompt_tokens(self, messages) -> int:
+        if self.prompt_tokens is not None:
+            return self.prompt_tokens
+        return sum(len(m.get("content", "")) for m in messages) // 4
+
+    def _completion_tokens(self, content: str) -> int:
+        if self.completion_tokens is not None:
+            return self.completion_tokens
+        return len(content) // 4
+
+    def _respond(self, messages) -> str:
+        prompt = messages[-1].get("content", "")
+        match = re.search(r'for (?:the dish )?"([^"]*)"', prompt)
+        subject = match.group(1) if match else "any"
+
+        if "meal plan" in prompt:
+            return json.dumps(self._meal_plan(subject))
+        return json.dumps(self._recipe(subject))
+
+    def _meal_plan(self, cuisine: str) -> List[Dict]:
+        rng = self._random
+        return [
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "day": day,
+                "breakfast": rng.choice(self.BREAKFASTS),
+                "lunch": rng.choice(self.LUNCHES),
+                "dinner": rng.choice(self.DINNERS)
+            }
+            for day in self.DAYS
+        ]
+
+    def _recipe(self, meal_name: str) -> Dict:
+        rng = self._random
+
+        def new_id():
+            return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+        ingredients = ["1 cup rice", "2 tbsp oil", "1 tsp salt", "200 g vegetables"]
+        return {
+            "title": meal_name,
+            "ingredients": ingredients,
+            "steps": [
+                "Prepare the ingredients.",
+                f"Cook the {meal_name.lower()} base.",
+                "Season, simmer and serve hot."
+            ],
+            "calories": rng.randint(250, 750),
+            "cookingTimeMinutes": rng.choice([15, 20, 30, 45]),
+            "dietType": "Vegetarian",
+            "id": new_id(),
+            "groceries": [
+                {"name": item.split(" ", 2)[-1], "quantity": " ".join(item.split(" ")[:2]), "id": new_id()}
+                for item in ingredients
+            ]
+        }
+
+
+def get_provider() -> LLMProvider:
+    """
+    Build the backend selected by AI_PROVIDER (openai | fake)
+    """
+    name = os.getenv("AI_PROVIDER", "openai").lower()
+
+    if name == "fake":
+        tokens_in = os.getenv("FAKE_LLM_PROMPT_TOKENS")
+        tokens_out = os.getenv("FAKE_LLM_COMPLETION_TOKENS")
+        seed = os.getenv("FAKE_LLM_SEED")
+        return FakeProvider(
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", 800)),
+            latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", 0.5)),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", 0)),
+            prompt_tokens=int(tokens_in) if tokens_in else None,
+            completion_tokens=int(tokens_out) if tokens_out else None,
+            seed=int(seed) if seed else None
+        )
+
+    if name == "openai":
+        return OpenAIProvider()
+
+    raise RuntimeError(f"Unknown AI_PROVIDER: {name}")
@@ -0,0 +1,435 @@
+import os
+import random
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+from ai.providers import LLMProviderError, LLMTimeoutError
+from utils.metrics import registry
+
+
+class LLMUnavailableError(LLMProviderError):
+    """
+    The call was refused or abandoned before the backend answered
+    """
+    status = 503
+
+
+class CircuitOpenError(LLMUnavailableError):
+    status = 503
+
+
+class DeadlineExceeded(LLMUnavailableError):
+    status = 504
+
+
+# ----------------------------------
+# Deadlines
+# ----------------------------------
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class Deadline:
+    """
+    Absolute (monotonic) deadline for all LLM calls in the current context.
+    Copied contexts (streams, batch workers, hedges) share it.
+    """
+
+    HEADER = "X-Request-Budget-Ms"
+    DEFAULT_MS = int(os.getenv("AI_DEADLINE_DEFAULT_MS", 60000))
+    MAX_MS = int(os.getenv("AI_DEADLINE_MAX_MS", 100000))
+
+    @classmethod
+    def budget_ms(cls, header: Optional[str], body_value=None) -> int:
+        """
+        Client budget from the header or body, clamped to MAX_MS
+        """
+        for value in (header, body_value):
+            try:
+                if value is not None and int(value) > 0:
+                    return min(int(value), cls.MAX_MS)
+            except (TypeError, ValueError):
+                continue
+        return cls.DEFAULT_MS
+
+    @staticmethod
+    def bind(budget_ms: float):
+        """
+        Start a deadline `budget_ms` from now; an earlier outer one wins
+        """
+        at = time.monotonic() + budget_ms / 1000.0
+        current = _deadline.get()
+        return _deadline.set(min(at, current) if current else at)
+
+    @staticmethod
+    def unbind(token) -> None:
+        _deadline.reset(token)
+
+    @staticmethod
+    def remaining() -> Optional[float]:
+        """
+        Seconds left, or None when no deadline is set
+        """
+        at = _deadline.get()
+        return None if at is None else at - time.monotonic()
+
+    @staticmethod
+    def check() -> None:
+        remaining = Deadline.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded before the AI responded")
+
+
+# ----------------------------------
+# Circuit breaker
+# ----------------------------------
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive backend failures.
+
+    closed -> open on the threshold; open -> half_open after
+    `reset_timeout` seconds, letting `half_open_max` probes through;
+    a successful probe closes it, a failed one re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30,
+                 half_open_max: int = 1):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max = max(1, half_open_max)
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._counts = {"rejected": 0, "opened": 0, "failures": 0, "successes": 0}
+
+    def allow(self) -> None:
+        """
+        Raise CircuitOpenError unless a call may go through now
+        """
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._counts["rejected"] += 1
+                    raise CircuitOpenError("AI backend is unavailable, try again shortly")
+                self.state = "half_open"
+                self._probes = 0
+
+            if self.state == "half_open":
+                if self._probes >= self.half_open_max:
+                    self._counts["rejected"] += 1
+                    raise CircuitOpenError("AI backend is recovering, try again shortly")
+                self._probes += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._counts["successes"] += 1
+            self._failures = 0
+            self.state = "closed"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._counts["failures"] += 1
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self._counts["opened"] += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """
+        A call finished without telling us anything about the backend
+        """
+        with self._lock:
+            if self.state == "half_open" and self._probes:
+                self._probes -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                **self._counts
+            }
+
+
+# ----------------------------------
+# Hedged requests
+# ----------------------------------
+class Hedger:
+    """
+    Fires a second attempt once the first has run longer than the recent
+    p95 latency for its kind, and returns whichever finishes first.
+
+    `attempt` is a single provider call (the guard retries around it),
+    so the delay, learnt from single calls, matches what is hedged.
+    Hedges are capped at `max_ratio` of calls so a slow backend isn't hit
+    with double load. The loser is cancelled if it hasn't started;
+    otherwise it runs to completion (HTTP calls can't be interrupted)
+    and its result is dropped.
+    """
+
+    def __init__(self, enabled: bool = False, quantile: float = 0.95,
+                 min_samples: int = 20, max_ratio: float = 0.1,
+                 workers: int = 8, window: int = 256):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.workers = workers
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="llm-hedge"
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def observe(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(kind)
+            if samples is None:
+                samples = self._samples[kind] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def delay(self, kind: str) -> Optional[float]:
+        with self._lock:
+            samples = self._samples.get(kind)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+    def _count(self, kind: str, name: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(
+                kind, {"calls": 0, "hedged": 0, "hedge_wins": 0, "skipped": 0}
+            )
+            counts[name] += 1
+
+    def _may_hedge(self, kind: str) -> bool:
+        with self._lock:
+            counts = self._counts.get(kind)
+            return not counts or counts["hedged"] < self.max_ratio * counts["calls"]
+
+    def run(self, kind: str, attempt: Callable[[], object]):
+        """
+        Run `attempt`, hedging it when enabled and warmed up
+        """
+        delay = self.delay(kind) if self.enabled else None
+        if delay is None:
+            return attempt()
+
+        self._count(kind, "calls")
+        pool = self._pool()
+        primary = pool.submit(contextvars.copy_context().run, attempt)
+
+        remaining = Deadline.remaining()
+        done, _ = wait([primary], timeout=delay if remaining is None else min(delay, remaining))
+        if done:
+            return primary.result()
+
+        if not self._may_hedge(kind):
+            self._count(kind, "skipped")
+            return primary.result()
+
+        self._count(kind, "hedged")
+        hedge = pool.submit(contextvars.copy_context().run, attempt)
+
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count(kind, "hedge_wins")
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict:
+        with self._lock:
+            kinds = {
+                kind: {
+                    **counts,
+                    "win_rate": round(counts["hedge_wins"] / counts["hedged"], 4)
+                    if counts["hedged"] else None
+                }
+                for kind, counts in self._counts.items()
+            }
+        for kind in kinds:
+            kinds[kind]["delay_seconds"] = self.delay(kind)
+        return {"enabled": self.enabled, "kinds": kinds}
+
+
+# ----------------------------------
+# Guard
+# ----------------------------------
+class LLMGuard:
+    """
+    Deadline, circuit breaker and hedging around each LLM call.
+
+    Timeouts and backend errors count against the breaker, except a
+    timeout caused by a client budget shorter than `min_timeout`, which
+    says nothing about backend health.
+
+    Retries happen here, not in the SDK (providers call with retries
+    off), so every attempt and backoff is charged against the deadline:
+    a failed call is retried up to `retries` times only while at least
+    `min_timeout` of the budget would be left for the next attempt.
+    Hedging applies to each attempt, never across a backoff, and every
+    hedge counts against the hedger's `max_ratio`.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, hedger: Hedger,
+                 request_timeout: float = 30, min_timeout: float = 5,
+                 retries: int = 2, backoff: float = 0.5):
+        self.breaker = breaker
+        self.hedger = hedger
+        self.request_timeout = request_timeout
+        self.min_timeout = min_timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.retried = 0
+        self._lock = threading.Lock()
+
+    def timeout(self) -> float:
+        """
+        Per-attempt timeout: the request timeout, cut to the deadline
+        """
+        Deadline.check()
+        remaining = Deadline.remaining()
+        return self.request_timeout if remaining is None else min(self.request_timeout, remaining)
+
+    def call(self, kind: str, fn: Callable[[float], object]):
+        """
+        Run fn(timeout) under the guard, each attempt hedged when enabled
+        """
+        Deadline.check()
+        attempt = 0
+        while True:
+            try:
+                return self.hedger.run(kind, lambda: self._attempt(kind, fn))
+            except BaseException as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def _attempt(self, kind: str, fn: Callable[[float], object]):
+        """
+        One provider call (the primary or a hedge)
+        """
+        timeout = self.timeout()
+        self.breaker.allow()
+        started = time.monotonic()
+        try:
+            result = fn(timeout)
+        except BaseException as e:
+            self._failed(e, timeout)
+            raise
+
+        self.breaker.record_success()
+        self.hedger.observe(kind, time.monotonic() - started)
+        return result
+
+    def _retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        Backoff before retrying `error`, or None to give up
+        """
+        if attempt >= self.retries:
+            return None
+        if not isinstance(error, LLMProviderError) or isinstance(error, LLMUnavailableError):
+            return None
+
+        delay = min(self.backoff * 2 ** attempt, 8.0) * random.uniform(0.5, 1.0)
+        remaining = Deadline.remaining()
+        if remaining is not None and remaining - delay < self.min_timeout:
+            return None
+        with self._lock:
+            self.retried += 1
+        return delay
+
+    def stream(self, fn: Callable[[float], object]):
+        """
+        Guard a streaming call; no hedging, the deadline is checked per chunk
+        """
+        timeout = self.timeout()
+        self.breaker.allow()
+        try:
+            for chunk in fn(timeout):
+                yield chunk
+                Deadline.check()
+        except BaseException as e:
+            self._failed(e, timeout)
+            raise
+        self.breaker.record_success()
+
+    def _failed(self, error: BaseException, timeout: float) -> None:
+        if isinstance(error, LLMTimeoutError):
+            if timeout >= self.min_timeout:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            remaining = Deadline.remaining()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded("Request deadline exceeded before the AI responded") from error
+        elif isinstance(error, LLMProviderError) and not isinstance(error, LLMUnavailableError):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    def stats(self) -> Dict:
+        return {
+            "breaker": self.breaker.stats(),
+            "hedging": self.hedger.stats(),
+            "retries": self.retried
+        }
+
+    def prometheus(self) -> List[str]:
+        breaker = self.breaker.stats()
+        state = {"closed": 0, "half_open": 1, "open": 2}[breaker["state"]]
+        lines = [f"llm_breaker_state {state}"]
+        for name in ("rejected", "opened", "failures", "successes"):
+            lines.append(f"llm_breaker_{name}_total {breaker[name]}")
+        lines.append(f"llm_retries_total {self.retried}")
+        for kind, counts in self.hedger.stats()["kinds"].items():
+            for name in ("calls", "hedged", "hedge_wins", "skipped"):
+                lines.append(f'llm_hedge_{name}_total{{kind="{kind}"}} {counts[name]}')
+        return lines
+
+
+llm_guard = LLMGuard(
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("AI_BREAKER_FAILURES", 5)),
+        reset_timeout=float(os.getenv("AI_BREAKER_RESET_SECONDS", 30))
+    ),
+    hedger=Hedger(
+        enabled=os.getenv("AI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes"),
+        quantile=float(os.getenv("AI_HEDGE_QUANTILE", 0.95)),
+        min_samples=int(os.getenv("AI_HEDGE_MIN_SAMPLES", 20)),
+        max_ratio=float(os.getenv("AI_HEDGE_MAX_RATIO", 0.1))
+    ),
+    request_timeout=float(os.getenv("AI_REQUEST_TIMEOUT", 30)),
+    retries=int(os.getenv("AI_MAX_RETRIES", 2))
+)
+registry.register("llm_resilience", llm_guard.stats, llm_guard.prometheus)
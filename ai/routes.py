@@ -1,19 +1,24 @@
-import os
-import json
-import re
 import uuid
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from credits.service import CreditService
-from openai import OpenAI
 
-from database import db
-from meals.models import Meal
-from recipes.models import Recipe
+from meals.service import MealService
+from recipes.service import RecipeService
+from ai.service import AIService
+from ai.pool import meal_plan_pool
+from ai.extract import extract_json, extraction_stats, ExtractionError
+from ai.telemetry import llm_endpoint
+from ai.resilience import LLMUnavailableError
+from ai.jobs import JobService, JobQueueFull
+from ai.streaming import meal_plan_events, recipe_events, settle_credits
+from utils.response import stream_response, wants_stream
+from utils.ratelimit import rate_limit, GENERATE_RATE, GENERATE_BURST
 
 ai_bp = Blueprint("ai", __name__)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+ai_service = AIService()
+credit_service = CreditService()
 
 
 # ------------------------------------
@@ -25,8 +30,8 @@ def normalize_meals(payload: dict) -> dict:
     Handles:
     - list
     - stringified JSON
-    - markdown wrapped JSON
-    - escaped newlines
+    - markdown wrapped JSON / preamble
+    - escaped newlines, trailing commas, truncated tails
     """
 
     meals = payload.get("meals")
@@ -39,24 +44,11 @@ def normalize_meals(payload: dict) -> dict:
     if not isinstance(meals, str):
         raise ValueError(f"Invalid meals type: {type(meals)}")
 
-    meals = meals.strip()
-    if not meals:
-        raise ValueError("Meals string is empty")
-
-    # Remove ```json or ``` wrappers
-    meals = re.sub(r"^```json|```$", "", meals, flags=re.IGNORECASE).strip()
-
-    # Remove escaped newlines
-    meals = meals.replace("\\n", "").strip()
-
     try:
-        parsed_meals = json.loads(meals)
-    except json.JSONDecodeError as e:
+        parsed_meals = extract_json(meals, expect=list, kind="meal_plan")
+    except ExtractionError as e:
         raise ValueError(f"Invalid meals JSON: {e}")
 
-    if not isinstance(parsed_meals, list):
-        raise ValueError("Meals JSON is not a list")
-
     payload["meals"] = parsed_meals
     return payload
 
@@ -66,69 +58,76 @@ def normalize_meals(payload: dict) -> dict:
 # ------------------------------------
 @ai_bp.route("/generate-meal", methods=["POST"])
 @jwt_required(optional=True)
+@rate_limit("generate_meal", GENERATE_RATE, GENERATE_BURST)
+@llm_endpoint("ai.generate_meal")
 def generate_meal():
     data = request.get_json() or {}
     identity = get_jwt_identity()
     
     user_id = identity if identity is not None else data.get("user_id", str(uuid.uuid4()))
-    success = CreditService.consume(user_id, amount=1)
+    # Held now, charged only once the plan is saved
+    reservation = credit_service.reserve(user_id, amount=1)
 
-    if not success:
+    if reservation is None:
         return jsonify({
             "error": "Credits exhausted. Please request more credits."
         }), 403
     cuisine = data.get("cuisine", "any")
 
-    prompt = f"""
-Generate a 7-day meal plan for "{cuisine}"
-
-Return ONLY a valid JSON array.
-No markdown.
-No explanation.
-
-Each item must follow this format:
-[
-  {{
-    "id": "uuid",
-    "day": "Mon",
-    "breakfast": "Oats",
-    "lunch": "Dal Rice",
-    "dinner": "Roti Sabzi"
-  }}
-]
+    # Dish catalogue first (free tiers), then the warm pool, then the
+    # shared meal plan cache / LLM
+    try:
+        composed = MealService.compose_plan(user_id, cuisine, data.get("mode"))
+    except Exception:
+        credit_service.release(reservation)
+        raise
 
-Rules:
-- id must be a unique UUID every time
-"""
+    if wants_stream(data):
+        return stream_response(settle_credits(
+            meal_plan_events(ai_service, user_id, cuisine, plan=composed),
+            credit_service, reservation
+        ))
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful meal planning assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
+        with credit_service.hold(reservation):
+            clean_meals = composed
+            if clean_meals is None:
+                clean_meals = meal_plan_pool.pop(cuisine)
+            if clean_meals is None:
+                clean_meals = ai_service.generate_meal_plan(cuisine)
+
+            # Store in DB
+            MealService.save_meal(
+                user_id=user_id,
+                meals=clean_meals,
+                cuisine=cuisine,
+                saved=False,
+                generated=True
+            )
 
-        content = response.choices[0].message.content
+        return jsonify(clean_meals)
 
-        raw_response = {
-            "user_id": user_id,
-            "meals": content
-        }
+    except LLMUnavailableError as e:
+        return jsonify({"error": str(e)}), e.status
 
-        clean_meals = normalize_meals(raw_response)["meals"]
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # Store in DB
-        meal = Meal(user_id=user_id, content=clean_meals)
-        db.session.add(meal)
-        db.session.commit()
 
-        return jsonify(clean_meals)
+# ------------------------------------
+# GET /ai/pool/stats
+# ------------------------------------
+@ai_bp.route("/pool/stats", methods=["GET"])
+def pool_stats():
+    return jsonify(meal_plan_pool.stats())
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+
+# ------------------------------------
+# GET /ai/extraction/stats
+# ------------------------------------
+@ai_bp.route("/extraction/stats", methods=["GET"])
+def extraction_stats_view():
+    return jsonify(extraction_stats.stats())
 
 
 # ------------------------------------
@@ -136,75 +135,110 @@ Rules:
 # ------------------------------------
 @ai_bp.route("/generate-recipe", methods=["POST"])
 @jwt_required(optional=True)
+@rate_limit("generate_recipe", GENERATE_RATE, GENERATE_BURST)
+@llm_endpoint("ai.generate_recipe")
 def generate_recipe():
     data = request.get_json(silent=True) or {}
 
     user_id = get_jwt_identity() or data.get("user_id", "anonymous")
     meal_name = data.get("meal_name")
-    success = CreditService.consume(user_id, amount=1)
+    if not meal_name:
+        return jsonify({"error": "meal_name is required"}), 400
 
-    if not success:
+    reservation = credit_service.reserve(user_id, amount=1)
+    if reservation is None:
         return jsonify({
             "error": "Credits exhausted. Please request more credits."
         }), 403
-    if not meal_name:
+
+    if wants_stream(data):
+        return stream_response(settle_credits(
+            recipe_events(ai_service, user_id, meal_name), credit_service, reservation
+        ))
+
+    try:
+        with credit_service.hold(reservation):
+            # Concurrent requests for the same dish share one generation
+            recipe_json = ai_service.generate_recipe(meal_name)
+
+            # Store in DB
+            RecipeService.save_recipe(
+                user_id=user_id,
+                title=meal_name,
+                content=recipe_json,
+                saved=False
+            )
+
+        return jsonify(recipe_json)
+
+    except LLMUnavailableError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ------------------------------------
+# POST /ai/jobs
+# ------------------------------------
+@ai_bp.route("/jobs", methods=["POST"])
+@jwt_required()
+@rate_limit("ai_jobs", GENERATE_RATE, GENERATE_BURST)
+@llm_endpoint("ai.jobs")
+def create_job():
+    data = request.get_json(silent=True) or {}
+    # Jobs are read back by their owner only (guests use their guest token)
+    user_id = get_jwt_identity()
+    kind = data.get("type")
+
+    if kind not in JobService.KINDS:
+        return jsonify({"error": "type must be 'meal' or 'recipe'"}), 400
+
+    if kind == "recipe" and not data.get("meal_name"):
         return jsonify({"error": "meal_name is required"}), 400
 
-    prompt = f"""
-Generate a detailed recipe for the dish "{meal_name}".
-
-Respond ONLY with valid JSON.
-No markdown.
-No explanation.
-No extra text.
-
-JSON structure MUST be:
-
-{{
-  "title": "{meal_name}",
-  "ingredients": ["string"],
-  "steps": ["string"],
-  "calories": number or null,
-  "cookingTimeMinutes": number or null,
-  "dietType": "Vegetarian | Vegan | Eggetarian | Non-Vegetarian | null",
-  "id": "uuid",
-  "groceries": [
-    {{ "name": "", "quantity": "", "id": "uuid" }}
-  ]
-}}
-
-Rules:
-- ingredients and steps must be arrays
-- calories & cookingTimeMinutes must be integers or null
-- id must be unique UUIDs
-"""
+    payload = (
+        {"cuisine": data.get("cuisine", "any")}
+        if kind == "meal"
+        else {"meal_name": data.get("meal_name")}
+    )
+
+    # Settled by the job once it finishes; held at most until the job
+    # would be considered stale
+    reservation = credit_service.reserve(user_id, amount=1, ttl=JobService.TIMEOUT + 60)
+    if reservation is None:
+        return jsonify({
+            "error": "Credits exhausted. Please request more credits."
+        }), 403
+    payload["reservation_id"] = str(reservation.id)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a professional recipe generator."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6
+        job = JobService.enqueue(
+            current_app._get_current_object(), user_id, kind, payload
         )
+    except JobQueueFull as e:
+        credit_service.release(reservation)
+        return jsonify({"error": str(e)}), 503
+    except Exception:
+        credit_service.release(reservation)
+        raise
 
-        content = response.choices[0].message.content.strip()
-        recipe_json = json.loads(content)
+    return jsonify({
+        "job_id": str(job.id),
+        "status": job.status,
+        "poll_url": f"/ai/jobs/{job.id}"
+    }), 202
 
-        # Store in DB
-        recipe = Recipe(
-            user_id=user_id,
-            title=meal_name,
-            content=recipe_json
-        )
-        db.session.add(recipe)
-        db.session.commit()
 
-        return jsonify(recipe_json)
+# ------------------------------------
+# GET /ai/jobs/<id>
+# ------------------------------------
+@ai_bp.route("/jobs/<uuid:job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    job = JobService.get(job_id, get_jwt_identity())
 
-    except json.JSONDecodeError:
-        return jsonify({"error": "Invalid JSON returned by AI"}), 500
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return jsonify(JobService.to_dict(job))
@@ -1,49 +1,152 @@
 import os
-import json
-import re
-from typing import List, Dict
-from openai import OpenAI
+import copy
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Iterator, Optional, Tuple
 
+from ai.telemetry import telemetry
+from utils.metrics import registry
+from ai.extract import (
+    extract_json,
+    extraction_stats,
+    normalize_day,
+    day_key,
+    normalize_recipe,
+    ExtractionError,
+    MEAL_DAY_SCHEMA,
+    RECIPE_SCHEMA,
+    JSONStreamParser
+)
+from ai.providers import LLMProvider, get_provider
+from ai.resilience import llm_guard
+from ai.singleflight import SingleFlight
 
-class AIService:
-    """
-    Centralized AI service for meal & recipe generation
+
+AI_MODEL = "gpt-4o-mini"
+MEAL_PROMPT_VERSION = "v1"
+WEEK_DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+class MealPlanCache:
     """
+    Exact-match cache for generated meal plans.
 
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY not set")
+    Keyed on (normalized cuisine, model, prompt version). Each key keeps
+    up to `variety` plans with their own TTL; once a key holds `variety`
+    live plans, one of them is served at random. Keys are evicted in
+    LRU order once `max_entries` is reached.
+    """
 
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, ttl: int = 21600, max_entries: int = 256, variety: int = 5):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.variety = max(1, variety)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
-    # ----------------------------------
-    # Internal helpers
-    # ----------------------------------
     @staticmethod
-    def _strip_markdown(text: str) -> str:
+    def normalize_cuisine(cuisine: Optional[str]) -> str:
+        return " ".join((cuisine or "any").lower().split()) or "any"
+
+    def key(self, cuisine: Optional[str], model: str = AI_MODEL,
+            prompt_version: str = MEAL_PROMPT_VERSION) -> tuple:
+        return (self.normalize_cuisine(cuisine), model, prompt_version)
+
+    def get(self, key: tuple) -> Optional[List[Dict]]:
         """
-        Remove ```json or ``` wrappers and escaped newlines
+        Return a copy of a cached plan, or None when the key is missing,
+        expired, or does not hold enough plans yet to offer variety.
         """
-        text = text.strip()
-        text = re.sub(r"^```json|```$", "", text, flags=re.IGNORECASE).strip()
-        return text.replace("\\n", "").strip()
+        now = time.monotonic()
+        with self._lock:
+            plans = self._entries.get(key)
+            if plans is not None:
+                plans[:] = [p for p in plans if p[0] > now]
+                if not plans:
+                    del self._entries[key]
+                    plans = None
+
+            if not plans or len(plans) < self.variety:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            plan = random.choice(plans)[1]
+
+        return self._fresh_copy(plan)
+
+    def put(self, key: tuple, plan: List[Dict]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            plans = self._entries.setdefault(key, [])
+            plans.append((expires_at, copy.deepcopy(plan)))
+            del plans[:-self.variety]
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "keys": len(self._entries),
+                "plans": sum(len(p) for p in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses
+            }
 
     @staticmethod
-    def _safe_json_load(text: str):
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON returned by AI: {e}")
+    def _fresh_copy(plan: List[Dict]) -> List[Dict]:
+        """
+        Deep copy a cached plan and give every day a new id, so users
+        served from the cache never share ids.
+        """
+        fresh = copy.deepcopy(plan)
+        for day in fresh:
+            if isinstance(day, dict):
+                day["id"] = str(uuid.uuid4())
+        return fresh
+
+
+# Shared by every AIService instance in this process
+meal_plan_cache = MealPlanCache(
+    ttl=int(os.getenv("MEAL_CACHE_TTL", 21600)),
+    max_entries=int(os.getenv("MEAL_CACHE_MAX_ENTRIES", 256)),
+    variety=int(os.getenv("MEAL_CACHE_VARIETY", 5))
+)
+registry.register("meal_cache", meal_plan_cache.stats)
+
+# Concurrent generations of the same dish share one LLM call; across
+# workers the result is also reused for RECIPE_SINGLEFLIGHT_TTL seconds
+recipe_flight = SingleFlight(
+    lock_dir=os.getenv("RECIPE_SINGLEFLIGHT_DIR") or None,
+    result_ttl=float(os.getenv("RECIPE_SINGLEFLIGHT_TTL", 30))
+)
+
+
+class AIService:
+    """
+    Centralized AI service for meal & recipe generation
+    """
+
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        self.provider = provider or get_provider()
 
     # ----------------------------------
-    # Meal Generation
+    # Prompts
     # ----------------------------------
-    def generate_meal_plan(
-        self,
-        cuisine: str = "any"
-    ) -> List[Dict]:
-
+    @staticmethod
+    def _meal_plan_messages(cuisine: str) -> List[Dict]:
         prompt = f"""
 Generate a 7-day meal plan for "{cuisine}"
 
@@ -64,32 +167,13 @@ Each item must match:
 Rules:
 - id must be unique UUID each time
 """
-        
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful meal planning assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
-
-        raw = response.choices[0].message.content
-        clean = self._strip_markdown(raw)
-        parsed = self._safe_json_load(clean)
-
-        if not isinstance(parsed, list):
-            raise ValueError("Meal plan is not a list")
-
-        return parsed
-
-    # ----------------------------------
-    # Recipe Generation
-    # ----------------------------------
-    def generate_recipe(self, meal_name: str) -> Dict:
-        if not meal_name:
-            raise ValueError("meal_name is required")
+        return [
+            {"role": "system", "content": "You are a helpful meal planning assistant."},
+            {"role": "user", "content": prompt}
+        ]
 
+    @staticmethod
+    def _recipe_messages(meal_name: str) -> List[Dict]:
         prompt = f"""
 Generate a detailed recipe for "{meal_name}".
 
@@ -115,21 +199,266 @@ Rules:
 - calories & cookingTimeMinutes must be numbers or null
 - id must be UUIDs
 """
+        return [
+            {"role": "system", "content": "You are a professional recipe generator."},
+            {"role": "user", "content": prompt}
+        ]
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a professional recipe generator."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6
+    @staticmethod
+    def _meal_days_messages(cuisine: str, days: List[str]) -> List[Dict]:
+        prompt = f"""
+Generate meal plan entries for "{cuisine}" for these days only: {", ".join(days)}
+
+Return ONLY a valid JSON array with one item per day.
+No markdown. No explanation.
+
+Each item must match:
+{{ "id": "uuid", "day": "Mon", "breakfast": "", "lunch": "", "dinner": "" }}
+"""
+        return [
+            {"role": "system", "content": "You are a helpful meal planning assistant."},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _recipe_fields_messages(meal_name: str, fields: List[str]) -> List[Dict]:
+        prompt = f"""
+For the recipe for "{meal_name}", return ONLY a JSON object with these keys: {", ".join(fields)}
+
+Key formats:
+- ingredients, steps: arrays of strings
+- calories, cookingTimeMinutes: integers or null
+- groceries: [{{ "name": "", "quantity": "" }}]
+No markdown. No explanation.
+"""
+        return [
+            {"role": "system", "content": "You are a professional recipe generator."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _complete(self, messages: List[Dict], temperature: float, kind: str = "completion") -> str:
+        """
+        One guarded completion: deadline, circuit breaker and (when
+        enabled) a hedged second attempt
+        """
+        return llm_guard.call(
+            kind, lambda timeout: self._attempt(messages, temperature, timeout)
+        ).content
+
+    def _attempt(self, messages: List[Dict], temperature: float, timeout: float):
+        started_at = time.time()
+        started = time.monotonic()
+        try:
+            result = self.provider.complete(AI_MODEL, messages, temperature, timeout=timeout)
+        except Exception:
+            telemetry.record_call(AI_MODEL, started_at, None, 0, 0, 0, error=True)
+            raise
+
+        telemetry.record_call(
+            AI_MODEL,
+            started=started_at,
+            ttft=None,
+            total=time.monotonic() - started,
+            prompt_tokens=result.prompt_tokens,
+            completion_tokens=result.completion_tokens
+        )
+        return result
+
+    def _stream_text(self, messages: List[Dict], temperature: float) -> Iterator[str]:
+        """
+        Yield completion text deltas as they arrive. Token counts are
+        estimated (~4 characters per token) since streams carry no usage.
+        """
+        started_at = time.time()
+        started = time.monotonic()
+        ttft = None
+        chars = 0
+        try:
+            texts = llm_guard.stream(
+                lambda timeout: self.provider.stream(AI_MODEL, messages, temperature, timeout=timeout)
+            )
+            for text in texts:
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                chars += len(text)
+                yield text
+        except Exception:
+            telemetry.record_call(AI_MODEL, started_at, None, 0, 0, 0, error=True)
+            raise
+
+        total = time.monotonic() - started
+        telemetry.record_call(
+            AI_MODEL,
+            started=started_at,
+            ttft=ttft,
+            total=total,
+            prompt_tokens=sum(len(m["content"]) for m in messages) // 4,
+            completion_tokens=chars // 4
+        )
+
+    @staticmethod
+    def _parse(raw: str, expect: type, kind: str):
+        started = time.monotonic()
+        try:
+            return extract_json(raw, expect=expect, kind=kind)
+        finally:
+            telemetry.record_parse(time.monotonic() - started)
+
+    # ----------------------------------
+    # Meal Generation
+    # ----------------------------------
+    def generate_meal_plan(
+        self,
+        cuisine: str = "any",
+        use_cache: bool = True
+    ) -> List[Dict]:
+        """
+        Return a 7-day plan, served from the meal plan cache when possible
+        """
+        if not use_cache:
+            return self._generate_meal_plan(cuisine)
+
+        key = meal_plan_cache.key(cuisine)
+        cached = meal_plan_cache.get(key)
+        if cached is not None:
+            return cached
+
+        plan = self._generate_meal_plan(cuisine)
+        meal_plan_cache.put(key, plan)
+        return plan
+
+    def _generate_meal_plan(self, cuisine: str) -> List[Dict]:
+        raw = self._complete(self._meal_plan_messages(cuisine), 0.7, "meal_plan")
+        parsed = self._parse(raw, list, "meal_plan")
+
+        days = [normalize_day(d) for d in parsed]
+        days = [d for d in days if not MEAL_DAY_SCHEMA.errors(d)]
+        return self._complete_plan(cuisine, days)
+
+    def _complete_plan(self, cuisine: str, days: List[Dict]) -> List[Dict]:
+        """
+        `days` (already valid) plus the missing ones, in week order;
+        raises if the LLM can't supply them
+        """
+        if len(days) >= len(WEEK_DAYS):
+            return days
+
+        # Only re-ask the LLM for the days that are missing or invalid
+        covered = {day_key(d) for d in days}
+        missing = [d for d in WEEK_DAYS if d not in covered][:len(WEEK_DAYS) - len(days)]
+
+        try:
+            raw = self._complete(self._meal_days_messages(cuisine, missing), 0.7, "meal_plan_fragment")
+            extra = self._parse(raw, list, "meal_plan_fragment")
+        except ExtractionError:
+            extraction_stats.record("meal_plan", "retry_failed")
+            raise
+
+        for day in extra:
+            day = normalize_day(day)
+            name = day_key(day)
+            if name in missing and not MEAL_DAY_SCHEMA.errors(day):
+                missing.remove(name)
+                days.append(day)
+
+        if missing:
+            extraction_stats.record("meal_plan", "retry_failed")
+            raise ValueError(f"Meal plan is missing days: {', '.join(missing)}")
+
+        extraction_stats.record("meal_plan", "retried")
+        return self.order_days(days)
+
+    @staticmethod
+    def order_days(days: List[Dict]) -> List[Dict]:
+        order = {d: i for i, d in enumerate(WEEK_DAYS)}
+        return sorted(days, key=lambda d: order.get(day_key(d), len(order)))
+
+    def stream_meal_plan(self, cuisine: str = "any") -> Iterator[Dict]:
+        """
+        Yield each valid day of a 7-day plan as soon as it is complete.
+        Once the array closes, missing or invalid days are re-asked like
+        in generate_meal_plan and yielded too; the plan is cached only
+        when complete. Raises if it can't be completed.
+        A cached plan is replayed at once.
+        """
+        key = meal_plan_cache.key(cuisine)
+        cached = meal_plan_cache.get(key)
+        if cached is not None:
+            yield from cached
+            return
+
+        parser = JSONStreamParser("meal_plan_stream")
+        plan = []
+        for text in self._stream_text(self._meal_plan_messages(cuisine), 0.7):
+            for day in parser.feed(text):
+                day = normalize_day(day)
+                if MEAL_DAY_SCHEMA.errors(day):
+                    continue
+                plan.append(day)
+                yield day
+
+        if not parser.done:
+            raise ValueError("Meal plan stream ended before the JSON array closed")
+
+        sent = {id(day) for day in plan}
+        plan = self._complete_plan(cuisine, list(plan))
+        for day in plan:
+            if id(day) not in sent:
+                yield day
+        meal_plan_cache.put(key, plan)
+
+    # ----------------------------------
+    # Recipe Generation
+    # ----------------------------------
+    def generate_recipe(self, meal_name: str) -> Dict:
+        """
+        Generate a recipe, coalescing concurrent requests for the same dish
+        """
+        if not meal_name:
+            raise ValueError("meal_name is required")
+
+        key = " ".join(meal_name.lower().split())
+        return recipe_flight.do(key, lambda: self._generate_recipe(meal_name))
+
+    def _generate_recipe(self, meal_name: str) -> Dict:
+        raw = self._complete(self._recipe_messages(meal_name), 0.6, "recipe")
+        recipe = normalize_recipe(
+            self._parse(raw, dict, "recipe"), meal_name
         )
 
-        raw = response.choices[0].message.content
-        clean = self._strip_markdown(raw)
-        parsed = self._safe_json_load(clean)
+        bad = RECIPE_SCHEMA.errors(recipe)
+        if not bad:
+            return recipe
+
+        # Only re-ask the LLM for the fields that are missing or invalid
+        try:
+            raw = self._complete(self._recipe_fields_messages(meal_name, bad), 0.6, "recipe_fragment")
+            fragment = self._parse(raw, dict, "recipe_fragment")
+        except ExtractionError:
+            extraction_stats.record("recipe", "retry_failed")
+            raise
+
+        recipe.update({k: fragment[k] for k in bad if k in fragment})
+        recipe = normalize_recipe(recipe, meal_name)
+
+        bad = RECIPE_SCHEMA.errors(recipe)
+        if bad:
+            extraction_stats.record("recipe", "retry_failed")
+            raise ValueError(f"Recipe has invalid fields: {', '.join(bad)}")
+
+        extraction_stats.record("recipe", "retried")
+        return recipe
+
+    def stream_recipe(self, meal_name: str) -> Iterator[Tuple[str, object]]:
+        """
+        Yield (section, value) pairs of a recipe as each one completes
+        """
+        if not meal_name:
+            raise ValueError("meal_name is required")
 
-        if not isinstance(parsed, dict):
-            raise ValueError("Recipe response is not an object")
+        parser = JSONStreamParser("recipe_stream")
+        for text in self._stream_text(self._recipe_messages(meal_name), 0.6):
+            yield from parser.feed(text)
 
-        return parsed
+        if not parser.done:
+            raise ValueError("Recipe stream ended before the JSON object closed")
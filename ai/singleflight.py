@@ -0,0 +1,197 @@
+import os
+import copy
+import json
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key.
+
+    Within a process, the first caller for a key runs `fn` and later
+    callers wait for its result. When `lock_dir` is set, the leader also
+    takes a file lock and publishes its result there, so the other
+    gunicorn workers on the node wait on it instead of calling `fn`.
+    Every caller receives its own deep copy of the result.
+
+    The published result doubles as a short node-wide cache: for
+    `result_ttl` seconds after it is written, any caller for the same
+    key gets it without calling `fn`, even one that arrives after the
+    flight has ended. Keep `result_ttl` short; set it to 0 where a
+    result must not be reused. Files unused for `result_ttl` are
+    removed by the writers, at most once per `sweep_interval`.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, result_ttl: float = 30.0,
+                 sweep_interval: float = 60.0):
+        self.lock_dir = lock_dir if fcntl else None
+        self.result_ttl = result_ttl
+        self.sweep_interval = max(sweep_interval, result_ttl)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = self._lead(key, fn)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return copy.deepcopy(call.result)
+
+    # ----------------------------------
+    # Cross-worker coalescing
+    # ----------------------------------
+    def _lead(self, key: str, fn: Callable[[], Any]) -> Any:
+        if not self.lock_dir:
+            return fn()
+
+        base = os.path.join(
+            self.lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()
+        )
+        lock_path = base + ".lock"
+
+        while True:
+            with open(lock_path, "a") as lock_file:
+                # Blocks while another worker generates the same key
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # A sweep unlinked the file while we waited; lock the new one
+                    if os.fstat(lock_file.fileno()).st_ino != self._inode(lock_path):
+                        continue
+                    os.utime(lock_path)
+
+                    found, result = self._read_result(base + ".json")
+                    if found:
+                        return result
+
+                    result = fn()
+                    self._write_result(base + ".json", result)
+                    break
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self._maybe_sweep()
+        return result
+
+    @staticmethod
+    def _inode(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return None
+
+    def _read_result(self, path: str):
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return False, None
+            with open(path) as f:
+                return True, json.load(f)
+        except (OSError, ValueError):
+            return False, None
+
+    @staticmethod
+    def _write_result(path: str, result: Any) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            # Coalescing across workers is best effort
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # ----------------------------------
+    # Cleanup
+    # ----------------------------------
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep(now)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Remove result, lock and leftover temp files not touched for
+        `result_ttl` seconds. A lock file is only removed while it can
+        be locked, so no flight is in progress on it.
+        """
+        if not self.lock_dir:
+            return 0
+        now = now or time.time()
+        removed = 0
+        try:
+            entries = list(os.scandir(self.lock_dir))
+        except OSError:
+            return 0
+
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime <= self.result_ttl:
+                    continue
+                if entry.name.endswith(".lock"):
+                    removed += self._remove_lock(entry.path, now)
+                else:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def _remove_lock(self, path: str, now: float) -> int:
+        with open(path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0
+            try:
+                # Re-check under the lock: the same file, and still unused
+                stat = os.stat(path)
+                if (stat.st_ino != os.fstat(lock_file.fileno()).st_ino
+                        or now - stat.st_mtime <= self.result_ttl):
+                    return 0
+                os.remove(path)
+                return 1
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,119 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List
+
+
+def settle_credits(events: Iterator[Dict], credits, reservation) -> Iterator[Dict]:
+    """
+    Pass events through, then settle the credit reservation: commit on
+    "done" (only the "generated" count for batches), release if the
+    stream failed or the client went away first
+    """
+    used = None
+    try:
+        for event in events:
+            if event.get("type") == "done":
+                used = event.get("generated", reservation.amount)
+            yield event
+    finally:
+        if used:
+            credits.commit(reservation, amount=used)
+        else:
+            credits.release(reservation)
+
+
+def meal_plan_events(service, user_id, cuisine: str, plan=None) -> Iterator[Dict]:
+    """
+    Stream a meal plan day by day, then persist it as one Meal row.
+    A ready `plan` (pool / composer) is replayed instead of generated.
+    A generated plan is only saved (and charged) once the service has
+    completed it; if it can't, the stream ends with "error".
+    """
+    from meals.service import MealService
+
+    days = []
+    try:
+        for day in plan if plan is not None else service.stream_meal_plan(cuisine):
+            days.append(day)
+            yield {"type": "day", "data": day}
+
+        meal = MealService.save_meal(
+            user_id=user_id,
+            meals=service.order_days(days),
+            cuisine=cuisine,
+            saved=False,
+            generated=True
+        )
+        yield {"type": "done", "meal_id": str(meal.id), "days": len(days)}
+
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+
+
+def recipe_events(service, user_id, meal_name: str, meal_id=None) -> Iterator[Dict]:
+    """
+    Stream a recipe section by section, then persist it as one Recipe row
+    """
+    from recipes.service import RecipeService
+
+    recipe = {}
+    try:
+        for key, value in service.stream_recipe(meal_name):
+            recipe[key] = value
+            yield {"type": "section", "key": key, "data": value}
+
+        saved = RecipeService.save_recipe(
+            user_id=user_id,
+            title=recipe.get("title", meal_name),
+            content=recipe,
+            saved=False,
+            meal_id=meal_id
+        )
+        yield {"type": "done", "recipe_id": str(saved.id)}
+
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+
+
+def recipe_batch_events(service, user_id, meal_names: List[str], concurrency: int,
+                        meal_id=None) -> Iterator[Dict]:
+    """
+    Generate recipes concurrently (at most `concurrency` in flight),
+    emitting each as it finishes, then bulk-insert them in one transaction
+    (linked to `meal_id` when generated for a plan)
+    """
+    from recipes.service import RecipeService
+
+    generated = []
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(meal_names)))) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, service.generate_recipe, name): name
+            for name in meal_names
+        }
+
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                recipe = future.result()
+            except Exception as e:
+                failed += 1
+                yield {"type": "error", "meal_name": name, "error": str(e)}
+                continue
+
+            generated.append((recipe.get("title", name), recipe))
+            yield {"type": "recipe", "meal_name": name, "data": recipe}
+
+    try:
+        recipes = RecipeService.save_recipes(user_id, generated, saved=False, meal_id=meal_id)
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+        return
+
+    yield {
+        "type": "done",
+        "recipe_ids": [str(r.id) for r in recipes],
+        "generated": len(generated),
+        "failed": failed
+    }
@@ -0,0 +1,240 @@
+import os
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Optional
+
+from flask import request
+from flask_jwt_extended import get_jwt_identity
+
+from utils.metrics import (
+    Histogram,
+    registry,
+    LATENCY_BUCKETS,
+    TOKEN_BUCKETS,
+    COST_BUCKETS
+)
+
+# USD per 1M tokens (input, output)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00)
+}
+
+_BUCKETS = {
+    "queue_wait_seconds": LATENCY_BUCKETS,
+    "ttft_seconds": LATENCY_BUCKETS,
+    "latency_seconds": LATENCY_BUCKETS,
+    "parse_seconds": LATENCY_BUCKETS,
+    "prompt_tokens": TOKEN_BUCKETS,
+    "completion_tokens": TOKEN_BUCKETS,
+    "cost_usd": COST_BUCKETS
+}
+
+_tags = contextvars.ContextVar("llm_tags", default=None)
+
+
+class LLMTelemetry:
+    """
+    Per-call LLM telemetry.
+
+    Histograms are keyed by (metric, endpoint, cuisine bucket, tier);
+    totals are also kept per user in a bounded LRU so the most expensive
+    users can be listed.
+    """
+
+    DEFAULT_TAGS = {"endpoint": "internal", "cuisine": "none", "tier": "anonymous"}
+
+    def __init__(self, popular_cuisines, max_users: int = 10000):
+        self.popular_cuisines = {c.strip().lower() for c in popular_cuisines if c.strip()}
+        self.max_users = max_users
+        self._histograms = {}
+        self._counters = {}
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ----------------------------------
+    # Tagging
+    # ----------------------------------
+    def cuisine_bucket(self, cuisine: Optional[str]) -> str:
+        if cuisine is None:
+            return "none"
+        name = " ".join(str(cuisine).lower().split()) or "any"
+        return name if name in self.popular_cuisines else "other"
+
+    @staticmethod
+    def current() -> Dict:
+        return _tags.get() or LLMTelemetry.DEFAULT_TAGS
+
+    @staticmethod
+    def bind(**tags):
+        """
+        Set tags for LLM calls in the current context; returns a reset token
+        """
+        merged = {**LLMTelemetry.current(), **tags}
+        merged.setdefault("queued_at", time.time())
+        return _tags.set(merged)
+
+    @staticmethod
+    def unbind(token) -> None:
+        _tags.reset(token)
+
+    # ----------------------------------
+    # Recording
+    # ----------------------------------
+    def record_call(self, model: str, started: float, ttft: Optional[float], total: float,
+                    prompt_tokens: int, completion_tokens: int, error: bool = False) -> None:
+        """
+        `ttft` is only known for streamed calls; None leaves it unobserved
+        """
+        tags = self.current()
+        queued_at = tags.get("queued_at")
+        queue_wait = max(0.0, started - queued_at) if queued_at else 0.0
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        key = (tags["endpoint"], tags["cuisine"], tags["tier"])
+
+        with self._lock:
+            self._count(key, "errors" if error else "calls")
+            if error:
+                return
+            self._observe("queue_wait_seconds", key, queue_wait)
+            if ttft is not None:
+                self._observe("ttft_seconds", key, ttft)
+            self._observe("latency_seconds", key, total)
+            self._observe("prompt_tokens", key, prompt_tokens)
+            self._observe("completion_tokens", key, completion_tokens)
+            self._observe("cost_usd", key, cost)
+
+            user_id = tags.get("user_id")
+            if user_id:
+                self._record_user(str(user_id), prompt_tokens, completion_tokens, cost, total)
+
+    def record_parse(self, seconds: float) -> None:
+        tags = self.current()
+        key = (tags["endpoint"], tags["cuisine"], tags["tier"])
+        with self._lock:
+            self._observe("parse_seconds", key, seconds)
+
+    @staticmethod
+    def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price_in, price_out = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o-mini"])
+        return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+    def _observe(self, metric, key, value) -> None:
+        hist = self._histograms.get((metric, key))
+        if hist is None:
+            hist = self._histograms[(metric, key)] = Histogram(_BUCKETS[metric])
+        hist.observe(value)
+
+    def _count(self, key, name) -> None:
+        self._counters[(name, key)] = self._counters.get((name, key), 0) + 1
+
+    def _record_user(self, user_id, prompt_tokens, completion_tokens, cost, latency) -> None:
+        totals = self._users.get(user_id)
+        if totals is None:
+            totals = self._users[user_id] = [0, 0, 0, 0.0, 0.0]
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+
+        totals[0] += 1
+        totals[1] += prompt_tokens
+        totals[2] += completion_tokens
+        totals[3] += cost
+        totals[4] += latency
+
+    # ----------------------------------
+    # Export
+    # ----------------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            series = {}
+            for (metric, (endpoint, cuisine, tier)), hist in self._histograms.items():
+                name = f"{endpoint}|{cuisine}|{tier}"
+                series.setdefault(name, {
+                    "endpoint": endpoint, "cuisine": cuisine, "tier": tier
+                })[metric] = hist.to_dict()
+            for (counter, (endpoint, cuisine, tier)), value in self._counters.items():
+                name = f"{endpoint}|{cuisine}|{tier}"
+                series.setdefault(name, {
+                    "endpoint": endpoint, "cuisine": cuisine, "tier": tier
+                })[counter] = value
+            return {"series": list(series.values()), "users_tracked": len(self._users)}
+
+    def prometheus(self):
+        with self._lock:
+            lines = []
+            for (metric, (endpoint, cuisine, tier)), hist in self._histograms.items():
+                labels = {"endpoint": endpoint, "cuisine": cuisine, "tier": tier}
+                lines.extend(hist.prometheus(f"llm_{metric}", labels))
+            for (counter, (endpoint, cuisine, tier)), value in self._counters.items():
+                lines.append(
+                    f'llm_{counter}_total{{endpoint="{endpoint}",cuisine="{cuisine}",tier="{tier}"}} {value}'
+                )
+            return lines
+
+    def user_stats(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            totals = self._users.get(str(user_id))
+            return self._user_dict(str(user_id), totals) if totals else None
+
+    def top_users(self, by: str = "cost_usd", limit: int = 20):
+        with self._lock:
+            rows = [self._user_dict(u, t) for u, t in self._users.items()]
+        rows.sort(key=lambda r: r.get(by) or 0, reverse=True)
+        return rows[:limit]
+
+    @staticmethod
+    def _user_dict(user_id, totals) -> Dict:
+        calls, prompt_tokens, completion_tokens, cost, latency = totals
+        return {
+            "user_id": user_id,
+            "calls": calls,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": round(cost, 6),
+            "avg_latency_seconds": round(latency / calls, 3) if calls else None
+        }
+
+
+telemetry = LLMTelemetry(
+    popular_cuisines=os.getenv("MEAL_POOL_CUISINES", "any,indian,italian,chinese,mexican").split(",")
+)
+registry.register("llm", telemetry.stats, telemetry.prometheus)
+
+
+def llm_endpoint(name: str):
+    """
+    Tag LLM calls made while handling this view with the endpoint name,
+    cuisine bucket, user tier and user id, and start the request deadline
+    from the client's budget. Apply below @jwt_required.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            from subscription.service import SubscriptionService
+            from ai.resilience import Deadline
+
+            data = request.get_json(silent=True) or {}
+            identity = get_jwt_identity()
+
+            token = LLMTelemetry.bind(
+                endpoint=name,
+                cuisine=telemetry.cuisine_bucket(data.get("cuisine")),
+                tier=SubscriptionService.get_tier(identity) if identity else "anonymous",
+                user_id=identity or data.get("user_id"),
+                queued_at=time.time()
+            )
+            deadline = Deadline.bind(Deadline.budget_ms(
+                request.headers.get(Deadline.HEADER), data.get("budget_ms")
+            ))
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                Deadline.unbind(deadline)
+                LLMTelemetry.unbind(token)
+        return wrapper
+    return decorator
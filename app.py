@@ -4,7 +4,7 @@ from dotenv import load_dotenv
 import os
 
 from config import get_config
-from database import db  # SQLAlchemy instance
+from database import db, apply_schema_patches  # SQLAlchemy instance
 
 from flask_swagger_ui import get_swaggerui_blueprint
 from flask_jwt_extended import JWTManager
@@ -93,6 +93,7 @@ def create_app():
 
     with app.app_context():
         db.create_all()   # ✅ THIS creates tables
+        apply_schema_patches()
     # ----------------------------
     # Health check shortcut
     # ----------------------------
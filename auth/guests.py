@@ -0,0 +1,219 @@
+"""
+Lazy guest users.
+
+A guest is only a signed JWT (claims "guest" and "free_meal_count")
+until their first saved meal or recipe or credit spend, which inserts
+their users row. Old, inactive guest rows are removed in batches:
+
+    python -m auth.guests sweep --days 60
+    python -m auth.guests sweep --days 60 --dry-run
+"""
+import argparse
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from flask import has_request_context
+from flask_jwt_extended import get_jwt
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from auth.utils import generate_jwt
+from database import db
+from models import User
+
+GUEST_FREE_MEALS = int(os.getenv("GUEST_FREE_MEALS", 3))
+GUEST_TOKEN_DAYS = int(os.getenv("GUEST_TOKEN_DAYS", 30))
+
+# Guests that registered nothing since `cutoff`; SKIP LOCKED lets a sweep
+# run next to materializations and other sweeps
+_SWEEP_SELECT_SQL = text("""
+    SELECT u.id FROM users u
+    WHERE u.is_guest
+      AND u.created_at < :cutoff
+      AND COALESCE(u.last_login_at, u.created_at) < :cutoff
+      AND NOT EXISTS (SELECT 1 FROM subscriptions s WHERE s.user_id = u.id)
+      AND NOT EXISTS (SELECT 1 FROM meals m WHERE m.user_id = u.id AND m.created_at >= :cutoff)
+      AND NOT EXISTS (SELECT 1 FROM recipes r WHERE r.user_id = u.id AND r.created_at >= :cutoff)
+      AND NOT EXISTS (
+          SELECT 1 FROM generation_jobs j WHERE j.user_id = u.id AND j.created_at >= :cutoff
+      )
+    ORDER BY u.created_at
+    LIMIT :limit
+    FOR UPDATE OF u SKIP LOCKED
+""")
+
+# Dependent rows first (recipes before meals, users last)
+_SWEEP_TABLES = (
+    "recipes", "meal_nutrition", "meals", "generation_jobs", "credit_reservations",
+    "credit_ledger", "user_credits", "usage_daily"
+)
+
+
+class GuestService:
+    """
+    Guest identities and their materialization
+    """
+
+    # Ids known to have a committed users row (per process, bounded)
+    _known: Dict[uuid.UUID, float] = {}
+    _known_lock = threading.Lock()
+    KNOWN_TTL = 3600
+    KNOWN_MAX = 100000
+
+    @staticmethod
+    def create_token(free_meal_count: int = GUEST_FREE_MEALS):
+        """
+        (guest_id, access_token); nothing is written to the database
+        """
+        guest_id = uuid.uuid4()
+        token = generate_jwt(
+            guest_id,
+            days=GUEST_TOKEN_DAYS,
+            claims={"guest": True, "free_meal_count": free_meal_count}
+        )
+        return guest_id, token
+
+    @staticmethod
+    def claims(user_id=None) -> Optional[Dict]:
+        """
+        Claims of the current request's guest token (for `user_id`, if
+        given), or None when there is no verified guest token
+        """
+        if not has_request_context():
+            return None
+        try:
+            claims = get_jwt()
+        except RuntimeError:
+            return None
+        if not claims.get("guest"):
+            return None
+        if user_id is not None and claims.get("sub") != str(user_id):
+            return None
+        return claims
+
+    @staticmethod
+    def materialize(user_id, commit: bool = False) -> bool:
+        """
+        Insert the users row of the current guest before their first
+        persisted action; a no-op for everyone else. Concurrent calls
+        are safe (ON CONFLICT DO NOTHING). Without `commit` the insert
+        joins the caller's transaction. Returns True if a row was added.
+        """
+        claims = GuestService.claims(user_id)
+        if claims is None:
+            return False
+        try:
+            key = user_id if isinstance(user_id, uuid.UUID) else uuid.UUID(str(user_id))
+        except ValueError:
+            return False
+
+        now = time.monotonic()
+        with GuestService._known_lock:
+            if GuestService._known.get(key, 0) > now:
+                return False
+
+        stmt = pg_insert(User).values(
+            id=key,
+            is_guest=True,
+            is_pro_user=False,
+            # Guests sign in with their token only
+            password_hash="",
+            free_meal_count=int(claims.get("free_meal_count", GUEST_FREE_MEALS)),
+            last_login_at=datetime.utcnow(),
+            created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=["id"])
+
+        try:
+            inserted = db.session.execute(stmt).rowcount == 1
+            if commit:
+                db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise RuntimeError(str(e))
+
+        # A conflict means the row is already committed (the insert waits
+        # for a concurrent one to finish)
+        if commit or not inserted:
+            GuestService._remember(key, now)
+        return inserted
+
+    @staticmethod
+    def _remember(key: uuid.UUID, now: float) -> None:
+        with GuestService._known_lock:
+            if len(GuestService._known) >= GuestService.KNOWN_MAX:
+                GuestService._known.clear()
+            GuestService._known[key] = now + GuestService.KNOWN_TTL
+
+    @staticmethod
+    def sweep(days: int = 60, limit: int = 5000, dry_run: bool = False) -> Dict:
+        """
+        Delete guest users (and their rows) inactive for `days`, `limit`
+        per transaction. Guests with a subscription are kept. Keep
+        `days` above GUEST_TOKEN_DAYS so no live token loses its row.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        started = time.monotonic()
+        deleted = 0
+
+        while True:
+            try:
+                ids = db.session.execute(
+                    _SWEEP_SELECT_SQL, {"cutoff": cutoff, "limit": limit}
+                ).scalars().all()
+                if not ids or dry_run:
+                    db.session.rollback()
+                    deleted += len(ids)
+                    break
+
+                params = {"ids": [str(i) for i in ids]}
+                for table in _SWEEP_TABLES:
+                    db.session.execute(text(
+                        f"DELETE FROM {table} WHERE user_id = ANY(CAST(:ids AS uuid[]))"
+                    ), params)
+                deleted += db.session.execute(
+                    text("DELETE FROM users WHERE id = ANY(CAST(:ids AS uuid[]))"), params
+                ).rowcount
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            with GuestService._known_lock:
+                for key in ids:
+                    GuestService._known.pop(key, None)
+            if len(ids) < limit:
+                break
+
+        return {
+            "deleted": deleted,
+            "dry_run": dry_run,
+            "cutoff": cutoff.isoformat(),
+            "seconds": round(time.monotonic() - started, 3)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sweep = commands.add_parser("sweep", help="delete old, inactive guest users")
+    sweep.add_argument("--days", type=int, default=60, help="inactive for this many days")
+    sweep.add_argument("--batch", type=int, default=5000, help="users per transaction")
+    sweep.add_argument("--dry-run", action="store_true", help="only count (first batch)")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        result = GuestService.sweep(days=args.days, limit=args.batch, dry_run=args.dry_run)
+        for key, value in result.items():
+            print(f"{key + ':':<10}{value}")
+
+
+if __name__ == "__main__":
+    main()
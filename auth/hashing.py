@@ -0,0 +1,209 @@
+import os
+import logging
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from utils.metrics import Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+
+class HashQueueFull(Exception):
+    """
+    Too many hashes pending; the caller should answer 503
+    """
+
+
+# Run in the pool's processes; they also return when they started, so
+# the parent can tell time spent queued from time spent hashing
+def _hash(password: str, method: str, salt_length: int) -> Tuple[str, float]:
+    started = time.time()
+    return generate_password_hash(password, method=method, salt_length=salt_length), started
+
+
+def _check(password_hash: str, password: str) -> Tuple[bool, float]:
+    started = time.time()
+    return check_password_hash(password_hash, password), started
+
+
+class PasswordHasher:
+    """
+    Password hashing off the request thread.
+
+    Key derivation (scrypt / PBKDF2) holds the GIL for 100+ ms, stalling
+    every other thread of the worker. Here it runs in a small process
+    pool (spawn context, started after gunicorn forks). At most
+    `max_pending` hashes are queued or running per worker; beyond that
+    callers get HashQueueFull at once instead of piling up behind a
+    login storm.
+
+    `method` is any Werkzeug method string ("scrypt:32768:8:1",
+    "pbkdf2:sha256:600000"); needs_rehash() tells whether a stored hash
+    was made with other parameters, so logins can upgrade it.
+    With workers=0 everything runs inline (development, scripts).
+    """
+
+    def __init__(self, method: str = "scrypt:32768:8:1", salt_length: int = 16,
+                 workers: int = 2, max_pending: int = 32, timeout: float = 10.0):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+
+        self._pool = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        self.queue_seconds = Histogram()
+        self.hash_seconds = Histogram()
+
+    # ----------------------------------
+    # Pool
+    # ----------------------------------
+    def start(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Start this worker's pool; called from gunicorn's post_fork, and
+        lazily on first use
+        """
+        pool = self._pool
+        if not self.workers or (pool is not None and self._pid == os.getpid()):
+            return pool
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                return self._pool
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            self._pid = os.getpid()
+            # Pay the interpreter start-up now rather than on the first login
+            for _ in range(self.workers):
+                self._pool.submit(time.time)
+            return self._pool
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashQueueFull("Password hashing is busy")
+
+        submitted = time.time()
+        with self._lock:
+            self.pending += 1
+
+        if not self.workers:
+            try:
+                result, started = fn(*args)
+            finally:
+                self._release()
+        else:
+            future = None
+            try:
+                future = self.start().submit(fn, *args)
+                # The slot is held until the hash really ends, not just
+                # until this caller stops waiting for it
+                future.add_done_callback(self._release)
+                result, started = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                with self._lock:
+                    self.timeouts += 1
+                raise HashQueueFull("Password hashing timed out")
+            except BrokenProcessPool:
+                if future is None:
+                    self._release()
+                # A pool process died; the next call starts a new pool
+                logger.warning("Password hashing pool broke; restarting")
+                self.close()
+                raise HashQueueFull("Password hashing restarting")
+            except Exception:
+                if future is None:
+                    self._release()
+                raise
+
+        finished = time.time()
+        with self._lock:
+            self.completed += 1
+            self.queue_seconds.observe(max(0.0, started - submitted))
+            self.hash_seconds.observe(max(0.0, finished - started))
+        return result
+
+    def _release(self, future=None) -> None:
+        self._slots.release()
+        with self._lock:
+            self.pending -= 1
+
+    # ----------------------------------
+    # Hashing
+    # ----------------------------------
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, self.method, self.salt_length)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        if not password or not password_hash:
+            return False
+        return self._run(_check, password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        method, _, rest = (password_hash or "").partition("$")
+        salt = rest.partition("$")[0]
+        return method != self.method or len(salt) != self.salt_length
+
+    def mark_rehashed(self) -> None:
+        with self._lock:
+            self.rehashed += 1
+
+    # ----------------------------------
+    # Stats
+    # ----------------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "rehashed": self.rehashed,
+                "queue_seconds": self.queue_seconds.to_dict(),
+                "hash_seconds": self.hash_seconds.to_dict()
+            }
+
+    def prometheus(self) -> List[str]:
+        with self._lock:
+            lines = self.queue_seconds.prometheus("password_hash_queue_seconds", {})
+            lines += self.hash_seconds.prometheus("password_hash_seconds", {})
+            lines.append(f"password_hash_pending {self.pending}")
+            lines.append(f"password_hash_rejected_total {self.rejected}")
+            return lines
+
+
+password_hasher = PasswordHasher(
+    method=os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1"),
+    salt_length=int(os.getenv("PASSWORD_SALT_LENGTH", 16)),
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", 2)),
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32)),
+    timeout=float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+)
+registry.register("password_hash", password_hasher.stats, password_hasher.prometheus)
@@ -0,0 +1,316 @@
+import os
+import hmac
+import hashlib
+import secrets
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+from utils.local_store import local_store
+from utils.metrics import registry
+
+
+# ----------------------------------
+# Backends
+# ----------------------------------
+class TimingWheel:
+    """
+    Expiry buckets of `resolution` seconds in a ring of `slots`.
+    add() is O(1); advance() visits only buckets whose time has come,
+    so each key is looked at about once. Keys due beyond the ring's
+    span simply come round again.
+    """
+
+    def __init__(self, slots: int = 512, resolution: float = 1.0):
+        self.slots = [set() for _ in range(slots)]
+        self.resolution = resolution
+        self._tick = int(time.time() / resolution)
+
+    def add(self, key, expires_at: float) -> None:
+        tick = max(int(expires_at / self.resolution), self._tick)
+        self.slots[tick % len(self.slots)].add(key)
+
+    def advance(self, now: float) -> Set:
+        """
+        Candidate keys from every bucket passed since the last call;
+        the caller re-checks their actual expiry
+        """
+        target = int(now / self.resolution)
+        due = set()
+        # More than one revolution behind: every bucket is due once
+        steps = min(target - self._tick, len(self.slots))
+        for tick in range(target - steps + 1, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            due |= bucket
+            bucket.clear()
+        self._tick = max(self._tick, target)
+        return due
+
+
+class MemoryOTPBackend:
+    """
+    Per-process backend (single worker / development). Codes and
+    counters expire through a timing wheel advanced on every call.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._codes: Dict[str, tuple] = {}      # phone -> (digest, expires_at)
+        self._counters: Dict[tuple, list] = {}  # (name, phone) -> [count, expires_at]
+        self._wheel = TimingWheel()
+        self._lock = threading.Lock()
+
+    def put(self, phone: str, digest: str, ttl: float) -> None:
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._sweep(time.time())
+            self._codes[phone] = (digest, expires_at)
+            self._wheel.add(("code", phone), expires_at)
+
+    def pop_if(self, phone: str, digest: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            entry = self._codes.get(phone)
+            if entry is None or entry[1] <= now or not hmac.compare_digest(entry[0], digest):
+                return False
+            del self._codes[phone]
+            return True
+
+    def incr(self, name: str, phone: str, limit: int, window: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            counter = self._counters.get((name, phone))
+            if counter is None or counter[1] <= now:
+                counter = self._counters[(name, phone)] = [0, now + window]
+                self._wheel.add((name, phone), counter[1])
+            if counter[0] >= limit:
+                return False
+            counter[0] += 1
+            return True
+
+    def reset(self, name: str, phone: str) -> None:
+        with self._lock:
+            self._counters.pop((name, phone), None)
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._sweep(time.time())
+
+    def _sweep(self, now: float) -> int:
+        removed = 0
+        for key in self._wheel.advance(now):
+            if key[0] == "code":
+                entry = self._codes.get(key[1])
+                if entry is not None and entry[1] <= now:
+                    del self._codes[key[1]]
+                    removed += 1
+                elif entry is not None:
+                    self._wheel.add(key, entry[1])
+            else:
+                counter = self._counters.get(key)
+                if counter is not None and counter[1] <= now:
+                    del self._counters[key]
+                    removed += 1
+                elif counter is not None:
+                    self._wheel.add(key, counter[1])
+        return removed
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._codes)
+
+
+class LocalOTPBackend:
+    """
+    Node-wide backend on utils.local_store: every worker on the machine
+    sees the same codes. Each operation is one indexed SQLite statement;
+    expired rows are removed in bulk by sweep().
+    """
+
+    name = "local"
+
+    def __init__(self, store=local_store):
+        self.store = store
+
+    def put(self, phone: str, digest: str, ttl: float) -> None:
+        self.store.set("otp", phone, digest, ttl=ttl)
+
+    def pop_if(self, phone: str, digest: str) -> bool:
+        return self.store.pop_if("otp", phone, digest)
+
+    def incr(self, name: str, phone: str, limit: int, window: float) -> bool:
+        applied, _ = self.store.incr(
+            name, phone, 1, limit=limit, expires_at=time.time() + window
+        )
+        return applied
+
+    def reset(self, name: str, phone: str) -> None:
+        self.store.reset(name, phone)
+
+    def sweep(self) -> int:
+        return self.store.purge()
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class RedisOTPBackend:
+    """
+    Redis (or any Redis-compatible server) for several nodes; Redis
+    expires keys itself. Needs the `redis` package.
+    """
+
+    name = "redis"
+
+    # Compare-and-delete, so a code can be used once
+    _POP_IF = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, url: str, prefix: str = "otp:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("OTP_STORE=redis needs the 'redis' package")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._pop_if = self.client.register_script(self._POP_IF)
+
+    def put(self, phone: str, digest: str, ttl: float) -> None:
+        self.client.set(f"{self.prefix}code:{phone}", digest, ex=max(1, int(ttl)))
+
+    def pop_if(self, phone: str, digest: str) -> bool:
+        return bool(self._pop_if(keys=[f"{self.prefix}code:{phone}"], args=[digest]))
+
+    def incr(self, name: str, phone: str, limit: int, window: float) -> bool:
+        key = f"{self.prefix}{name}:{phone}"
+        pipe = self.client.pipeline()
+        pipe.set(key, 0, ex=max(1, int(window)), nx=True)
+        pipe.incr(key)
+        count = pipe.execute()[1]
+        return count <= limit
+
+    def reset(self, name: str, phone: str) -> None:
+        self.client.delete(f"{self.prefix}{name}:{phone}")
+
+    def sweep(self) -> int:
+        return 0
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+# ----------------------------------
+# OTP store
+# ----------------------------------
+class OTPStore:
+    """
+    One-time codes for password reset, on a pluggable backend
+    (OTP_STORE = local | memory | redis).
+
+    Only a hash of each code is stored. Per phone, at most `max_sends`
+    codes are issued and `max_attempts` verifications accepted per
+    `window`; an attempt is counted before the code is compared, so
+    concurrent guesses can't exceed the limit. A successful
+    verification consumes the code and clears the attempt counter.
+    """
+
+    SENDS = "otp_sends"
+    ATTEMPTS = "otp_attempts"
+
+    def __init__(self, backend, ttl: float = 300, max_attempts: int = 5,
+                 max_sends: int = 5, window: float = 900, sweep_interval: float = 60):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.max_sends = max_sends
+        self.window = window
+        self.sweep_interval = sweep_interval
+
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.counts = defaultdict(int)
+
+    @staticmethod
+    def _digest(phone: str, code: str) -> str:
+        return hashlib.sha256(f"{phone}:{code}".encode("utf-8")).hexdigest()
+
+    def _count(self, event: str) -> None:
+        with self._lock:
+            self.counts[event] += 1
+
+    def issue(self, phone: str) -> Optional[str]:
+        """
+        A new code for `phone` (replacing any earlier one), or None when
+        too many were sent in the current window
+        """
+        self._maybe_sweep()
+        if not self.backend.incr(self.SENDS, phone, self.max_sends, self.window):
+            self._count("send_limited")
+            return None
+
+        code = f"{secrets.randbelow(1000000):06d}"
+        self.backend.put(phone, self._digest(phone, code), self.ttl)
+        self._count("issued")
+        return code
+
+    def verify(self, phone: str, code: str) -> str:
+        """
+        "ok", "invalid" (wrong, expired or unknown) or "locked"
+        """
+        self._maybe_sweep()
+        if not self.backend.incr(self.ATTEMPTS, phone, self.max_attempts, self.window):
+            self._count("locked")
+            return "locked"
+
+        if not self.backend.pop_if(phone, self._digest(phone, str(code))):
+            self._count("invalid")
+            return "invalid"
+
+        self.backend.reset(self.ATTEMPTS, phone)
+        self._count("verified")
+        return "ok"
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self._count("swept")
+        with self._lock:
+            self.counts["expired_removed"] += self.backend.sweep()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "ttl": self.ttl,
+                "pending": self.backend.size(),
+                **self.counts
+            }
+
+
+def _backend(kind: str):
+    if kind == "memory":
+        return MemoryOTPBackend()
+    if kind == "redis":
+        return RedisOTPBackend(os.getenv("OTP_REDIS_URL", "redis://localhost:6379/0"))
+    return LocalOTPBackend()
+
+
+otp_store = OTPStore(
+    backend=_backend(os.getenv("OTP_STORE", "local").lower()),
+    ttl=float(os.getenv("OTP_TTL", 300)),
+    max_attempts=int(os.getenv("OTP_MAX_ATTEMPTS", 5)),
+    max_sends=int(os.getenv("OTP_MAX_SENDS", 5)),
+    window=float(os.getenv("OTP_WINDOW", 900))
+)
+registry.register("otp", otp_store.stats)
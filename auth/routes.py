@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, current_app, request, jsonify
 from datetime import datetime
 from flask_jwt_extended import (
     jwt_required,
@@ -8,17 +9,32 @@ from flask_jwt_extended import (
 )
 from database import db
 from models import User
+from user.cache import user_cache
 
+from auth.guests import GUEST_FREE_MEALS, GuestService
+from auth.hashing import HashQueueFull, password_hasher
 from auth.utils import (
     hash_password,
     verify_password,
+    password_needs_rehash,
     generate_jwt,
     generate_otp,
-    verify_otp
+    check_otp
 )
 
 auth_bp = Blueprint("auth", __name__)
 
+logger = logging.getLogger(__name__)
+
+
+@auth_bp.errorhandler(HashQueueFull)
+def hashing_busy(e):
+    response = jsonify({"error": "Server busy. Please try again."})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
 # -----------------------------
 # POST /auth/signup
 # -----------------------------
@@ -75,6 +91,10 @@ def login():
 
     if not user or not verify_password(password, user.password_hash):
         return jsonify({"error": "Invalid credentials"}), 401
+    # Upgrade hashes made with older parameters while we have the password
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+        password_hasher.mark_rehashed()
     # ✅ Update last login timestamp (UTC)
     user.last_login_at = datetime.utcnow()
     db.session.commit()
@@ -110,10 +130,19 @@ def logout():
 @jwt_required()
 def session():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = user_cache.get(user_id)
 
     if not user:
-        return jsonify({"error": "Invalid session"}), 401
+        # Guests have no users row until they first save something
+        if GuestService.claims(user_id) is None:
+            return jsonify({"error": "Invalid session"}), 401
+        return jsonify({
+            "id": user_id,
+            "email": None,
+            "phone": None,
+            "name": None,
+            "is_active": True
+        })
 
     return jsonify({
         "id": user.id,
@@ -148,7 +177,9 @@ def forgot_password():
 
     if phone:
         otp = generate_otp(phone)
-        print(f"[RESET OTP] {phone}: {otp}")
+        # No SMS sender yet; only a development server logs the code
+        if otp is not None and current_app.debug:
+            logger.debug("Reset OTP for %s: %s", phone, otp)
 
     return jsonify({
         "success": True,
@@ -172,7 +203,10 @@ def reset_password():
             "error": "phone, otp and new_password required"
         }), 400
 
-    if not verify_otp(phone, otp):
+    status = check_otp(phone, str(otp))
+    if status == "locked":
+        return jsonify({"error": "Too many attempts. Request a new OTP later."}), 429
+    if status != "ok":
         return jsonify({"error": "Invalid or expired OTP"}), 400
 
     user = User.query.filter_by(phone=phone).first()
@@ -181,6 +215,7 @@ def reset_password():
 
     user.password_hash = hash_password(new_password)
     db.session.commit()
+    user_cache.invalidate(user.id)
 
     return jsonify({
         "success": True,
@@ -190,25 +225,15 @@ def reset_password():
 
 @auth_bp.route("/guest", methods=["POST"])
 def guest_login():
-    # Create guest user
-    guest_user = User(
-        is_guest=True,
-        is_pro_user=False,
-        free_meal_count=3,  # guest free limit
-        last_login_at=datetime.utcnow()
-    )
-
-    db.session.add(guest_user)
-    db.session.commit()
-
-    # Generate JWT
-    token = generate_jwt(guest_user.id)
+    # The guest lives in the signed token; the users row is created on
+    # their first save or credit spend (GuestService.materialize)
+    guest_id, token = GuestService.create_token()
 
     return jsonify({
         "access_token": token,
         "user": {
-            "id": str(guest_user.id),
+            "id": str(guest_id),
             "is_guest": True,
-            "free_meal_count": guest_user.free_meal_count
+            "free_meal_count": GUEST_FREE_MEALS
         }
     }), 201
\ No newline at end of file
@@ -1,9 +1,9 @@
-import random
-import time
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token
 from datetime import timedelta
 
+from auth.hashing import password_hasher
+from auth.otp import otp_store
+
 
 # ----------------------------
 # Password helpers
@@ -11,20 +11,28 @@ from datetime import timedelta
 def hash_password(password: str) -> str:
     if not password or len(password) < 6:
         raise ValueError("Password must be at least 6 characters")
-    return generate_password_hash(password)
+    return password_hasher.hash(password)
 
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return check_password_hash(password_hash, password)
+    return password_hasher.verify(password, password_hash)
+
+
+def password_needs_rehash(password_hash: str) -> bool:
+    """
+    True if the hash predates the current PASSWORD_HASH_METHOD
+    """
+    return password_hasher.needs_rehash(password_hash)
 
 
 # ----------------------------
 # JWT helper
 # ----------------------------
-def generate_jwt(user_id: int, days: int = 1) -> str:
+def generate_jwt(user_id: int, days: int = 1, claims: dict = None) -> str:
     return create_access_token(
         identity=str(user_id),
-        expires_delta=timedelta(days=days)
+        expires_delta=timedelta(days=days),
+        additional_claims=claims
     )
 
 
@@ -32,31 +40,19 @@ def generate_jwt(user_id: int, days: int = 1) -> str:
 # OTP helpers
 # ----------------------------
 
-# ⚠️ For production: replace with Redis
-_OTP_STORE = {}
-_OTP_TTL = 300  # 5 minutes
+def generate_otp(phone: str):
+    """
+    A new reset code for `phone`, or None when too many were sent recently
+    """
+    return otp_store.issue(phone)
 
 
-def generate_otp(phone: str) -> str:
-    otp = str(random.randint(100000, 999999))
-    _OTP_STORE[phone] = {
-        "otp": otp,
-        "expires_at": time.time() + _OTP_TTL
-    }
-    return otp
+def check_otp(phone: str, otp: str) -> str:
+    """
+    "ok", "invalid" or "locked" (too many attempts)
+    """
+    return otp_store.verify(phone, otp)
 
 
 def verify_otp(phone: str, otp: str) -> bool:
-    record = _OTP_STORE.get(phone)
-    if not record:
-        return False
-
-    if time.time() > record["expires_at"]:
-        del _OTP_STORE[phone]
-        return False
-
-    if record["otp"] != otp:
-        return False
-
-    del _OTP_STORE[phone]
-    return True
+    return check_otp(phone, otp) == "ok"
@@ -28,10 +28,87 @@ class BaseConfig:
     # OpenAI / AI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     AI_REQUEST_TIMEOUT = int(os.getenv("AI_REQUEST_TIMEOUT", 30))
+    AI_PROVIDER = os.getenv("AI_PROVIDER", "openai")  # openai / fake
+
+    # Shared OpenAI HTTP connection pool (per worker)
+    AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", 16))
+    AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", 8))
+    AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", 60))  # seconds
+    AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", 2))  # retried by the guard, within the deadline
+
+    # LLM resilience: deadlines (X-Request-Budget-Ms / budget_ms),
+    # circuit breaker and hedged requests (per worker)
+    AI_DEADLINE_DEFAULT_MS = int(os.getenv("AI_DEADLINE_DEFAULT_MS", 60000))
+    AI_DEADLINE_MAX_MS = int(os.getenv("AI_DEADLINE_MAX_MS", 100000))
+    AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", 5))
+    AI_BREAKER_RESET_SECONDS = float(os.getenv("AI_BREAKER_RESET_SECONDS", 30))
+    AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    AI_HEDGE_QUANTILE = float(os.getenv("AI_HEDGE_QUANTILE", 0.95))
+    AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", 20))
+    AI_HEDGE_MAX_RATIO = float(os.getenv("AI_HEDGE_MAX_RATIO", 0.1))
+
+    # Fake LLM backend (AI_PROVIDER=fake) for load testing
+    FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", 800))  # median
+    FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", 0.5))
+    FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", 0))
+
+    # Meal plan cache (per worker)
+    MEAL_CACHE_TTL = int(os.getenv("MEAL_CACHE_TTL", 21600))  # 6 hours
+    MEAL_CACHE_MAX_ENTRIES = int(os.getenv("MEAL_CACHE_MAX_ENTRIES", 256))
+    MEAL_CACHE_VARIETY = int(os.getenv("MEAL_CACHE_VARIETY", 5))
+
+    # Warm pool of pre-generated meal plans (per worker)
+    MEAL_POOL_CUISINES = os.getenv(
+        "MEAL_POOL_CUISINES", "any,indian,italian,chinese,mexican"
+    )
+    MEAL_POOL_SIZE = int(os.getenv("MEAL_POOL_SIZE", 4))
+    MEAL_POOL_LOW_WATER = int(os.getenv("MEAL_POOL_LOW_WATER", 2))
+    MEAL_POOL_INTERVAL = int(os.getenv("MEAL_POOL_INTERVAL", 30))  # seconds
+
+    # Offline meal plan composer (dish catalogue of past plans, per worker)
+    MEAL_COMPOSER_MODE = os.getenv("MEAL_COMPOSER_MODE", "free")  # off / free / always
+    MEAL_COMPOSER_MIN_DISHES = int(os.getenv("MEAL_COMPOSER_MIN_DISHES", 14))
+    MEAL_COMPOSER_MAX_DISHES = int(os.getenv("MEAL_COMPOSER_MAX_DISHES", 2000))
+    MEAL_COMPOSER_SCAN_LIMIT = int(os.getenv("MEAL_COMPOSER_SCAN_LIMIT", 20000))
+    MEAL_COMPOSER_REFRESH_INTERVAL = int(os.getenv("MEAL_COMPOSER_REFRESH_INTERVAL", 60))
+
+    # Recipe request coalescing; set a directory to share across workers
+    RECIPE_SINGLEFLIGHT_DIR = os.getenv("RECIPE_SINGLEFLIGHT_DIR")
+    # seconds a shared result is reused by later callers (a short cache)
+    RECIPE_SINGLEFLIGHT_TTL = int(os.getenv("RECIPE_SINGLEFLIGHT_TTL", 30))
+
+    # Batch recipe generation
+    RECIPE_BATCH_CONCURRENCY = int(os.getenv("RECIPE_BATCH_CONCURRENCY", 4))
+    RECIPE_BATCH_MAX = int(os.getenv("RECIPE_BATCH_MAX", 30))
+
+    # Aggregated grocery lists per meal plan (per worker)
+    GROCERY_CACHE_MAX_ENTRIES = int(os.getenv("GROCERY_CACHE_MAX_ENTRIES", 1024))
+
+    # Asynchronous generation jobs (per worker)
+    AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", 2))
+    AI_JOB_QUEUE_SIZE = int(os.getenv("AI_JOB_QUEUE_SIZE", 32))
+    AI_JOB_TIMEOUT = int(os.getenv("AI_JOB_TIMEOUT", 300))  # seconds
+
+    # Credits held during a generation are returned if never settled
+    CREDIT_RESERVATION_TTL = int(os.getenv("CREDIT_RESERVATION_TTL", 600))  # seconds
+
+    # Write-behind credit cache (per worker, opt-in); users may overspend
+    # by at most CREDIT_CACHE_SLACK credits across WEB_CONCURRENCY workers
+    CREDIT_CACHE = os.getenv("CREDIT_CACHE", "off")
+    CREDIT_CACHE_SLACK = int(os.getenv("CREDIT_CACHE_SLACK", 10))
+    CREDIT_CACHE_LEASE_SECONDS = float(os.getenv("CREDIT_CACHE_LEASE_SECONDS", 2))
+    CREDIT_CACHE_FLUSH_MS = int(os.getenv("CREDIT_CACHE_FLUSH_MS", 250))
+    CREDIT_CACHE_FLUSH_ENTRIES = int(os.getenv("CREDIT_CACHE_FLUSH_ENTRIES", 256))
+    LEDGER_COMPACT_INTERVAL = float(os.getenv("LEDGER_COMPACT_INTERVAL", 30))  # seconds
+    LEDGER_GRANT_QUEUE_SIZE = int(os.getenv("LEDGER_GRANT_QUEUE_SIZE", 8))
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 2))
 
     # CORS
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*")
 
+    # Admin-only endpoints (X-Admin-Key header)
+    ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
     # Subscription / Payments
     PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "apple")
     SUBSCRIPTION_SECRET = os.getenv("SUBSCRIPTION_SECRET")
@@ -39,8 +116,57 @@ class BaseConfig:
     # Notifications
     FCM_SERVER_KEY = os.getenv("FCM_SERVER_KEY")
 
-    # Usage limits
+    # Usage limits (per UTC day; 0 = unlimited)
     FREE_DAILY_LIMIT = int(os.getenv("FREE_DAILY_LIMIT", 5))
+    GUEST_DAILY_LIMIT = int(os.getenv("GUEST_DAILY_LIMIT", 3))
+    PRO_DAILY_LIMIT = int(os.getenv("PRO_DAILY_LIMIT", 0))
+    QUOTA_SYNC_INTERVAL = float(os.getenv("QUOTA_SYNC_INTERVAL", 10))  # seconds
+    QUOTA_TIER_TTL = float(os.getenv("QUOTA_TIER_TTL", 300))  # seconds
+
+    # Rate limits on LLM endpoints, per JWT identity or client IP (GCRA);
+    # RATELIMIT_SHARED keeps the state in the node-local store instead of
+    # per worker
+    RATELIMIT_ENABLED = os.getenv("RATELIMIT_ENABLED", "true")
+    RATELIMIT_SHARED = os.getenv("RATELIMIT_SHARED", "false")
+    RATELIMIT_TRUST_PROXY = os.getenv("RATELIMIT_TRUST_PROXY", "false")
+    RATELIMIT_GENERATE = os.getenv("RATELIMIT_GENERATE", "10/minute")
+    RATELIMIT_GENERATE_BURST = int(os.getenv("RATELIMIT_GENERATE_BURST", 5))
+    RATELIMIT_BATCH = os.getenv("RATELIMIT_BATCH", "2/minute")
+    RATELIMIT_BATCH_BURST = int(os.getenv("RATELIMIT_BATCH_BURST", 2))
+
+    # Node-local shared store (SQLite) and this node's name in synced rows
+    LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH")
+    NODE_ID = os.getenv("NODE_ID")
+
+    # Password reset OTPs: store is local (node-wide SQLite), memory (per
+    # worker) or redis (OTP_REDIS_URL, needs the redis package). Sends and
+    # verification attempts are capped per phone per OTP_WINDOW seconds.
+    OTP_STORE = os.getenv("OTP_STORE", "local")
+    OTP_REDIS_URL = os.getenv("OTP_REDIS_URL")
+    OTP_TTL = float(os.getenv("OTP_TTL", 300))  # seconds
+    OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+    OTP_MAX_SENDS = int(os.getenv("OTP_MAX_SENDS", 5))
+    OTP_WINDOW = float(os.getenv("OTP_WINDOW", 900))  # seconds
+
+    # Password hashing: any Werkzeug method string. Logins upgrade hashes
+    # made with other parameters. Hashing runs in PASSWORD_HASH_WORKERS
+    # processes per web worker (0 = inline); past PASSWORD_HASH_MAX_PENDING
+    # queued hashes, auth endpoints answer 503.
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_SALT_LENGTH = int(os.getenv("PASSWORD_SALT_LENGTH", 16))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))  # seconds
+
+    # Per-process cache of users for JWT lookups; other workers see
+    # profile changes within USER_CACHE_TTL
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))  # seconds
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+    # Guests exist only as signed tokens until their first save or credit
+    # spend; `python -m auth.guests sweep` removes inactive guest rows
+    GUEST_FREE_MEALS = int(os.getenv("GUEST_FREE_MEALS", 3))
+    GUEST_TOKEN_DAYS = int(os.getenv("GUEST_TOKEN_DAYS", 30))
 
 
 class DevelopmentConfig(BaseConfig):
@@ -0,0 +1,123 @@
+"""
+Stress CreditService.consume against a single user.
+
+Starts --processes processes of --threads threads each, all consuming
+--amount credits from one balance of --credits, --calls times per
+thread. Afterwards the database must agree with what callers were told:
+
+    credits_used == successes * amount <= total_credits
+
+Any difference is a lost update or an overspend; the exit status is 1.
+With CREDIT_CACHE=on, credits_used may exceed the balance by at most
+CREDIT_CACHE_SLACK (WEB_CONCURRENCY is set to --processes).
+
+    python -m credits.bench --processes 4 --threads 8 --calls 200
+    CREDIT_CACHE=on python -m credits.bench --processes 4
+"""
+import os
+import argparse
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+
+
+def _worker(user_id, threads, calls, amount, results):
+    from app import app
+    from credits.cache import credit_cache
+    from credits.service import CreditService
+
+    service = CreditService()
+    counts = []
+    lock = threading.Lock()
+
+    def run():
+        ok = 0
+        with app.app_context():
+            for _ in range(calls):
+                if service.consume(user_id, amount):
+                    ok += 1
+        with lock:
+            counts.append(ok)
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    started = time.monotonic()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    with app.app_context():
+        credit_cache.flush()
+    results.put((sum(counts), time.monotonic() - started))
+
+
+def bench(processes=4, threads=8, calls=200, amount=1, credits=None):
+    from app import app
+    from credits.cache import credit_cache
+    from credits.models import UserCredits
+    from credits.service import CreditService
+    from database import db
+
+    attempts = processes * threads * calls
+    # Default: room for about half the attempts, so both paths are exercised
+    credits = credits if credits is not None else (attempts * amount) // 2
+    user_id = str(uuid.uuid4())
+
+    with app.app_context():
+        CreditService().add_credits(user_id, credits)
+
+    # spawn: each process builds its own app and connection pool
+    os.environ["WEB_CONCURRENCY"] = str(processes)
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(user_id, threads, calls, amount, results))
+        for _ in range(processes)
+    ]
+    for p in procs:
+        p.start()
+    reports = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    successes = sum(ok for ok, _ in reports)
+    elapsed = max(seconds for _, seconds in reports)  # excludes process startup
+
+    with app.app_context():
+        record = UserCredits.query.filter_by(user_id=user_id).first()
+        used, total = record.credits_used, record.total_credits
+        db.session.delete(record)
+        db.session.commit()
+
+    expected = min(attempts, credits // amount) * amount
+    slack = 0
+    if credit_cache.enabled:
+        slack = credit_cache.worker_slack * processes
+    limit = min(attempts * amount, total + slack)
+    ok = used == successes * amount and expected <= used <= limit
+
+    print(f"attempts:      {attempts} ({processes} procs x {threads} threads x {calls})")
+    print(f"successes:     {successes}")
+    print(f"credits used:  {used} / {total} (expected {expected}, at most {limit})")
+    print(f"throughput:    {attempts / elapsed:.0f} consumes/s over {elapsed:.2f}s")
+    print("result:        " + ("OK" if ok else "LOST UPDATE / OVERSPEND"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=200,
+                        help="consume calls per thread")
+    parser.add_argument("--amount", type=int, default=1)
+    parser.add_argument("--credits", type=int, default=None,
+                        help="starting balance (default: half the attempts)")
+    args = parser.parse_args()
+
+    ok = bench(args.processes, args.threads, args.calls, args.amount, args.credits)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
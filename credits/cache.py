@@ -0,0 +1,410 @@
+import os
+import uuid
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from flask import current_app
+from sqlalchemy import Integer, column, insert, update, values
+from sqlalchemy.dialects.postgresql import UUID
+
+from credits.models import UserCredits, CreditLedgerEntry
+from database import db
+from utils.metrics import Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+
+class _Balance:
+    """
+    One user's balance as last read from Postgres, plus what this worker
+    has granted on top of it
+    """
+
+    __slots__ = ("total", "used", "reserved", "pending", "held", "granted", "leased_at")
+
+    def __init__(self, total: int, used: int, reserved: int):
+        self.total = total
+        self.used = used          # credits_used at the last read / flush
+        self.reserved = reserved  # credits_reserved (database reservations)
+        self.pending = 0          # consumed here, still in the ledger
+        self.held = 0             # local reservations not yet settled
+        self.granted = 0          # granted here since the last read
+        self.leased_at = time.monotonic()
+
+    def available(self) -> int:
+        return self.total - self.used - self.reserved - self.pending - self.held
+
+
+class CreditCache:
+    """
+    Write-behind credit balances, per worker (opt-in: CREDIT_CACHE=on).
+
+    A balance is read from Postgres once per lease (`lease_seconds`).
+    Within a lease, consumption is granted from memory and appended to
+    a ledger; the ledger is flushed every `flush_interval` seconds or
+    `flush_entries` entries as one multi-row UPDATE, whose RETURNING
+    rows reconcile the cached balances, plus one multi-row insert of
+    the matching credit_ledger entries.
+
+    Overspend bound: a worker grants at most `worker_slack` credits per
+    user between two reads of that user's balance; beyond that it
+    flushes, and the caller falls back to the exact database path.
+    Other workers can therefore be at most `worker_slack` each ahead of
+    what a worker sees, so credits_used never exceeds total_credits by
+    more than `slack` (split evenly across `workers`).
+
+    Unflushed entries are lost if a worker is killed; that can only
+    under-charge, never overspend.
+    """
+
+    def __init__(self, enabled: bool = False, slack: int = 10, workers: int = 2,
+                 lease_seconds: float = 2.0, flush_interval: float = 0.25,
+                 flush_entries: int = 256, max_entries: int = 100000):
+        self.workers = max(1, workers)
+        self.worker_slack = max(0, slack) // self.workers
+        self.enabled = enabled and self.worker_slack > 0
+        self.lease_seconds = lease_seconds
+        self.flush_interval = flush_interval
+        self.flush_entries = max(1, flush_entries)
+        self.max_entries = max_entries
+
+        self._balances: Dict[uuid.UUID, _Balance] = {}
+        self._holds: Dict[uuid.UUID, tuple] = {}  # reservation id -> (user, amount, expires)
+        self._ledger = []                         # (user_id, amount, created_at)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._app = None
+
+        self.local_grants = 0
+        self.fallbacks = 0
+        self.leases = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.flushed_entries = 0
+        self.flush_rows_last = None
+        self.flush_seconds = Histogram()
+
+    # ----------------------------------
+    # Grants
+    # ----------------------------------
+    def consume(self, user_id: uuid.UUID, amount: int) -> Optional[bool]:
+        """
+        True if granted from memory; None means the caller must use the
+        database (balance unknown, lease slack used up, or not enough
+        credits in the cached view); the ledger has been flushed by then
+        """
+        return self._grant(user_id, amount, hold=False)
+
+    def reserve(self, user_id: uuid.UUID, amount: int, ttl: float) -> Optional[uuid.UUID]:
+        """
+        Hold credits in memory; returns a reservation id, or None to fall
+        back to a database reservation
+        """
+        if not self._grant(user_id, amount, hold=True):
+            return None
+        reservation_id = uuid.uuid4()
+        with self._lock:
+            self._holds[reservation_id] = (user_id, amount, time.monotonic() + ttl)
+        return reservation_id
+
+    def settle(self, reservation_id, used: int) -> Optional[int]:
+        """
+        Commit `used` credits of a local reservation and return the rest.
+        None if the reservation isn't held by this cache (a database
+        reservation, or it already expired).
+        """
+        with self._lock:
+            hold = self._holds.pop(reservation_id, None)
+            if hold is None:
+                return None
+            user_id, amount, _ = hold
+            used = max(0, min(used, amount))
+            balance = self._balances.get(user_id)
+            if balance is not None:
+                balance.held -= amount
+                balance.granted -= amount - used
+                balance.pending += used
+            if used:
+                self._ledger.append((user_id, used, datetime.utcnow()))
+        self._kick()
+        return used
+
+    def _grant(self, user_id, amount, hold):
+        if not self.enabled or amount <= 0:
+            return None
+        self.start()
+
+        for fresh in (False, True):
+            balance = self._balance(user_id, fresh=fresh)
+            if balance is None:
+                break
+            with self._lock:
+                within_slack = balance.granted + amount <= self.worker_slack
+                granted = within_slack and amount <= balance.available()
+                if granted:
+                    balance.granted += amount
+                    if hold:
+                        balance.held += amount
+                    else:
+                        balance.pending += amount
+                        self._ledger.append((user_id, amount, datetime.utcnow()))
+                    self.local_grants += 1
+                    full = len(self._ledger) >= self.flush_entries
+            if granted:
+                if full:
+                    self._kick()
+                return True
+            # A fresh read resets the lease slack; nothing else helps
+            if within_slack or amount > self.worker_slack:
+                break
+
+        with self._lock:
+            self.fallbacks += 1
+        self.flush()
+        self.invalidate(user_id)
+        return None
+
+    # ----------------------------------
+    # Balances
+    # ----------------------------------
+    def status(self, user_id: uuid.UUID) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        balance = self._balance(user_id)
+        if balance is None:
+            return None
+        with self._lock:
+            return {
+                "total_credits": balance.total,
+                "credits_used": balance.used + balance.pending,
+                "credits_reserved": balance.reserved + balance.held,
+                "credits_remaining": balance.available()
+            }
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            balance = self._balances.get(user_id)
+            if balance is not None:
+                balance.leased_at = None
+
+    def _expired(self, balance: _Balance) -> bool:
+        return (
+            balance.leased_at is None
+            or time.monotonic() - balance.leased_at >= self.lease_seconds
+        )
+
+    def _balance(self, user_id, fresh: bool = False) -> Optional[_Balance]:
+        """
+        Cached balance, re-read (after flushing the ledger, so the read
+        includes this worker's consumption) when its lease ran out
+        """
+        with self._lock:
+            balance = self._balances.get(user_id)
+            if balance is not None and not fresh and not self._expired(balance):
+                return balance
+
+        with self._flush_lock:
+            self._flush_locked()
+            row = db.session.query(
+                UserCredits.total_credits,
+                UserCredits.credits_used,
+                UserCredits.credits_reserved
+            ).filter(UserCredits.user_id == user_id).first()
+            db.session.commit()
+
+            with self._lock:
+                self.leases += 1
+                if row is None:
+                    self._balances.pop(user_id, None)
+                    return None
+                balance = self._balances.get(user_id)
+                if balance is None:
+                    if len(self._balances) >= self.max_entries:
+                        self._evict()
+                    balance = self._balances[user_id] = _Balance(*row)
+                else:
+                    balance.total, balance.used, balance.reserved = row
+                    balance.leased_at = time.monotonic()
+                # Unsettled local holds are still unseen by other workers
+                balance.granted = balance.held + balance.pending
+                return balance
+
+    def _evict(self) -> None:
+        """
+        Drop idle balances (nothing pending or held); called with _lock held
+        """
+        for user_id in [u for u, b in self._balances.items() if not (b.pending or b.held)]:
+            del self._balances[user_id]
+
+    # ----------------------------------
+    # Ledger flush
+    # ----------------------------------
+    def flush(self) -> int:
+        """
+        Write the ledger to Postgres now; returns entries written.
+        Needs an app context.
+        """
+        with self._flush_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        with self._lock:
+            batch, self._ledger = self._ledger, []
+        if not batch:
+            return 0
+
+        amounts = {}
+        for user_id, amount, _ in batch:
+            amounts[user_id] = amounts.get(user_id, 0) + amount
+
+        deltas = values(
+            column("user_id", UUID(as_uuid=True)),
+            column("amount", Integer),
+            name="deltas"
+        ).data(list(amounts.items()))
+
+        started = time.monotonic()
+        try:
+            rows = db.session.execute(
+                update(UserCredits)
+                .where(UserCredits.user_id == deltas.c.user_id)
+                .values(credits_used=UserCredits.credits_used + deltas.c.amount)
+                .returning(
+                    UserCredits.user_id,
+                    UserCredits.total_credits,
+                    UserCredits.credits_used,
+                    UserCredits.credits_reserved
+                )
+            ).all()
+            # Same transaction: one consume entry per ledger entry, for
+            # the users that still exist
+            known = {row[0] for row in rows}
+            entries = [
+                {"user_id": user_id, "kind": "consume", "amount": amount,
+                 "applied": True, "created_at": created_at}
+                for user_id, amount, created_at in batch if user_id in known
+            ]
+            if entries:
+                db.session.execute(insert(CreditLedgerEntry).values(entries))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._ledger = batch + self._ledger
+                self.flush_errors += 1
+            raise
+
+        with self._lock:
+            for user_id, total, used, reserved in rows:
+                balance = self._balances.get(user_id)
+                if balance is None:
+                    continue
+                balance.pending -= amounts[user_id]
+                balance.total, balance.used, balance.reserved = total, used, reserved
+            self.flushes += 1
+            self.flushed_entries += len(batch)
+            self.flush_rows_last = len(rows)
+            self.flush_seconds.observe(time.monotonic() - started)
+        return len(batch)
+
+    def _expire_holds(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for reservation_id, (user_id, amount, expires) in list(self._holds.items()):
+                if expires > now:
+                    continue
+                del self._holds[reservation_id]
+                balance = self._balances.get(user_id)
+                if balance is not None:
+                    balance.held -= amount
+                    balance.granted -= amount
+
+    # ----------------------------------
+    # Background flusher
+    # ----------------------------------
+    def _kick(self) -> None:
+        self._wake.set()
+
+    def start(self) -> None:
+        """
+        Start the flusher in this process (from a request, which provides
+        the app); threads do not survive gunicorn's fork
+        """
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Inherited state belongs to the parent
+                self._balances, self._holds, self._ledger = {}, {}, []
+            self._app = current_app._get_current_object()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="credit-flusher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    self._expire_holds()
+                    self.flush()
+                    db.session.remove()
+            except Exception as e:
+                logger.warning("Credit ledger flush failed: %s", e)
+
+    def close(self) -> None:
+        """
+        Final flush on worker exit
+        """
+        if self._pid != os.getpid() or self._app is None:
+            return
+        try:
+            with self._app.app_context():
+                self.flush()
+        except Exception as e:
+            logger.warning("Credit ledger flush on exit failed: %s", e)
+
+    # ----------------------------------
+    # Stats
+    # ----------------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "worker_slack": self.worker_slack,
+                "balances": len(self._balances),
+                "holds": len(self._holds),
+                "ledger_entries": len(self._ledger),
+                "local_grants": self.local_grants,
+                "fallbacks": self.fallbacks,
+                "leases": self.leases,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "flushed_entries": self.flushed_entries,
+                "flush_rows_last": self.flush_rows_last,
+                "flush_seconds": self.flush_seconds.to_dict()
+            }
+
+
+# One cache per worker process; the slack is shared by all workers
+credit_cache = CreditCache(
+    enabled=os.getenv("CREDIT_CACHE", "off").lower() in ("1", "on", "true", "yes"),
+    slack=int(os.getenv("CREDIT_CACHE_SLACK", 10)),
+    workers=int(os.getenv("WEB_CONCURRENCY", 2)),
+    lease_seconds=float(os.getenv("CREDIT_CACHE_LEASE_SECONDS", 2)),
+    flush_interval=float(os.getenv("CREDIT_CACHE_FLUSH_MS", 250)) / 1000,
+    flush_entries=int(os.getenv("CREDIT_CACHE_FLUSH_ENTRIES", 256))
+)
+registry.register("credit_cache", credit_cache.stats)
@@ -0,0 +1,372 @@
+"""
+Credit ledger: history, compaction and bulk grants.
+
+Bulk grants append unapplied `grant` entries with one INSERT ... SELECT
+per chunk, then compaction folds unapplied entries into user_credits,
+one set-based upsert per chunk. In the app, LedgerCompactor runs admin
+grants off the request and compacts periodically.
+
+    python -m credits.ledger grant --amount 50 --all --reason "october promo"
+    python -m credits.ledger grant --amount 20 --users-file ids.txt
+    python -m credits.ledger compact
+"""
+import argparse
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+
+from credits.cache import credit_cache
+from credits.models import CreditLedgerEntry
+from database import db
+from utils.local_store import local_store
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_GRANT_USERS_SQL = text("""
+    INSERT INTO credit_ledger (user_id, kind, amount, reason, applied, created_at)
+    SELECT DISTINCT u, 'grant', :amount, :reason, false, :now
+    FROM unnest(CAST(:user_ids AS uuid[])) AS u
+""")
+
+_GRANT_ALL_SQL = text("""
+    INSERT INTO credit_ledger (user_id, kind, amount, reason, applied, created_at)
+    SELECT id, 'grant', :amount, :reason, false, :now FROM users
+""")
+
+# Fold the oldest unapplied entries into the balances. SKIP LOCKED lets
+# concurrent compactions split the work instead of waiting on each other.
+_COMPACT_SQL = text("""
+    WITH batch AS (
+        SELECT id FROM credit_ledger
+        WHERE NOT applied
+        ORDER BY id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ), applied AS (
+        UPDATE credit_ledger l
+        SET applied = true
+        FROM batch b
+        WHERE l.id = b.id
+        RETURNING l.user_id, l.kind, l.amount
+    ), totals AS (
+        SELECT user_id,
+               COALESCE(SUM(amount) FILTER (WHERE kind = 'grant'), 0) AS granted,
+               COALESCE(SUM(amount) FILTER (WHERE kind = 'consume'), 0) AS consumed
+        FROM applied
+        GROUP BY user_id
+    )
+    INSERT INTO user_credits (user_id, total_credits, credits_used, credits_reserved)
+    SELECT user_id, granted, consumed, 0 FROM totals
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_credits = user_credits.total_credits + EXCLUDED.total_credits,
+        credits_used = user_credits.credits_used + EXCLUDED.credits_used
+    RETURNING user_id
+""")
+
+
+class CreditLedger:
+    """
+    Set-based operations on credit_ledger. Per-request balance changes
+    write their entries themselves (see CreditService).
+    """
+
+    CHUNK = 50000
+
+    @staticmethod
+    def check_grant(amount: int, user_ids: Optional[Iterable], all_users: bool) -> None:
+        if amount <= 0:
+            raise ValueError("amount must be positive")
+        if all_users == (user_ids is not None):
+            raise ValueError("Pass either user_ids or all_users")
+
+    @staticmethod
+    def bulk_grant(amount: int, user_ids: Optional[Iterable] = None,
+                   all_users: bool = False, reason: Optional[str] = None) -> Dict:
+        """
+        Grant `amount` credits to every user in `user_ids` (or every
+        registered user), then compact. Invalid ids are skipped.
+        """
+        CreditLedger.check_grant(amount, user_ids, all_users)
+
+        now = datetime.utcnow()
+        params = {"amount": amount, "reason": (reason or "bulk grant")[:120], "now": now}
+        started = time.monotonic()
+        entries = 0
+        skipped = 0
+
+        try:
+            if all_users:
+                entries = db.session.execute(_GRANT_ALL_SQL, params).rowcount
+            else:
+                ids, skipped = CreditLedger._valid_ids(user_ids)
+                for i in range(0, len(ids), CreditLedger.CHUNK):
+                    entries += db.session.execute(
+                        _GRANT_USERS_SQL,
+                        {**params, "user_ids": ids[i:i + CreditLedger.CHUNK]}
+                    ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        users = CreditLedger.compact()
+        return {
+            "entries": entries,
+            "skipped": skipped,
+            "users_updated": users,
+            "seconds": round(time.monotonic() - started, 3)
+        }
+
+    @staticmethod
+    def _valid_ids(user_ids: Iterable) -> Tuple[List[str], int]:
+        ids, skipped = [], 0
+        for value in user_ids:
+            try:
+                ids.append(str(uuid.UUID(str(value).strip())))
+            except ValueError:
+                skipped += 1
+        return ids, skipped
+
+    @staticmethod
+    def compact(limit: int = CHUNK) -> int:
+        """
+        Apply unapplied entries to user_credits, `limit` per transaction.
+        Returns the number of balance rows updated.
+        """
+        updated = 0
+        while True:
+            try:
+                users = db.session.execute(_COMPACT_SQL, {"limit": limit}).scalars().all()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            if not users:
+                break
+            updated += len(users)
+            for user_id in users:
+                credit_cache.invalidate(user_id)
+        return updated
+
+    @staticmethod
+    def history(user_id, limit: int = 50, before_id: Optional[int] = None) -> List[Dict]:
+        """
+        Newest first; page with `before_id` (the last id of the previous page)
+        """
+        query = CreditLedgerEntry.query.filter_by(user_id=user_id)
+        if before_id is not None:
+            query = query.filter(CreditLedgerEntry.id < before_id)
+        return [
+            CreditLedger.to_dict(entry)
+            for entry in query.order_by(CreditLedgerEntry.id.desc()).limit(limit)
+        ]
+
+    @staticmethod
+    def to_dict(entry) -> Dict:
+        return {
+            "id": entry.id,
+            "kind": entry.kind,
+            "amount": entry.amount,
+            "reason": entry.reason,
+            "reservation_id": str(entry.reservation_id) if entry.reservation_id else None,
+            "applied": entry.applied,
+            "created_at": entry.created_at
+        }
+
+
+class LedgerBusy(Exception):
+    """
+    Too many bulk grants queued in this worker; the caller should answer 503
+    """
+
+
+class LedgerCompactor:
+    """
+    Background ledger work, one thread per worker.
+
+    Admin bulk grants are queued here and run (grant, then compact) on
+    that thread instead of in the request. Every `interval` seconds one
+    worker per node (node-wide lease) compacts whatever is unapplied;
+    compactions on several nodes split the work through SKIP LOCKED.
+
+    Queued grants live in this worker's memory. A grant inserts its
+    entries in one transaction, so a grant lost to a restart left
+    nothing behind and can be submitted again; once inserted, its
+    entries are applied by the next compaction on any node.
+    """
+
+    def __init__(self, interval: float = 30, max_queued: int = 8, store=local_store):
+        self.interval = interval
+        self.store = store
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, max_queued))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        self.grants_queued = 0
+        self.grants_done = 0
+        self.grants_failed = 0
+        self.compactions = 0
+        self.balances_updated = 0
+        self.last_error = None
+
+    def start(self, app=None) -> None:
+        """
+        Start this worker's thread; from gunicorn's post_fork with the
+        app, or lazily from a request
+        """
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            app = app or current_app._get_current_object()
+            if self._pid != os.getpid():
+                # The parent's queue (and its lock) doesn't survive the fork
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, args=(app,), name="ledger-compactor", daemon=True
+            )
+            self._thread.start()
+
+    def submit_grant(self, amount: int, user_ids: Optional[Iterable] = None,
+                     all_users: bool = False, reason: Optional[str] = None) -> str:
+        """
+        Queue a bulk grant; returns its id (logged when it finishes).
+        Raises ValueError for a bad request and LedgerBusy when full.
+        """
+        CreditLedger.check_grant(amount, user_ids, all_users)
+        self.start()
+
+        grant_id = uuid.uuid4().hex
+        task = ("grant", grant_id, {
+            "amount": amount,
+            "user_ids": list(user_ids) if user_ids is not None else None,
+            "all_users": all_users,
+            "reason": reason
+        })
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            raise LedgerBusy("Too many bulk grants queued")
+        with self._lock:
+            self.grants_queued += 1
+        return grant_id
+
+    def request_compaction(self) -> bool:
+        """
+        Compact on this worker's thread as soon as it is free
+        (False if its queue is full; the periodic run catches up)
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(("compact", None, None))
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self, app) -> None:
+        while True:
+            try:
+                kind, grant_id, params = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                kind, grant_id, params = "tick", None, None
+
+            try:
+                if kind == "tick" and not self.store.lease("ledger-compact", self.interval * 0.9):
+                    continue
+                with app.app_context():
+                    if kind == "grant":
+                        self._grant(grant_id, params)
+                    else:
+                        self._compact()
+                    db.session.remove()
+            except Exception as e:
+                logger.warning("Ledger %s failed: %s", kind, e)
+                with self._lock:
+                    self.last_error = str(e)
+                    if kind == "grant":
+                        self.grants_failed += 1
+
+    def _grant(self, grant_id: str, params: Dict) -> None:
+        result = CreditLedger.bulk_grant(**params)
+        logger.info("Bulk grant %s finished: %s", grant_id, result)
+        with self._lock:
+            self.grants_done += 1
+            self.balances_updated += result["users_updated"]
+
+    def _compact(self) -> None:
+        updated = CreditLedger.compact()
+        with self._lock:
+            self.compactions += 1
+            self.balances_updated += updated
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "queued": self._queue.qsize(),
+                "grants_queued": self.grants_queued,
+                "grants_done": self.grants_done,
+                "grants_failed": self.grants_failed,
+                "compactions": self.compactions,
+                "balances_updated": self.balances_updated,
+                "last_error": self.last_error
+            }
+
+
+ledger_compactor = LedgerCompactor(
+    interval=float(os.getenv("LEDGER_COMPACT_INTERVAL", 30)),
+    max_queued=int(os.getenv("LEDGER_GRANT_QUEUE_SIZE", 8))
+)
+registry.register("ledger", ledger_compactor.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    grant = commands.add_parser("grant", help="grant credits to many users")
+    grant.add_argument("--amount", type=int, required=True)
+    targets = grant.add_mutually_exclusive_group(required=True)
+    targets.add_argument("--all", action="store_true", help="every registered user")
+    targets.add_argument("--users-file", help="one user id per line ('-' for stdin)")
+    grant.add_argument("--reason", default=None)
+
+    commands.add_parser("compact", help="fold unapplied entries into balances")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        if args.command == "compact":
+            print(f"balances updated: {CreditLedger.compact()}")
+            return
+
+        user_ids = None
+        if not args.all:
+            source = sys.stdin if args.users_file == "-" else open(args.users_file)
+            with source:
+                user_ids = [line for line in source if line.strip()]
+
+        result = CreditLedger.bulk_grant(
+            args.amount, user_ids=user_ids, all_users=args.all, reason=args.reason
+        )
+        for key, value in result.items():
+            print(f"{key + ':':<15}{value}")
+
+
+if __name__ == "__main__":
+    main()
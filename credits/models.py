@@ -1,4 +1,5 @@
-from database import db
+from datetime import datetime
+from database import db, register_schema_patch
 import uuid
 
 class UserCredits(db.Model):
@@ -15,3 +16,66 @@ class UserCredits(db.Model):
 
     total_credits = db.Column(db.Integer, default=200)
     credits_used = db.Column(db.Integer, default=0)
+    # Held by unsettled reservations; not spendable until released
+    credits_reserved = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+
+class CreditReservation(db.Model):
+    """
+    Credits held for one generation: committed on success, released on
+    failure, expired if never settled
+    """
+    __tablename__ = "credit_reservations"
+    __table_args__ = (
+        db.Index("ix_credit_reservations_status_expires", "status", "expires_at"),
+    )
+
+    id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(db.UUID(as_uuid=True), nullable=False, index=True)
+    amount = db.Column(db.Integer, nullable=False)
+    amount_used = db.Column(db.Integer)
+
+    # held / committed / released / expired
+    status = db.Column(db.String(20), nullable=False, default="held")
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    settled_at = db.Column(db.DateTime)
+
+
+class CreditLedgerEntry(db.Model):
+    """
+    Append-only record of every balance change.
+
+    grant adds to total_credits and consume to credits_used; refund
+    (released holds) and expire (expired holds) give reserved credits
+    back. Entries written together with their counter update are
+    `applied`; bulk grants are inserted unapplied and folded into
+    user_credits by compaction.
+    """
+    __tablename__ = "credit_ledger"
+    __table_args__ = (
+        db.Index("ix_credit_ledger_user_created", "user_id", "created_at"),
+        db.Index(
+            "ix_credit_ledger_unapplied", "id",
+            postgresql_where=db.text("NOT applied")
+        ),
+    )
+
+    KINDS = ("grant", "consume", "refund", "expire")
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    user_id = db.Column(db.UUID(as_uuid=True), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    reservation_id = db.Column(db.UUID(as_uuid=True))
+    reason = db.Column(db.String(120))
+    applied = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# db.create_all() doesn't add columns to existing tables
+register_schema_patch(
+    "ALTER TABLE user_credits ADD COLUMN IF NOT EXISTS "
+    "credits_reserved INTEGER NOT NULL DEFAULT 0"
+)
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from credits.service import CreditService
+from credits.ledger import CreditLedger, LedgerBusy, ledger_compactor
+from utils.decorators import admin_required
 
 credits_bp = Blueprint("credits", __name__, url_prefix="/credits")
 
@@ -46,7 +48,7 @@ def add_credits():
 def consume_credit():
     user_id = get_jwt_identity()
 
-    success = credit_service.consume_credit(user_id)
+    success = credit_service.consume(user_id, amount=1)
 
     if not success:
         return jsonify({
@@ -58,3 +60,73 @@ def consume_credit():
         "success": True,
         "message": "1 credit consumed"
     })
+
+
+@credits_bp.route("/reservations/expire", methods=["POST"])
+@admin_required
+def expire_reservations():
+    """
+    Return credits held by reservations that were never settled
+    (crashed workers); status reads do this per user as well
+    """
+    limit = min(request.args.get("limit", 1000, type=int) or 1000, 10000)
+    released = credit_service.expire_reservations(limit=limit)
+
+    return jsonify({
+        "success": True,
+        "credits_released": released
+    })
+
+
+@credits_bp.route("/ledger", methods=["GET"])
+@jwt_required()
+def credit_ledger():
+    user_id = get_jwt_identity()
+
+    limit = min(request.args.get("limit", 50, type=int) or 50, 500)
+    before_id = request.args.get("before_id", type=int)
+
+    return jsonify({
+        "success": True,
+        "entries": CreditLedger.history(user_id, limit=limit, before_id=before_id)
+    })
+
+
+@credits_bp.route("/grants", methods=["POST"])
+@admin_required
+def bulk_grant():
+    """
+    Queue a grant to many users: {"amount", "user_ids" | "all", "reason"}.
+    It runs in the background; balances change once it is compacted.
+    """
+    data = request.get_json() or {}
+
+    try:
+        amount = int(data.get("amount", 0))
+    except (TypeError, ValueError):
+        amount = 0
+    user_ids = data.get("user_ids")
+    all_users = bool(data.get("all"))
+
+    if amount <= 0:
+        return jsonify({"error": "Invalid credit amount"}), 400
+    if all_users == (user_ids is not None) or (user_ids is not None and not isinstance(user_ids, list)):
+        return jsonify({"error": "Provide either user_ids (list) or all=true"}), 400
+
+    try:
+        grant_id = ledger_compactor.submit_grant(
+            amount, user_ids=user_ids, all_users=all_users, reason=data.get("reason")
+        )
+    except LedgerBusy as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({"success": True, "grant_id": grant_id, "status": "queued"}), 202
+
+
+@credits_bp.route("/ledger/compact", methods=["POST"])
+@admin_required
+def compact_ledger():
+    return jsonify({
+        "success": True,
+        "queued": ledger_compactor.request_compaction()
+    }), 202
@@ -1,49 +1,390 @@
-from credits.models import UserCredits
+import os
+import uuid
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.exc import SQLAlchemyError
+
+from auth.guests import GuestService
+from credits.cache import credit_cache
+from credits.models import UserCredits, CreditReservation
 from database import db
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_CREDITS = 200
+
+# Unsettled reservations are given back after this long; longer than any
+# request deadline, so only crashed workers ever hit it
+RESERVATION_TTL = int(os.getenv("CREDIT_RESERVATION_TTL", 600))  # seconds
+
+# Every statement that changes a balance also appends its credit_ledger
+# entry (applied), in the same statement.
+
+# Provision the default balance on first read, in the same statement.
+# A concurrent first insert can hide the row from this snapshot, hence
+# the plain re-read in get_status.
+_STATUS_SQL = text("""
+    WITH inserted AS (
+        INSERT INTO user_credits (user_id, total_credits, credits_used, credits_reserved)
+        VALUES (:user_id, :total, 0, 0)
+        ON CONFLICT (user_id) DO NOTHING
+        RETURNING user_id, total_credits, credits_used, credits_reserved
+    ), logged AS (
+        INSERT INTO credit_ledger (user_id, kind, amount, reason, applied, created_at)
+        SELECT user_id, 'grant', total_credits, 'default', true, :now FROM inserted
+    )
+    SELECT total_credits, credits_used, credits_reserved FROM inserted
+    UNION ALL
+    SELECT total_credits, credits_used, credits_reserved
+    FROM user_credits WHERE user_id = :user_id
+    LIMIT 1
+""").bindparams(bindparam("user_id", type_=UUID(as_uuid=True)))
+
+_CONSUME_SQL = text("""
+    WITH spent AS (
+        UPDATE user_credits
+        SET credits_used = credits_used + :amount
+        WHERE user_id = :user_id
+          AND credits_used + credits_reserved + :amount <= total_credits
+        RETURNING user_id
+    ), logged AS (
+        INSERT INTO credit_ledger (user_id, kind, amount, applied, created_at)
+        SELECT user_id, 'consume', :amount, true, :now FROM spent
+    )
+    SELECT user_id FROM spent
+""").bindparams(bindparam("user_id", type_=UUID(as_uuid=True)))
+
+_GRANT_SQL = text("""
+    WITH granted AS (
+        INSERT INTO user_credits (user_id, total_credits, credits_used, credits_reserved)
+        VALUES (:user_id, :amount, 0, 0)
+        ON CONFLICT (user_id)
+        DO UPDATE SET total_credits = user_credits.total_credits + EXCLUDED.total_credits
+        RETURNING user_id
+    )
+    INSERT INTO credit_ledger (user_id, kind, amount, reason, applied, created_at)
+    SELECT user_id, 'grant', :amount, :reason, true, :now FROM granted
+""").bindparams(bindparam("user_id", type_=UUID(as_uuid=True)))
+
+_BALANCE_SQL = text(
+    "SELECT total_credits, credits_used, credits_reserved "
+    "FROM user_credits WHERE user_id = :user_id"
+).bindparams(bindparam("user_id", type_=UUID(as_uuid=True)))
+
+# ----------------------------------
+# Reservations
+# ----------------------------------
+# Each step is one statement (hold + record, or settle + adjust), so the
+# balance row is locked only for that statement, never across the LLM call.
+_RESERVE_SQL = text("""
+    WITH held AS (
+        UPDATE user_credits
+        SET credits_reserved = credits_reserved + :amount
+        WHERE user_id = :user_id
+          AND credits_used + credits_reserved + :amount <= total_credits
+        RETURNING user_id
+    )
+    INSERT INTO credit_reservations (id, user_id, amount, status, created_at, expires_at)
+    SELECT :id, user_id, :amount, 'held', :now, :expires_at FROM held
+    RETURNING id
+""").bindparams(
+    bindparam("id", type_=UUID(as_uuid=True)),
+    bindparam("user_id", type_=UUID(as_uuid=True))
+)
+
+# Settle a held reservation: `used` credits are spent, the rest returned
+_SETTLE_SQL = text("""
+    WITH settled AS (
+        UPDATE credit_reservations
+        SET status = :status, amount_used = LEAST(:used, amount), settled_at = :now
+        WHERE id = :id AND status = 'held'
+        RETURNING id, user_id, amount, amount_used
+    ), logged AS (
+        INSERT INTO credit_ledger (user_id, kind, amount, reservation_id, applied, created_at)
+        SELECT s.user_id, e.kind, e.amount, s.id, true, :now
+        FROM settled s
+        CROSS JOIN LATERAL (
+            VALUES ('consume', s.amount_used), ('refund', s.amount - s.amount_used)
+        ) AS e(kind, amount)
+        WHERE e.amount > 0
+    )
+    UPDATE user_credits u
+    SET credits_reserved = u.credits_reserved - s.amount,
+        credits_used = u.credits_used + s.amount_used
+    FROM settled s
+    WHERE u.user_id = s.user_id
+    RETURNING s.amount_used
+""").bindparams(bindparam("id", type_=UUID(as_uuid=True)))
+
+_EXPIRE_SQL = """
+    WITH expired AS (
+        UPDATE credit_reservations
+        SET status = 'expired', amount_used = 0, settled_at = :now
+        WHERE id IN (
+            SELECT id FROM credit_reservations
+            WHERE status = 'held' AND expires_at < :now {user_filter}
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, user_id, amount
+    ), logged AS (
+        INSERT INTO credit_ledger (user_id, kind, amount, reservation_id, applied, created_at)
+        SELECT user_id, 'expire', amount, id, true, :now FROM expired
+    ), totals AS (
+        SELECT user_id, SUM(amount) AS amount FROM expired GROUP BY user_id
+    )
+    UPDATE user_credits u
+    SET credits_reserved = u.credits_reserved - t.amount
+    FROM totals t
+    WHERE u.user_id = t.user_id
+    RETURNING t.amount
+"""
+_EXPIRE_ALL_SQL = text(_EXPIRE_SQL.format(user_filter=""))
+_EXPIRE_USER_SQL = text(_EXPIRE_SQL.format(user_filter="AND user_id = :user_id")).bindparams(
+    bindparam("user_id", type_=UUID(as_uuid=True))
+)
+
+
+class Reservation:
+    """
+    Handle for credits held by reserve(); pass it back to commit/release
+    """
+
+    __slots__ = ("id", "user_id", "amount")
+
+    def __init__(self, id, user_id, amount):
+        self.id = id
+        self.user_id = user_id
+        self.amount = amount
+
+    def __repr__(self):
+        return f"<Reservation {self.id} user={self.user_id} amount={self.amount}>"
+
+
 class CreditService:
+    """
+    Credit balances. Every operation is one atomic statement, so
+    concurrent requests can neither overspend nor lose updates.
+
+    With CREDIT_CACHE=on, consume / reserve / status are answered from
+    the worker's write-behind cache when it can (see credits.cache),
+    trading exactness for a bounded overspend of CREDIT_CACHE_SLACK.
+    """
+
+    @staticmethod
+    def _uuid(user_id):
+        try:
+            return user_id if isinstance(user_id, uuid.UUID) else uuid.UUID(str(user_id))
+        except ValueError:
+            return None
 
     def get_status(self, user_id):
-        record = UserCredits.query.filter_by(user_id=user_id).first()
+        user_id = self._uuid(user_id)
+        if user_id is None:
+            return {"total_credits": 0, "credits_used": 0,
+                    "credits_reserved": 0, "credits_remaining": 0}
 
-        if not record:
-            record = UserCredits(user_id=user_id)
-            db.session.add(record)
+        cached = credit_cache.status(user_id)
+        if cached is not None:
+            return cached
+
+        try:
+            self.expire_reservations(user_id)
+            row = db.session.execute(
+                _STATUS_SQL,
+                {"user_id": user_id, "total": DEFAULT_CREDITS, "now": datetime.utcnow()}
+            ).first()
+            if row is None:
+                row = db.session.execute(_BALANCE_SQL, {"user_id": user_id}).first()
             db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise RuntimeError(str(e))
 
+        total, used, reserved = row
         return {
-            "total_credits": record.total_credits,
-            "credits_used": record.credits_used,
-            "credits_remaining": record.total_credits - record.credits_used
+            "total_credits": total,
+            "credits_used": used,
+            "credits_reserved": reserved,
+            "credits_remaining": total - used - reserved
         }
 
     def can_consume(self, user_id, amount=1):
+        user_id = self._uuid(user_id)
+        if user_id is None:
+            return False
+
         record = UserCredits.query.filter_by(user_id=user_id).first()
         if not record:
             return False
 
-        return (record.credits_used + amount) <= record.total_credits
+        return (
+            record.credits_used + record.credits_reserved + amount
+        ) <= record.total_credits
 
     def consume(self, user_id, amount=1):
-        record = UserCredits.query.filter_by(user_id=user_id).first()
-
-        if not record:
+        """
+        Spend `amount` credits if the balance allows, in one conditional
+        UPDATE. Returns False for unknown users or insufficient credits.
+        """
+        user_id = self._uuid(user_id)
+        if user_id is None or amount <= 0:
             return False
+        # A guest's first spend creates their users row
+        GuestService.materialize(user_id, commit=True)
 
-        if (record.credits_used + amount) > record.total_credits:
-            return False
+        # Write-behind fast path (CREDIT_CACHE); None means ask Postgres
+        if credit_cache.consume(user_id, amount):
+            return True
 
-        record.credits_used += amount
-        db.session.commit()
-        return True
+        try:
+            spent = db.session.execute(_CONSUME_SQL, {
+                "user_id": user_id, "amount": amount, "now": datetime.utcnow()
+            }).scalar()
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise RuntimeError(str(e))
 
-    def add_credits(self, user_id, amount):
-        record = UserCredits.query.filter_by(user_id=user_id).first()
+        return spent is not None
 
-        if not record:
-            record = UserCredits(user_id=user_id, total_credits=amount)
-            db.session.add(record)
-        else:
-            record.total_credits += amount
+    def add_credits(self, user_id, amount, reason=None):
+        """
+        Grant credits; creates the balance (with just `amount`) if missing.
+        Many users at once: credits.ledger.CreditLedger.bulk_grant.
+        """
+        user_id = self._uuid(user_id)
+        if user_id is None:
+            raise ValueError("Invalid user id")
+
+        try:
+            db.session.execute(_GRANT_SQL, {
+                "user_id": user_id, "amount": amount,
+                "reason": reason, "now": datetime.utcnow()
+            })
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise RuntimeError(str(e))
+        credit_cache.invalidate(user_id)
+
+    # ----------------------------------
+    # Reservations
+    # ----------------------------------
+    def reserve(self, user_id, amount=1, ttl=None):
+        """
+        Hold `amount` credits before a generation. Returns a Reservation,
+        or None for unknown users or insufficient credits. Expired holds
+        of the user are given back first if they are in the way.
+        """
+        user_id = self._uuid(user_id)
+        if user_id is None or amount <= 0:
+            return None
+        GuestService.materialize(user_id, commit=True)
 
-        db.session.commit()
+        reservation_id = credit_cache.reserve(user_id, amount, ttl or RESERVATION_TTL)
+        if reservation_id is not None:
+            return Reservation(reservation_id, user_id, amount)
+
+        for attempt in range(2):
+            now = datetime.utcnow()
+            params = {
+                "id": uuid.uuid4(),
+                "user_id": user_id,
+                "amount": amount,
+                "now": now,
+                "expires_at": now + timedelta(seconds=ttl or RESERVATION_TTL)
+            }
+            try:
+                reservation_id = db.session.execute(_RESERVE_SQL, params).scalar()
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                raise RuntimeError(str(e))
+
+            if reservation_id is not None:
+                return Reservation(reservation_id, user_id, amount)
+            if attempt == 0 and not self.expire_reservations(user_id):
+                break
+
+        return None
+
+    def commit(self, reservation, amount=None):
+        """
+        Spend `amount` (default: all) of a reservation and return the rest.
+        A reservation that expired meanwhile is charged directly instead,
+        if the balance still allows. Returns the credits spent.
+        """
+        used = reservation.amount if amount is None else max(0, min(amount, reservation.amount))
+        if credit_cache.settle(reservation.id, used) is not None:
+            return used
+        if self._settle(reservation, "committed", used) is not None:
+            return used
+
+        # No row: a write-behind hold that expired in memory
+        status = db.session.query(CreditReservation.status).filter_by(id=reservation.id).scalar()
+        if status in ("expired", None) and used and self.consume(reservation.user_id, used):
+            return used
+        if status != "committed":
+            logger.warning("Reservation %s not charged (status %s)", reservation.id, status)
+        return 0
+
+    def release(self, reservation):
+        """
+        Give back a reservation after a failed generation; no-op once settled
+        """
+        if credit_cache.settle(reservation.id, 0) is not None:
+            return True
+        return self._settle(reservation, "released", 0) is not None
+
+    @contextmanager
+    def hold(self, reservation):
+        """
+        Commit the reservation if the block succeeds, release it if it raises
+        """
+        try:
+            yield reservation
+        except BaseException:
+            self.release(reservation)
+            raise
+        self.commit(reservation)
+
+    def _settle(self, reservation, status, used):
+        try:
+            spent = db.session.execute(_SETTLE_SQL, {
+                "id": reservation.id,
+                "status": status,
+                "used": used,
+                "now": datetime.utcnow()
+            }).scalar()
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise RuntimeError(str(e))
+        return spent
+
+    def expire_reservations(self, user_id=None, limit=1000):
+        """
+        Give back held credits of reservations past their expiry (all
+        users, or one). Returns the number of credits returned.
+        """
+        params = {"now": datetime.utcnow(), "limit": limit}
+        if user_id is not None:
+            user_id = self._uuid(user_id)
+            if user_id is None:
+                return 0
+            params["user_id"] = user_id
+
+        try:
+            rows = db.session.execute(
+                _EXPIRE_USER_SQL if user_id is not None else _EXPIRE_ALL_SQL, params
+            ).scalars().all()
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise RuntimeError(str(e))
+        return int(sum(rows))
@@ -3,6 +3,23 @@ from sqlalchemy import text
 
 db = SQLAlchemy()
 
+# Idempotent DDL for columns added to existing tables
+_SCHEMA_PATCHES = []
+
+
+def register_schema_patch(sql):
+    """
+    Register DDL (e.g. ADD COLUMN IF NOT EXISTS) run after db.create_all()
+    """
+    if sql not in _SCHEMA_PATCHES:
+        _SCHEMA_PATCHES.append(sql)
+
+
+def apply_schema_patches():
+    for sql in _SCHEMA_PATCHES:
+        db.session.execute(text(sql))
+    db.session.commit()
+
 
 def init_db(app):
     """
@@ -1,5 +1,8 @@
+import os
+
 bind = "0.0.0.0:5000"
-workers = 2
+# Also read by the credit cache to split its overspend slack per worker
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
 threads = 4
 timeout = 120
 
@@ -8,3 +11,35 @@ errorlog = "-"
 loglevel = "info"
 
 preload_app = True
+
+
+def post_fork(server, worker):
+    # Background threads don't survive the fork of a preloaded app
+    from ai.pool import meal_plan_pool
+    meal_plan_pool.start()
+
+    # Load the dish catalogue off the request path
+    from app import app
+    from meals.composer import meal_composer
+    meal_composer.start(app)
+
+    # Password hashing runs in its own processes, one pool per worker
+    from auth.hashing import password_hasher
+    password_hasher.start()
+
+    # Admin bulk grants and periodic ledger compaction
+    from credits.ledger import ledger_compactor
+    ledger_compactor.start(app)
+
+
+def worker_exit(server, worker):
+    # Close pooled OpenAI connections cleanly on shutdown
+    from ai.client import client_manager
+    client_manager.close()
+
+    # Write buffered credit consumption before the worker goes away
+    from credits.cache import credit_cache
+    credit_cache.close()
+
+    from auth.hashing import password_hasher
+    password_hasher.close()
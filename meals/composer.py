@@ -0,0 +1,310 @@
+import os
+import random
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app
+
+from database import db
+from meals.models import Meal
+from ai.extract import MEAL_DAY_SCHEMA
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+WEEK_DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+SLOTS = ("breakfast", "lunch", "dinner")
+
+
+class _Catalogue:
+    """
+    Distinct dish names per slot for one cuisine; list + set so both
+    sampling and membership are O(1)
+    """
+
+    __slots__ = ("dishes", "seen")
+
+    def __init__(self):
+        self.dishes = {slot: [] for slot in SLOTS}
+        self.seen = {slot: set() for slot in SLOTS}
+
+    def add(self, slot: str, name: str, cap: int) -> None:
+        key = " ".join(name.lower().split())
+        if key in self.seen[slot] or len(self.dishes[slot]) >= cap:
+            return
+        self.seen[slot].add(key)
+        self.dishes[slot].append(name.strip())
+
+    def size(self, slot: str) -> int:
+        return len(self.dishes[slot])
+
+
+class MealComposer:
+    """
+    Builds 7-day plans locally from dishes of previously generated plans.
+
+    Only plans this code generated are indexed (is_saved = false rows,
+    written by the generation paths); plans users save or edit through
+    /meals/save never are, so users can't inject dishes into other
+    users' plans.
+
+    A background thread (started after fork, or by the first request)
+    loads the index from the most recent `scan_limit` generated plans,
+    then picks up plans generated by other workers every
+    `refresh_interval` seconds by a created_at delta query; plans
+    generated by this worker are added as they are saved. Until the
+    first load finishes, compose() returns None and callers fall back
+    to the pool / LLM, so no request waits for the scan.
+
+    A cuisine is composable once every slot has at least `min_dishes`
+    distinct dishes; otherwise callers fall back to the LLM.
+    """
+
+    MODES = ("off", "free", "always")
+    OVERLAP = timedelta(seconds=10)
+
+    def __init__(self, mode: str = "free", min_dishes: int = 14,
+                 max_dishes: int = 2000, scan_limit: int = 20000,
+                 refresh_interval: float = 60):
+        self.mode = mode if mode in self.MODES else "free"
+        self.min_dishes = max(len(WEEK_DAYS), min_dishes)
+        self.max_dishes = max_dishes
+        self.scan_limit = scan_limit
+        self.refresh_interval = refresh_interval
+
+        self._index = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._thread_pid = None
+        self._loaded_at = None
+        self._high_water = None
+        self._random = random.Random()
+
+        self.composed = 0
+        self.fallbacks = 0
+        self.plans_scanned = 0
+        self.refresh_seconds_last = None
+
+    # ----------------------------------
+    # Mode selection
+    # ----------------------------------
+    def wants(self, tier: str, requested: Optional[str] = None) -> bool:
+        """
+        Whether a request should be composed: an explicit mode="compose"
+        always is, mode="ai" only opts out for pro users, otherwise
+        MEAL_COMPOSER_MODE decides (free = every tier except pro)
+        """
+        if self.mode == "off":
+            return False
+        if requested == "compose":
+            return True
+        if requested == "ai" and tier == "pro":
+            return False
+        return self.mode == "always" or tier != "pro"
+
+    # ----------------------------------
+    # Index
+    # ----------------------------------
+    @staticmethod
+    def normalize_cuisine(cuisine: Optional[str]) -> str:
+        return " ".join((cuisine or "any").lower().split()) or "any"
+
+    def add(self, cuisine: Optional[str], meals: Iterable) -> None:
+        """
+        Index the dishes of one generated plan (never user-supplied content)
+        """
+        if self._pid != os.getpid():
+            # Nothing loaded in this process yet; the first refresh covers it
+            return
+
+        key = self.normalize_cuisine(cuisine)
+        with self._lock:
+            self._add(key, meals)
+
+    def _add(self, key: str, meals) -> None:
+        catalogue = self._index.get(key)
+        if catalogue is None:
+            catalogue = self._index[key] = _Catalogue()
+
+        for day in meals or []:
+            if MEAL_DAY_SCHEMA.errors(day):
+                continue
+            for slot in SLOTS:
+                catalogue.add(slot, day[slot], self.max_dishes)
+
+    def start(self, app=None) -> None:
+        """
+        Start this worker's loader thread; from gunicorn's post_fork with
+        the app, or lazily from a request
+        """
+        if self.mode == "off":
+            return
+        if self._thread_pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            app = app or current_app._get_current_object()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, args=(app,), name="meal-composer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, app) -> None:
+        while True:
+            with app.app_context():
+                self.refresh()
+                db.session.remove()
+            time.sleep(self.refresh_interval)
+
+    @property
+    def loaded(self) -> bool:
+        return self._pid == os.getpid() and self._loaded_at is not None
+
+    def refresh(self) -> None:
+        """
+        Load the index in this process, or pull plans generated since the
+        last refresh. Runs on the loader thread; needs an app context.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        started = time.monotonic()
+        try:
+            if self._pid != os.getpid():
+                with self._lock:
+                    self._index = {}
+                    self._high_water = None
+                    self.plans_scanned = 0
+
+            query = (
+                db.session.query(Meal.cuisine, Meal.meals, Meal.created_at)
+                .filter(Meal.is_saved.is_(False))
+            )
+            if self._high_water is not None:
+                # created_at is set before commit; overlap a little so slow
+                # commits from other workers aren't skipped (adds are idempotent)
+                query = query.filter(Meal.created_at > self._high_water - self.OVERLAP)
+            rows = query.order_by(Meal.created_at.desc()).limit(self.scan_limit).all()
+            db.session.commit()
+
+            with self._lock:
+                for cuisine, meals, _ in reversed(rows):
+                    self._add(self.normalize_cuisine(cuisine), meals)
+                self.plans_scanned += len(rows)
+                if rows and rows[0].created_at:
+                    self._high_water = max(rows[0].created_at, self._high_water or rows[0].created_at)
+
+            self._pid = os.getpid()
+            self._loaded_at = time.monotonic()
+            self.refresh_seconds_last = round(time.monotonic() - started, 3)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Meal composer refresh failed: %s", e)
+        finally:
+            self._refresh_lock.release()
+
+    # ----------------------------------
+    # Composition
+    # ----------------------------------
+    def compose(self, cuisine: Optional[str], exclude: Iterable[str] = ()) -> Optional[List[Dict]]:
+        """
+        A 7-day plan with no dish repeated within the week, avoiding
+        `exclude` (e.g. the user's last plan) where the catalogue allows.
+        None when the cuisine hasn't been seen often enough, or while the
+        index is still loading.
+        """
+        self.start()
+        if not self.loaded:
+            with self._lock:
+                self.fallbacks += 1
+            return None
+
+        key = self.normalize_cuisine(cuisine)
+        avoid = {" ".join(str(name).lower().split()) for name in exclude}
+
+        with self._lock:
+            catalogue = self._index.get(key)
+            if catalogue is None or any(catalogue.size(s) < self.min_dishes for s in SLOTS):
+                self.fallbacks += 1
+                return None
+            dishes = {slot: list(catalogue.dishes[slot]) for slot in SLOTS}
+
+        used = set()
+        picks = {}
+        for slot in SLOTS:
+            picks[slot] = self._pick(dishes[slot], len(WEEK_DAYS), used, avoid)
+            if picks[slot] is None:
+                with self._lock:
+                    self.fallbacks += 1
+                return None
+
+        with self._lock:
+            self.composed += 1
+
+        return [
+            {
+                "id": str(uuid.uuid4()),
+                "day": day,
+                **{slot: picks[slot][i] for slot in SLOTS}
+            }
+            for i, day in enumerate(WEEK_DAYS)
+        ]
+
+    def _pick(self, dishes: List[str], count: int, used: set, avoid: set) -> Optional[List[str]]:
+        """
+        `count` distinct dishes not used elsewhere in the plan; recently
+        served ones only as a last resort
+        """
+        self._random.shuffle(dishes)
+        fresh, stale = [], []
+        for name in dishes:
+            key = " ".join(name.lower().split())
+            if key in used:
+                continue
+            (stale if key in avoid else fresh).append((key, name))
+            if len(fresh) >= count:
+                break
+
+        chosen = (fresh + stale)[:count]
+        if len(chosen) < count:
+            return None
+        used.update(key for key, _ in chosen)
+        return [name for _, name in chosen]
+
+    # ----------------------------------
+    # Stats
+    # ----------------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            requests = self.composed + self.fallbacks
+            return {
+                "mode": self.mode,
+                "composed": self.composed,
+                "fallbacks": self.fallbacks,
+                "compose_rate": round(self.composed / requests, 4) if requests else None,
+                "loaded": self.loaded,
+                "plans_scanned": self.plans_scanned,
+                "cuisines": {
+                    key: {slot: catalogue.size(slot) for slot in SLOTS}
+                    for key, catalogue in self._index.items()
+                },
+                "refresh_seconds_last": self.refresh_seconds_last
+            }
+
+
+meal_composer = MealComposer(
+    mode=os.getenv("MEAL_COMPOSER_MODE", "free"),
+    min_dishes=int(os.getenv("MEAL_COMPOSER_MIN_DISHES", 14)),
+    max_dishes=int(os.getenv("MEAL_COMPOSER_MAX_DISHES", 2000)),
+    scan_limit=int(os.getenv("MEAL_COMPOSER_SCAN_LIMIT", 20000)),
+    refresh_interval=float(os.getenv("MEAL_COMPOSER_REFRESH_INTERVAL", 60))
+)
+registry.register("meal_composer", meal_composer.stats)
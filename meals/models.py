@@ -21,3 +21,37 @@ class Meal(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     is_saved = db.Column(db.Boolean, default=False)
+
+
+class MealNutrition(db.Model):
+    """
+    Precomputed nutrition aggregates of one meal plan, so history trends
+    never have to re-read recipe JSON
+    """
+    __tablename__ = "meal_nutrition"
+    __table_args__ = (
+        db.Index("ix_meal_nutrition_user_created", "user_id", "plan_created_at"),
+    )
+
+    meal_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("meals.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    user_id = db.Column(UUID(as_uuid=True), nullable=False)
+    plan_created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    days = db.Column(db.Integer, default=0)
+    dishes = db.Column(db.Integer, default=0)
+    dishes_known = db.Column(db.Integer, default=0)
+
+    total_calories = db.Column(db.Float)
+    avg_daily_calories = db.Column(db.Float)
+    min_daily_calories = db.Column(db.Float)
+    max_daily_calories = db.Column(db.Float)
+    total_cooking_minutes = db.Column(db.Float)
+    avg_cooking_minutes = db.Column(db.Float)
+
+    # [{"day", "calories", "cooking_minutes", "dishes_known"}, ...]
+    daily = db.Column(db.JSON, nullable=False, default=list)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
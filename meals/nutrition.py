@@ -0,0 +1,306 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Float, case, cast, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import db
+from meals.models import MealNutrition
+from recipes.models import Recipe, CanonicalRecipe
+from recipes.canonical import title_key
+
+logger = logging.getLogger(__name__)
+
+SLOTS = ("breakfast", "lunch", "dinner")
+_NUMERIC = r"^\s*[0-9]+(\.[0-9]+)?\s*$"
+
+
+# ----------------------------------
+# Array math
+# ----------------------------------
+def _json_number(field, *columns):
+    """
+    First column->>field as float, NULL unless it is a plain number
+    """
+    text = func.coalesce(*[column[field].as_string() for column in columns])
+    return case((text.op("~")(_NUMERIC), cast(text, Float)), else_=None)
+
+
+def pack(meals: Iterable, lookup: Dict[str, Tuple[float, float]]) -> Tuple[List[str], np.ndarray]:
+    """
+    Day names plus a (days, 3 slots, 2) float array of
+    (calories, cooking minutes); NaN where the dish is unknown
+    """
+    days = [d for d in meals or [] if isinstance(d, dict)]
+    missing = (np.nan, np.nan)
+    packed = np.array(
+        [[lookup.get(title_key(d.get(slot) or ""), missing) for slot in SLOTS] for d in days],
+        dtype=float
+    ).reshape(len(days), len(SLOTS), 2)
+    return [str(d.get("day", "")) for d in days], packed
+
+
+def summarize(day_names: List[str], packed: np.ndarray) -> Dict:
+    """
+    Daily and weekly totals of a packed plan
+    """
+    calories = packed[..., 0]
+    minutes = packed[..., 1]
+    known = ~np.isnan(calories)
+    known_per_day = known.sum(axis=1)
+
+    daily_calories = np.where(known_per_day > 0, np.nansum(calories, axis=1), np.nan)
+    daily_minutes = np.where(
+        (~np.isnan(minutes)).sum(axis=1) > 0, np.nansum(minutes, axis=1), np.nan
+    )
+    has_day = ~np.isnan(daily_calories)
+    known_minutes = minutes[~np.isnan(minutes)]
+
+    def number(value):
+        return None if value is None or np.isnan(value) else round(float(value), 1)
+
+    return {
+        "days": len(day_names),
+        "dishes": int(calories.size),
+        "dishes_known": int(known.sum()),
+        "total_calories": number(np.nansum(calories)) if known.any() else None,
+        "avg_daily_calories": number(daily_calories[has_day].mean()) if has_day.any() else None,
+        "min_daily_calories": number(daily_calories[has_day].min()) if has_day.any() else None,
+        "max_daily_calories": number(daily_calories[has_day].max()) if has_day.any() else None,
+        "total_cooking_minutes": number(known_minutes.sum()) if known_minutes.size else None,
+        "avg_cooking_minutes": number(known_minutes.mean()) if known_minutes.size else None,
+        "daily": [
+            {
+                "day": name,
+                "calories": number(daily_calories[i]),
+                "cooking_minutes": number(daily_minutes[i]),
+                "dishes_known": int(known_per_day[i])
+            }
+            for i, name in enumerate(day_names)
+        ]
+    }
+
+
+def trend(values: np.ndarray, days_since: np.ndarray, window: int) -> Dict:
+    """
+    Rolling mean and least-squares slope (per week) of a series with gaps
+    """
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    # NaN-aware rolling mean via cumulative sums
+    sums = np.concatenate(([0.0], np.cumsum(filled)))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    idx = np.arange(1, len(values) + 1)
+    lo = np.maximum(idx - window, 0)
+    n = counts[idx] - counts[lo]
+    rolling = np.divide(sums[idx] - sums[lo], n, out=np.full(len(values), np.nan), where=n > 0)
+
+    slope = None
+    # Plans less than a day apart say nothing about a weekly trend
+    if valid.sum() >= 2 and np.ptp(days_since[valid]) >= 1:
+        slope = float(np.polyfit(days_since[valid], values[valid], 1)[0]) * 7
+
+    return {
+        "rolling": [None if np.isnan(v) else round(float(v), 1) for v in rolling],
+        "mean": round(float(values[valid].mean()), 1) if valid.any() else None,
+        "slope_per_week": round(slope, 2) if slope is not None else None
+    }
+
+
+# ----------------------------------
+# Persistence
+# ----------------------------------
+class NutritionService:
+    """
+    Per-plan nutrition aggregates, stored in meal_nutrition.
+
+    Dish figures come from recipes linked to the plan, falling back to
+    the average of every stored recipe with the same title. Both are
+    pulled as plain numbers by SQL, one query each.
+    """
+
+    @staticmethod
+    def dish_lookup(titles: List[str], meal_id=None) -> Dict[str, Tuple[float, float]]:
+        keys = list({title_key(t) for t in titles if t})
+        if not keys:
+            return {}
+
+        lookup = {}
+        rows = (
+            db.session.query(
+                CanonicalRecipe.title_key,
+                func.avg(_json_number("calories", CanonicalRecipe.content)),
+                func.avg(_json_number("cookingTimeMinutes", CanonicalRecipe.content))
+            )
+            .filter(CanonicalRecipe.title_key.in_(keys))
+            .group_by(CanonicalRecipe.title_key)
+            .all()
+        )
+        for key, calories, minutes in rows:
+            lookup[key] = (calories, minutes)
+
+        if meal_id is not None:
+            # Recipes generated for this plan win (newest per dish)
+            rows = (
+                db.session.query(
+                    Recipe.title,
+                    _json_number("calories", CanonicalRecipe.content, Recipe.content),
+                    _json_number("cookingTimeMinutes", CanonicalRecipe.content, Recipe.content)
+                )
+                .outerjoin(CanonicalRecipe, Recipe.canonical_id == CanonicalRecipe.id)
+                .filter(Recipe.meal_id == meal_id)
+                .order_by(Recipe.created_at)
+                .all()
+            )
+            for title, calories, minutes in rows:
+                lookup[title_key(title)] = (calories, minutes)
+
+        return {
+            key: (np.nan if c is None else float(c), np.nan if m is None else float(m))
+            for key, (c, m) in lookup.items()
+        }
+
+    @staticmethod
+    def build(meal, linked: bool = True) -> Dict:
+        """
+        Summary of a plan; `linked` also looks at recipes saved for it
+        """
+        titles = [
+            day.get(slot) for day in meal.meals or []
+            if isinstance(day, dict) for slot in SLOTS
+        ]
+        lookup = NutritionService.dish_lookup(titles, meal.id if linked else None)
+        return summarize(*pack(meal.meals, lookup))
+
+    @staticmethod
+    def row(meal, summary: Dict) -> Dict:
+        return {
+            "meal_id": meal.id,
+            "user_id": meal.user_id,
+            "plan_created_at": meal.created_at or datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+            **summary
+        }
+
+    @staticmethod
+    def stage(meal) -> MealNutrition:
+        """
+        Add a summary row for a new plan to the session, in the caller's
+        transaction; errors propagate and the caller rolls back
+        """
+        try:
+            record = MealNutrition(
+                **NutritionService.row(meal, NutritionService.build(meal, linked=False))
+            )
+        except Exception as e:
+            logger.warning("Nutrition summary failed for meal %s: %s", meal.id, e)
+            raise
+        db.session.add(record)
+        return record
+
+    @staticmethod
+    def refresh(meal) -> Dict:
+        """
+        Recompute and upsert the summary of an existing plan
+        """
+        summary = NutritionService.build(meal)
+        values = NutritionService.row(meal, summary)
+        db.session.execute(
+            pg_insert(MealNutrition)
+            .values(**values)
+            .on_conflict_do_update(
+                index_elements=["meal_id"],
+                set_={k: v for k, v in values.items() if k != "meal_id"}
+            )
+        )
+        db.session.commit()
+        return summary
+
+    @staticmethod
+    def refresh_meal(meal_id) -> None:
+        """
+        Refresh after recipes were saved for a plan; logs instead of raising
+        """
+        from meals.models import Meal
+
+        try:
+            meal = db.session.get(Meal, meal_id)
+            if meal is not None:
+                NutritionService.refresh(meal)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Nutrition refresh failed for meal %s: %s", meal_id, e)
+
+    @staticmethod
+    def get(meal) -> Dict:
+        record = db.session.get(MealNutrition, meal.id)
+        if record is None:
+            # Plans saved before summaries existed
+            return NutritionService.refresh(meal)
+        return NutritionService.to_dict(record)
+
+    @staticmethod
+    def to_dict(record) -> Dict:
+        return {
+            "days": record.days,
+            "dishes": record.dishes,
+            "dishes_known": record.dishes_known,
+            "total_calories": record.total_calories,
+            "avg_daily_calories": record.avg_daily_calories,
+            "min_daily_calories": record.min_daily_calories,
+            "max_daily_calories": record.max_daily_calories,
+            "total_cooking_minutes": record.total_cooking_minutes,
+            "avg_cooking_minutes": record.avg_cooking_minutes,
+            "daily": record.daily
+        }
+
+    @staticmethod
+    def history(user_id, limit: int = 12, window: int = 4) -> Dict:
+        """
+        Trend of the user's last `limit` plans, oldest first, from the
+        stored aggregates only
+        """
+        rows = (
+            db.session.query(
+                MealNutrition.meal_id,
+                MealNutrition.plan_created_at,
+                MealNutrition.avg_daily_calories,
+                MealNutrition.total_calories,
+                MealNutrition.avg_cooking_minutes
+            )
+            .filter(MealNutrition.user_id == user_id)
+            .order_by(MealNutrition.plan_created_at.desc())
+            .limit(limit)
+            .all()
+        )[::-1]
+
+        if not rows:
+            return {"plans": [], "daily_calories": None, "weekly_calories": None,
+                    "cooking_minutes": None}
+
+        columns = np.array(
+            [[np.nan if v is None else v for v in r[2:]] for r in rows], dtype=float
+        ).reshape(len(rows), 3)
+        first = rows[0].plan_created_at
+        days_since = np.array(
+            [(r.plan_created_at - first).total_seconds() / 86400 for r in rows], dtype=float
+        )
+
+        return {
+            "plans": [
+                {
+                    "meal_id": str(r.meal_id),
+                    "created_at": r.plan_created_at,
+                    "avg_daily_calories": r.avg_daily_calories,
+                    "total_calories": r.total_calories,
+                    "avg_cooking_minutes": r.avg_cooking_minutes
+                }
+                for r in rows
+            ],
+            "daily_calories": trend(columns[:, 0], days_since, window),
+            "weekly_calories": trend(columns[:, 1], days_since, window),
+            "cooking_minutes": trend(columns[:, 2], days_since, window)
+        }
@@ -2,8 +2,14 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from meals.service import MealService
+from meals.nutrition import NutritionService
+from recipes.service import RecipeService
 from ai.service import AIService
+from ai.pool import meal_plan_pool
+from ai.telemetry import llm_endpoint
+from ai.resilience import LLMUnavailableError
 from credits.service import CreditService
+from utils.ratelimit import rate_limit, GENERATE_RATE, GENERATE_BURST
 import uuid
 meals_bp = Blueprint("meals", __name__)
 
@@ -15,6 +21,8 @@ credit_service = CreditService()
 # =================================================
 @meals_bp.route("/generate-meal", methods=["POST"])
 @jwt_required(optional=True)
+@rate_limit("generate_meal", GENERATE_RATE, GENERATE_BURST)
+@llm_endpoint("generate_meal")
 def generate_meal_wrapper():
     data = request.get_json() or {}
 
@@ -22,27 +30,41 @@ def generate_meal_wrapper():
 
     user_id = identity if identity is not None else data.get("user_id", str(uuid.uuid4()))
     cuisine = data.get("cuisine", "any")
-    success = credit_service.consume(user_id, amount=1)
+    # Held during generation; charged only if the plan is saved
+    reservation = credit_service.reserve(user_id, amount=1)
 
-    if not success:
+    if reservation is None:
         return jsonify({
             "error": "Credits exhausted. Please request more credits."
         }), 403
     try:
-        # 1️⃣ Generate meal via AI
-        meals = ai_service.generate_meal_plan(cuisine)
-
-        # 2️⃣ Save to DB
-        MealService.save_meal(
-            user_id=user_id,
-            meals=meals,
-            cuisine=cuisine,
-            saved=False
-        )
+        with credit_service.hold(reservation):
+            # 1️⃣ Compose from the dish catalogue or take a pre-generated plan,
+            #    else generate via AI
+            meals = MealService.compose_plan(user_id, cuisine, data.get("mode"))
+            if meals is None:
+                meals = meal_plan_pool.pop(cuisine)
+            if meals is None:
+                meals = ai_service.generate_meal_plan(cuisine)
+
+            # 2️⃣ Save to DB
+            MealService.save_meal(
+                user_id=user_id,
+                meals=meals,
+                cuisine=cuisine,
+                saved=False,
+                generated=True
+            )
 
         # 3️⃣ Return clean JSON
         return jsonify(meals)
 
+    except LLMUnavailableError as e:
+        return jsonify({
+            "error": "Meal generation failed",
+            "details": str(e)
+        }), e.status
+
     except Exception as e:
         return jsonify({
             "error": "Meal generation failed",
@@ -70,6 +92,50 @@ def get_latest_meal():
     })
 
 
+# ----------------------------------
+# GET /meals/<id>/groceries
+# ----------------------------------
+@meals_bp.route("/meals/<uuid:meal_id>/groceries", methods=["GET"])
+@jwt_required()
+def get_meal_groceries(meal_id):
+    user_id = get_jwt_identity()
+
+    meal = MealService.get_meal(meal_id, user_id)
+    if not meal:
+        return jsonify({"error": "Meal not found"}), 404
+
+    return jsonify(RecipeService.grocery_list(meal))
+
+
+# ----------------------------------
+# GET /meals/<id>/nutrition
+# ----------------------------------
+@meals_bp.route("/meals/<uuid:meal_id>/nutrition", methods=["GET"])
+@jwt_required()
+def get_meal_nutrition(meal_id):
+    user_id = get_jwt_identity()
+
+    meal = MealService.get_meal(meal_id, user_id)
+    if not meal:
+        return jsonify({"error": "Meal not found"}), 404
+
+    return jsonify({"meal_id": str(meal.id), **NutritionService.get(meal)})
+
+
+# ----------------------------------
+# GET /meals/history/nutrition
+# ----------------------------------
+@meals_bp.route("/meals/history/nutrition", methods=["GET"])
+@jwt_required()
+def get_nutrition_history():
+    user_id = get_jwt_identity()
+
+    limit = max(1, min(request.args.get("limit", 12, type=int) or 12, 104))
+    window = max(request.args.get("window", 4, type=int) or 4, 1)
+
+    return jsonify(NutritionService.history(user_id, limit=limit, window=window))
+
+
 # ----------------------------------
 # GET /meals/history
 # ----------------------------------
@@ -1,8 +1,12 @@
-from datetime import date
+import uuid
+from datetime import date, datetime
 from sqlalchemy.exc import SQLAlchemyError
 
+from auth.guests import GuestService
 from database import db
 from meals.models import Meal
+from meals.composer import meal_composer
+from meals.nutrition import NutritionService
 
 
 class MealService:
@@ -12,23 +16,34 @@ class MealService:
 
     # 🔽 🔽 🔽 ADD THIS METHOD ONLY 🔽 🔽 🔽
     @staticmethod
-    def save_meal(user_id, meals, cuisine=None, saved=False):
+    def save_meal(user_id, meals, cuisine=None, saved=False, generated=False):
         """
-        Save AI-generated meal plan (JSON-based)
+        Save AI-generated meal plan (JSON-based) with its nutrition summary.
+        Only plans generated server-side (`generated`) feed the dish catalogue.
         """
         try:
+            GuestService.materialize(user_id)
             meal = Meal(
+                id=uuid.uuid4(),
                 user_id=user_id,
                 meals=meals,
                 cuisine=cuisine,
-                is_saved=saved
+                is_saved=saved,
+                created_at=datetime.utcnow()
             )
+            NutritionService.stage(meal)
             db.session.add(meal)
             db.session.commit()
-            return meal
         except SQLAlchemyError as e:
             db.session.rollback()
             raise RuntimeError(str(e))
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if generated and not saved:
+            meal_composer.add(cuisine, meals)
+        return meal
     # 🔼 🔼 🔼 END ADDITION 🔼 🔼 🔼
 
 
@@ -43,6 +58,7 @@ class MealService:
     @staticmethod
     def create_meal(user_id, data):
         try:
+            GuestService.materialize(user_id)
             meal = Meal(
                 user_id=user_id,
                 title=data.get("title"),
@@ -72,6 +88,7 @@ class MealService:
         meal.is_saved = True
 
         db.session.commit()
+        NutritionService.refresh_meal(meal.id)
         return meal
     @staticmethod
     def delete_meal(meal_id, user_id):
@@ -93,6 +110,7 @@ class MealService:
         Placeholder for AI-generated meal.
         AI call should happen in ai/service.py
         """
+        GuestService.materialize(user_id)
         meal = Meal(
             user_id=user_id,
             title=f"AI Meal ({preferences})",
@@ -103,6 +121,35 @@ class MealService:
         db.session.commit()
         return meal
 
+    @staticmethod
+    def compose_plan(user_id, cuisine, mode=None):
+        """
+        Build a plan from the dish catalogue when the user's tier / the
+        requested mode allow it; None means generate with the LLM
+        """
+        from subscription.service import SubscriptionService
+
+        if not meal_composer.wants(SubscriptionService.get_tier(user_id), mode):
+            return None
+
+        latest = MealService.get_latest_meal(user_id)
+        recent = MealService.dish_names(latest.meals) if latest else []
+        return meal_composer.compose(cuisine, exclude=recent)
+
+    @staticmethod
+    def dish_names(meals):
+        """
+        Breakfast / lunch / dinner names of a plan, in plan order
+        """
+        names = []
+        for day in meals or []:
+            if not isinstance(day, dict):
+                continue
+            for slot in ("breakfast", "lunch", "dinner"):
+                if day.get(slot):
+                    names.append(day[slot])
+        return names
+
     @staticmethod
     def get_latest_meal(user_id):
         """
@@ -1,5 +1,5 @@
 from datetime import datetime
-from database import db
+from database import db, register_schema_patch
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -39,6 +39,12 @@ class User(db.Model):
     subscription = db.relationship(
         "Subscription", uselist=False, backref="user"
     )
+
+
+# Guest sweeps (auth/guests.py) scan guests by age
+register_schema_patch(
+    "CREATE INDEX IF NOT EXISTS ix_users_guest_created ON users (created_at) WHERE is_guest"
+)
     
 
 
@@ -0,0 +1,71 @@
+"""
+Collapse existing per-user recipe copies into canonical_recipes.
+
+Walks recipes that have no canonical_id yet in primary-key order, in
+batches, and rewrites each row to reference a canonical body while
+keeping only its per-user overrides inline. Safe to stop and re-run.
+
+    python -m recipes.backfill --batch-size 500
+"""
+import argparse
+import time
+
+from database import db
+from recipes.models import Recipe
+from recipes.service import RecipeService
+
+
+def backfill(batch_size=500, max_batches=None, pause=0.0):
+    last_id = None
+    batches = 0
+    migrated = 0
+    created = 0
+
+    while max_batches is None or batches < max_batches:
+        query = Recipe.query.filter(Recipe.canonical_id.is_(None))
+        if last_id is not None:
+            query = query.filter(Recipe.id > last_id)
+        rows = query.order_by(Recipe.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        refs, canonical_ids = RecipeService.canonicalize(
+            [(row.title, row.content) for row in rows]
+        )
+        for row, (canonical_id, overrides) in zip(rows, refs):
+            if canonical_id is not None:
+                row.canonical_id = canonical_id
+                row.content = overrides
+                migrated += 1
+
+        db.session.commit()
+        RecipeService._remember(canonical_ids)
+
+        created += len(canonical_ids)
+        batches += 1
+        last_id = rows[-1].id
+        print(f"batch {batches}: {migrated} rows migrated, {created} canonical bodies referenced")
+
+        if pause:
+            time.sleep(pause)
+
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-batches", type=int, default=None)
+    parser.add_argument("--pause", type=float, default=0.0,
+                        help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        total = backfill(args.batch_size, args.max_batches, args.pause)
+    print(f"Done: {total} recipes now reference canonical bodies")
+
+
+if __name__ == "__main__":
+    main()
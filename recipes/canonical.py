@@ -0,0 +1,57 @@
+import copy
+import hashlib
+import json
+from typing import Dict, Tuple
+
+
+def split_content(content: Dict) -> Tuple[Dict, Dict]:
+    """
+    Split a recipe into its shareable body and the per-user overrides.
+
+    Only generated ids differ between otherwise identical recipes, so
+    the recipe id and grocery item ids are kept per user.
+    """
+    body = copy.deepcopy(content)
+    overrides = {}
+
+    if "id" in body:
+        overrides["id"] = body.pop("id")
+
+    groceries = body.get("groceries")
+    if isinstance(groceries, list):
+        ids = [
+            item.pop("id", None) if isinstance(item, dict) else None
+            for item in groceries
+        ]
+        if any(i is not None for i in ids):
+            overrides["grocery_ids"] = ids
+
+    return body, overrides
+
+
+def merge_content(body: Dict, overrides: Dict) -> Dict:
+    """
+    Inverse of split_content
+    """
+    content = copy.deepcopy(body)
+    overrides = overrides or {}
+
+    if "id" in overrides:
+        content["id"] = overrides["id"]
+
+    grocery_ids = overrides.get("grocery_ids")
+    if grocery_ids and isinstance(content.get("groceries"), list):
+        for item, item_id in zip(content["groceries"], grocery_ids):
+            if isinstance(item, dict) and item_id is not None:
+                item["id"] = item_id
+
+    return content
+
+
+def content_hash(body: Dict) -> str:
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def title_key(title: str) -> str:
+    return " ".join((title or "").lower().split())[:255]
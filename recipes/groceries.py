@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from fractions import Fraction
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.metrics import registry
+
+
+# ----------------------------------
+# Units
+# ----------------------------------
+# unit -> (dimension, factor to the dimension's base unit: g / ml / piece)
+UNITS = {
+    "mg": ("mass", 0.001),
+    "g": ("mass", 1.0), "gm": ("mass", 1.0), "gms": ("mass", 1.0),
+    "gram": ("mass", 1.0), "grams": ("mass", 1.0),
+    "kg": ("mass", 1000.0), "kgs": ("mass", 1000.0),
+    "kilogram": ("mass", 1000.0), "kilograms": ("mass", 1000.0),
+    "oz": ("mass", 28.35), "ounce": ("mass", 28.35), "ounces": ("mass", 28.35),
+    "lb": ("mass", 453.6), "lbs": ("mass", 453.6),
+    "pound": ("mass", 453.6), "pounds": ("mass", 453.6),
+
+    "ml": ("volume", 1.0), "milliliter": ("volume", 1.0), "milliliters": ("volume", 1.0),
+    "l": ("volume", 1000.0), "liter": ("volume", 1000.0), "liters": ("volume", 1000.0),
+    "litre": ("volume", 1000.0), "litres": ("volume", 1000.0),
+    "tsp": ("volume", 5.0), "teaspoon": ("volume", 5.0), "teaspoons": ("volume", 5.0),
+    "tbsp": ("volume", 15.0), "tablespoon": ("volume", 15.0), "tablespoons": ("volume", 15.0),
+    "cup": ("volume", 240.0), "cups": ("volume", 240.0),
+
+    "piece": ("count", 1.0), "pieces": ("count", 1.0), "pcs": ("count", 1.0),
+    "pc": ("count", 1.0), "clove": ("count", 1.0), "cloves": ("count", 1.0),
+    "whole": ("count", 1.0), "nos": ("count", 1.0), "no": ("count", 1.0)
+}
+
+# base unit -> [(threshold, display unit, factor)], largest first
+DISPLAY = {
+    "mass": [(1000.0, "kg", 1000.0), (0.0, "g", 1.0)],
+    "volume": [(1000.0, "l", 1000.0), (0.0, "ml", 1.0)],
+    "count": [(0.0, "", 1.0)]
+}
+
+_VULGAR = {"½": "1/2", "⅓": "1/3", "⅔": "2/3", "¼": "1/4", "¾": "3/4", "⅛": "1/8"}
+_NUMBER = r"\d+/\d+|\d+(?:\.\d+)?(?:\s+\d+/\d+)?"
+_QUANTITY = re.compile(
+    rf"^\s*(?P<amount>{_NUMBER})(?:\s*(?:-|to)\s*(?P<upper>{_NUMBER}))?\s*(?P<unit>[a-z.]+)?\b",
+    re.IGNORECASE
+)
+
+# Words that describe preparation, not the product to buy
+_DESCRIPTORS = {
+    "fresh", "chopped", "finely", "roughly", "diced", "sliced", "minced",
+    "grated", "crushed", "ground", "large", "small", "medium", "boiled",
+    "cooked", "raw", "peeled", "optional", "to", "taste", "of"
+}
+_ALIASES = {
+    "coriander leaf": "cilantro",
+    "coriander leave": "cilantro",
+    "capsicum": "bell pepper",
+    "curd": "yogurt",
+    "yoghurt": "yogurt",
+    "chilli": "chili",
+    "green chilli": "green chili"
+}
+
+
+def _number(text: str) -> float:
+    return float(sum(Fraction(part) for part in text.split()))
+
+
+def parse_quantity(text) -> Tuple[Optional[float], Optional[str]]:
+    """
+    "1 1/2 cups" -> (360.0, "volume"); ranges take the upper bound.
+    (None, None) when there is no leading number ("a pinch", "to taste").
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return float(text), "count"
+    if not isinstance(text, str):
+        return None, None
+
+    for char, replacement in _VULGAR.items():
+        text = text.replace(char, f" {replacement}")
+
+    match = _QUANTITY.match(text.strip())
+    if not match:
+        return None, None
+
+    try:
+        amount = _number(match.group("upper") or match.group("amount"))
+    except (ZeroDivisionError, ValueError):
+        # e.g. "1/0 cup" in user-saved content
+        return None, None
+    unit = (match.group("unit") or "").lower().rstrip(".")
+    dimension, factor = UNITS.get(unit, ("count", 1.0))
+    return amount * factor, dimension
+
+
+def normalize_name(name) -> str:
+    """
+    Merge key for equivalent ingredients: lowercase, no parentheticals
+    or prep words, naive singular, known aliases
+    """
+    if not isinstance(name, str):
+        return ""
+    name = re.sub(r"\(.*?\)", " ", name.lower())
+    name = name.split(",")[0]
+    words = [w for w in re.findall(r"[a-z]+", name) if w not in _DESCRIPTORS]
+
+    singular = []
+    for word in words:
+        if word.endswith("oes") and len(word) > 4:
+            word = word[:-2]
+        elif word.endswith("ies") and len(word) > 4:
+            word = word[:-3] + "y"
+        elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+            word = word[:-1]
+        singular.append(word)
+
+    key = " ".join(singular)
+    return _ALIASES.get(key, key)
+
+
+def format_quantity(amount: float, dimension: str) -> str:
+    for threshold, unit, factor in DISPLAY[dimension]:
+        if amount >= threshold:
+            value = round(amount / factor, 2)
+            value = int(value) if value == int(value) else value
+            return f"{value} {unit}".strip()
+    return str(amount)
+
+
+# ----------------------------------
+# Aggregation
+# ----------------------------------
+def aggregate(groceries: Iterable[Tuple[str, Dict]]) -> List[Dict]:
+    """
+    One pass over (recipe title, grocery item) pairs: items are keyed by
+    normalized name and summed per dimension; quantities that can't be
+    parsed are kept as notes.
+    """
+    merged = {}
+
+    for title, item in groceries:
+        if not isinstance(item, dict):
+            continue
+        key = normalize_name(item.get("name"))
+        if not key:
+            continue
+
+        entry = merged.get(key)
+        if entry is None:
+            entry = merged[key] = {
+                "name": item["name"].strip(),
+                "totals": {},
+                "notes": [],
+                "recipes": []
+            }
+
+        amount, dimension = parse_quantity(item.get("quantity"))
+        if amount is None:
+            note = str(item.get("quantity") or "").strip()
+            if note and note not in entry["notes"]:
+                entry["notes"].append(note)
+        else:
+            entry["totals"][dimension] = entry["totals"].get(dimension, 0.0) + amount
+
+        if title not in entry["recipes"]:
+            entry["recipes"].append(title)
+
+    result = []
+    for key in sorted(merged):
+        entry = merged[key]
+        quantities = [
+            format_quantity(amount, dimension)
+            for dimension, amount in sorted(entry["totals"].items())
+        ]
+        result.append({
+            "name": entry["name"],
+            "key": key,
+            "quantity": " + ".join(quantities + entry["notes"]) or None,
+            "amounts": {
+                DISPLAY[d][-1][1] or "count": round(a, 2)
+                for d, a in entry["totals"].items()
+            },
+            "recipes": entry["recipes"]
+        })
+    return result
+
+
+def grocery_items(recipes) -> Iterable[Tuple[str, Dict]]:
+    """
+    (title, grocery item) pairs, using the newest recipe per dish when a
+    plan was generated more than once
+    """
+    latest = {}
+    for recipe in recipes:
+        key = " ".join(recipe.title.lower().split())
+        if key not in latest or recipe.created_at > latest[key].created_at:
+            latest[key] = recipe
+
+    for recipe in latest.values():
+        content = recipe.full_content
+        items = content.get("groceries") if isinstance(content, dict) else None
+        for item in items or []:
+            yield recipe.title, item
+
+
+# ----------------------------------
+# Cache
+# ----------------------------------
+class GroceryListCache:
+    """
+    Computed lists per meal plan, valid while the plan's version
+    (its dishes + linked recipe count / newest recipe) is unchanged
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def version(meals, recipe_count: int, newest) -> str:
+        digest = hashlib.sha1(
+            json.dumps(meals, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        return f"{digest}:{recipe_count}:{newest}"
+
+    def get(self, meal_id, version: str) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(str(meal_id))
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(str(meal_id))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, meal_id, version: str, groceries: List[Dict]) -> None:
+        with self._lock:
+            self._entries[str(meal_id)] = (version, groceries)
+            self._entries.move_to_end(str(meal_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, meal_id) -> None:
+        with self._lock:
+            self._entries.pop(str(meal_id), None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+grocery_cache = GroceryListCache(
+    max_entries=int(os.getenv("GROCERY_CACHE_MAX_ENTRIES", 1024))
+)
+registry.register("grocery_cache", grocery_cache.stats)
@@ -1,8 +1,26 @@
 from datetime import datetime
-from database import db
+from database import db, register_schema_patch
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
 
+from recipes.canonical import merge_content
+
+
+class CanonicalRecipe(db.Model):
+    """
+    One shared copy of each distinct recipe body (per-user ids stripped)
+    """
+    __tablename__ = "canonical_recipes"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True,default=uuid.uuid4,
+    unique=True,
+    nullable=False)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)
+    title_key = db.Column(db.String(255), index=True)
+    content = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class Recipe(db.Model):
     __tablename__ = "recipes"
 
@@ -17,7 +35,50 @@ class Recipe(db.Model):
     )
 
     title = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.JSON, nullable=False)  # full recipe JSON
+    # Full recipe JSON for legacy rows; only per-user overrides once
+    # canonical_id is set (see recipes/backfill.py)
+    content = db.Column(db.JSON, nullable=False)
+    canonical_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("canonical_recipes.id"),
+        nullable=True,
+        index=True
+    )
+    # Meal plan the recipe was generated for, if any
+    meal_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("meals.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True
+    )
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     is_saved = db.Column(db.Boolean, default=False)
+
+    canonical = db.relationship("CanonicalRecipe", lazy="joined")
+
+    @property
+    def full_content(self):
+        """
+        Recipe JSON as generated: canonical body plus per-user overrides
+        """
+        if self.canonical is None:
+            return self.content
+        return merge_content(self.canonical.content, self.content)
+
+
+# db.create_all() doesn't add columns to existing tables
+register_schema_patch(
+    "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS canonical_id UUID "
+    "REFERENCES canonical_recipes(id)"
+)
+register_schema_patch(
+    "CREATE INDEX IF NOT EXISTS ix_recipes_canonical_id ON recipes (canonical_id)"
+)
+register_schema_patch(
+    "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS meal_id UUID "
+    "REFERENCES meals(id) ON DELETE SET NULL"
+)
+register_schema_patch(
+    "CREATE INDEX IF NOT EXISTS ix_recipes_meal_id ON recipes (meal_id)"
+)
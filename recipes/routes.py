@@ -1,49 +1,102 @@
+import os
+import uuid
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from recipes.service import RecipeService
 from credits.service import CreditService
 from ai.service import AIService
+from ai.streaming import recipe_events, recipe_batch_events, settle_credits
+from ai.telemetry import llm_endpoint
+from ai.resilience import LLMUnavailableError
+from meals.service import MealService
+from utils.response import stream_response, wants_stream
+from utils.ratelimit import rate_limit, GENERATE_RATE, GENERATE_BURST, BATCH_RATE, BATCH_BURST
 
 recipes_bp = Blueprint("recipes", __name__)
 
+RECIPE_BATCH_CONCURRENCY = int(os.getenv("RECIPE_BATCH_CONCURRENCY", 4))
+RECIPE_BATCH_MAX = int(os.getenv("RECIPE_BATCH_MAX", 30))
+
 ai_service = AIService()
 credit_service = CreditService()
 
+
+def _owned_meal(meal_id, user_id):
+    """
+    The user's meal plan `meal_id`, or None if it isn't theirs (or
+    either id isn't a UUID, e.g. an anonymous caller)
+    """
+    try:
+        meal_id = uuid.UUID(str(meal_id))
+        user_id = uuid.UUID(str(user_id))
+    except ValueError:
+        return None
+    return MealService.get_meal(meal_id, user_id)
+
+
+def _owned_meal_id(meal_id, user_id):
+    """
+    Id of the user's meal plan `meal_id`, or None if it isn't theirs
+    """
+    meal = _owned_meal(meal_id, user_id)
+    return meal.id if meal else None
+
 # =================================================
 # POST /generate-recipe  ✅ (NON-AI ALIAS / WRAPPER)
 # =================================================
 @recipes_bp.route("/generate-recipe", methods=["POST"])
 @jwt_required(optional=True)
+@rate_limit("generate_recipe", GENERATE_RATE, GENERATE_BURST)
+@llm_endpoint("generate_recipe")
 def generate_recipe_wrapper():
     data = request.get_json() or {}
 
     user_id = get_jwt_identity() or data.get("user_id", "anonymous")
     meal_name = data.get("meal_name")
-    success = credit_service.consume(user_id, amount=1)
+    if not meal_name:
+        return jsonify({"error": "meal_name is required"}), 400
 
-    if not success:
+    # Optional: link the recipe to the plan it belongs to (grocery lists)
+    meal_id = _owned_meal_id(data.get("meal_id"), user_id)
+
+    # Held during generation; charged only if the recipe is saved
+    reservation = credit_service.reserve(user_id, amount=1)
+    if reservation is None:
         return jsonify({
             "error": "Credits exhausted. Please request more credits."
         }), 403
-    if not meal_name:
-        return jsonify({"error": "meal_name is required"}), 400
 
-    try:
-        # 1️⃣ Generate recipe via AI
-        recipe_json = ai_service.generate_recipe(meal_name)
+    # Opt-in: emit recipe sections as they are generated
+    if wants_stream(data):
+        return stream_response(settle_credits(
+            recipe_events(ai_service, user_id, meal_name, meal_id=meal_id),
+            credit_service, reservation
+        ))
 
-        # 2️⃣ Save to DB
-        RecipeService.save_recipe(
-            user_id=user_id,
-            title=recipe_json.get("title", meal_name),
-            content=recipe_json,
-            saved=False
-        )
+    try:
+        with credit_service.hold(reservation):
+            # 1️⃣ Generate recipe via AI
+            recipe_json = ai_service.generate_recipe(meal_name)
+
+            # 2️⃣ Save to DB
+            RecipeService.save_recipe(
+                user_id=user_id,
+                title=recipe_json.get("title", meal_name),
+                content=recipe_json,
+                saved=False,
+                meal_id=meal_id
+            )
 
         # 3️⃣ Return clean JSON
         return jsonify(recipe_json)
 
+    except LLMUnavailableError as e:
+        return jsonify({
+            "error": "Recipe generation failed",
+            "details": str(e)
+        }), e.status
+
     except Exception as e:
         return jsonify({
             "error": "Recipe generation failed",
@@ -51,6 +104,63 @@ def generate_recipe_wrapper():
         }), 500
 
 
+# =================================================
+# POST /recipes/batch
+# =================================================
+@recipes_bp.route("/recipes/batch", methods=["POST"])
+@jwt_required(optional=True)
+@rate_limit("recipes_batch", BATCH_RATE, BATCH_BURST)
+@llm_endpoint("recipes.batch")
+def generate_recipe_batch():
+    data = request.get_json() or {}
+
+    user_id = get_jwt_identity() or data.get("user_id", "anonymous")
+    meal_id = data.get("meal_id")
+    meal_names = data.get("meal_names") or []
+
+    if meal_id:
+        meal = _owned_meal(meal_id, user_id)
+        if not meal:
+            return jsonify({"error": "Meal not found"}), 404
+        meal_names = MealService.dish_names(meal.meals)
+
+    if not isinstance(meal_names, list):
+        return jsonify({"error": "meal_names must be a list"}), 400
+
+    meal_names = RecipeService.dedupe_names(meal_names)
+    if not meal_names:
+        return jsonify({"error": "meal_id or meal_names is required"}), 400
+
+    if len(meal_names) > RECIPE_BATCH_MAX:
+        return jsonify({
+            "error": f"At most {RECIPE_BATCH_MAX} recipes per batch"
+        }), 400
+
+    try:
+        concurrency = max(1, min(
+            int(data.get("concurrency") or RECIPE_BATCH_CONCURRENCY),
+            RECIPE_BATCH_CONCURRENCY
+        ))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+
+    # One credit per unique dish, held for the whole batch; only the
+    # recipes actually saved are charged
+    reservation = credit_service.reserve(user_id, amount=len(meal_names))
+    if reservation is None:
+        return jsonify({
+            "error": "Credits exhausted. Please request more credits."
+        }), 403
+
+    return stream_response(settle_credits(
+        recipe_batch_events(
+            ai_service, user_id, meal_names, concurrency,
+            meal_id=meal.id if meal_id else None
+        ),
+        credit_service, reservation
+    ))
+
+
 # ----------------------------------
 # GET /recipe/latest
 # ----------------------------------
@@ -66,7 +176,7 @@ def get_latest_recipe():
     return jsonify({
         "id": recipe.id,
         "title": recipe.title,
-        "content": recipe.content,
+        "content": recipe.full_content,
         "created_at": recipe.created_at
     })
 
@@ -92,7 +202,8 @@ def save_recipe():
         user_id=user_id,
         title=title,
         content=content,
-        saved=True
+        saved=True,
+        meal_id=_owned_meal_id(data.get("meal_id"), user_id)
     )
 
     return jsonify({
@@ -120,6 +231,6 @@ def get_recipe_by_id(recipe_id):
     return jsonify({
         "id": recipe.id,
         "title": recipe.title,
-        "content": recipe.content,
+        "content": recipe.full_content,
         "created_at": recipe.created_at
     })
@@ -1,20 +1,180 @@
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from auth.guests import GuestService
 from database import db
-from recipes.models import Recipe
+from recipes.models import Recipe, CanonicalRecipe
+from recipes.canonical import split_content, content_hash, title_key
+from meals.nutrition import NutritionService
+from recipes.groceries import (
+    aggregate,
+    grocery_items,
+    grocery_cache,
+    GroceryListCache
+)
+
+# content hash -> canonical id, for hot recipes (per worker)
+_canonical_memo = OrderedDict()
+_canonical_memo_lock = threading.Lock()
+_CANONICAL_MEMO_SIZE = 4096
 
 
 class RecipeService:
 
     @staticmethod
-    def save_recipe(user_id, title, content, saved=True):
-        recipe = Recipe(
-            user_id=user_id,
-            title=title,
-            content=content,
-            is_saved=saved
-        )
-        db.session.add(recipe)
-        db.session.commit()
-        return recipe
+    def save_recipe(user_id, title, content, saved=True, meal_id=None):
+        return RecipeService.save_recipes(
+            user_id, [(title, content)], saved=saved, meal_id=meal_id
+        )[0]
+
+    @staticmethod
+    def save_recipes(user_id, items, saved=False, meal_id=None):
+        """
+        Bulk insert (title, content) pairs in a single transaction,
+        optionally linked to the meal plan they were generated for.
+        Recipe bodies are stored once in canonical_recipes; each row
+        keeps only its per-user overrides.
+        """
+        try:
+            GuestService.materialize(user_id)
+            refs, canonical_ids = RecipeService.canonicalize(items)
+            recipes = [
+                Recipe(
+                    user_id=user_id,
+                    title=title,
+                    content=overrides,
+                    canonical_id=canonical_id,
+                    meal_id=meal_id,
+                    is_saved=saved
+                )
+                for (title, _), (canonical_id, overrides) in zip(items, refs)
+            ]
+            db.session.add_all(recipes)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            raise RuntimeError(str(e))
+
+        # Only remember ids once the canonical rows are committed
+        RecipeService._remember(canonical_ids)
+        if meal_id:
+            grocery_cache.invalidate(meal_id)
+            NutritionService.refresh_meal(meal_id)
+        return recipes
+
+    @staticmethod
+    def canonicalize(items):
+        """
+        Map (title, content) pairs to (canonical_id, overrides), upserting
+        unseen bodies in one statement. Content that isn't a JSON object
+        is kept inline with no canonical row.
+
+        Returns the pairs plus the {content hash: canonical id} map used.
+        Runs inside the caller's transaction.
+        """
+        split = []
+        ids = {}
+        pending = {}
+
+        for title, content in items:
+            if not isinstance(content, dict):
+                split.append((None, content))
+                continue
+
+            body, overrides = split_content(content)
+            digest = content_hash(body)
+            split.append((digest, overrides))
+
+            if digest in ids or digest in pending:
+                continue
+            with _canonical_memo_lock:
+                known = _canonical_memo.get(digest)
+            if known:
+                ids[digest] = known
+            else:
+                pending[digest] = {
+                    "id": uuid.uuid4(),
+                    "content_hash": digest,
+                    "title_key": title_key(body.get("title") or title),
+                    "content": body,
+                    "created_at": datetime.utcnow()
+                }
+
+        if pending:
+            db.session.execute(
+                pg_insert(CanonicalRecipe)
+                .values(list(pending.values()))
+                .on_conflict_do_nothing(index_elements=["content_hash"])
+            )
+            rows = (
+                db.session.query(CanonicalRecipe.content_hash, CanonicalRecipe.id)
+                .filter(CanonicalRecipe.content_hash.in_(list(pending)))
+                .all()
+            )
+            ids.update(rows)
+
+        refs = [
+            (ids[digest] if digest else None, overrides)
+            for digest, overrides in split
+        ]
+        return refs, ids
+
+    @staticmethod
+    def _remember(canonical_ids):
+        with _canonical_memo_lock:
+            for digest, canonical_id in canonical_ids.items():
+                _canonical_memo[digest] = canonical_id
+                _canonical_memo.move_to_end(digest)
+            while len(_canonical_memo) > _CANONICAL_MEMO_SIZE:
+                _canonical_memo.popitem(last=False)
+
+    @staticmethod
+    def dedupe_names(names):
+        """
+        Drop blank and duplicate dish names (case/whitespace-insensitive),
+        keeping first-seen order and spelling
+        """
+        seen = set()
+        unique = []
+        for name in names:
+            if not isinstance(name, str):
+                continue
+            key = " ".join(name.lower().split())
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(name.strip())
+        return unique
+
+    @staticmethod
+    def grocery_list(meal):
+        """
+        Aggregated groceries of every recipe linked to a meal plan.
+        A cheap count / max query decides whether the cached list is
+        still valid; otherwise all recipes are fetched in one query.
+        """
+        scope = Recipe.query.filter_by(meal_id=meal.id, user_id=meal.user_id)
+
+        count, newest = scope.with_entities(
+            func.count(Recipe.id), func.max(Recipe.created_at)
+        ).one()
+        version = GroceryListCache.version(meal.meals, count, newest)
+
+        groceries = grocery_cache.get(meal.id, version)
+        if groceries is None:
+            groceries = aggregate(grocery_items(scope.all()))
+            grocery_cache.put(meal.id, version, groceries)
+
+        return {
+            "meal_id": str(meal.id),
+            "recipes": count,
+            "items": groceries
+        }
 
     @staticmethod
     def get_latest_recipe(user_id):
@@ -1,6 +1,11 @@
 from datetime import datetime, timedelta
+from flask import g, has_request_context
 from database import db
+from sqlalchemy.exc import SQLAlchemyError
 from models import Subscription
+from usage.quota import quota_engine
+from auth.guests import GuestService
+from user.cache import user_cache
 
 
 class SubscriptionService:
@@ -29,6 +34,47 @@ class SubscriptionService:
             "expiry_date": sub.expiry_date
         }
 
+    @staticmethod
+    def get_tier(user_id):
+        """
+        Usage tier of a user: guest / free / pro (anonymous if unknown).
+        Looked up once per request (telemetry tags, quotas and the meal
+        composer all ask).
+        """
+        if not has_request_context():
+            return SubscriptionService._lookup_tier(user_id)
+
+        tiers = g.setdefault("user_tiers", {})
+        key = str(user_id)
+        if key not in tiers:
+            tiers[key] = SubscriptionService._lookup_tier(user_id)
+        return tiers[key]
+
+    @staticmethod
+    def _forget_tier(user_id):
+        if has_request_context():
+            g.get("user_tiers", {}).pop(str(user_id), None)
+        quota_engine.forget_tier(user_id)
+
+    @staticmethod
+    def _lookup_tier(user_id):
+        try:
+            user = user_cache.get(user_id)
+        except SQLAlchemyError:
+            db.session.rollback()
+            return "anonymous"
+
+        if not user:
+            # A guest that has not saved anything yet
+            return "guest" if GuestService.claims(user_id) else "anonymous"
+        if user.is_guest:
+            return "guest"
+        if user.is_pro_user:
+            return "pro"
+
+        status = SubscriptionService.get_status(user_id)
+        return "pro" if status["status"] == "active" else "free"
+
     @staticmethod
     def upgrade(user_id, provider, duration_days=30):
         expiry = datetime.utcnow() + timedelta(days=duration_days)
@@ -48,6 +94,7 @@ class SubscriptionService:
             sub.expiry_date = expiry
 
         db.session.commit()
+        SubscriptionService._forget_tier(user_id)
         return sub
 
     @staticmethod
@@ -68,6 +115,7 @@ class SubscriptionService:
             sub.expiry_date = expiry_date
 
         db.session.commit()
+        SubscriptionService._forget_tier(user_id)
         return sub
 
     @staticmethod
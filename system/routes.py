@@ -1,7 +1,10 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 import os
 import time
 
+from utils.metrics import registry
+from utils.decorators import admin_required
+
 system_bp = Blueprint("system", __name__)
 
 
@@ -26,3 +29,42 @@ def version():
         "version": os.getenv("APP_VERSION", "1.0.0"),
         "environment": os.getenv("FLASK_ENV", "production")
     }), 200
+
+
+# ----------------------------------
+# GET /metrics
+# ----------------------------------
+@system_bp.route("/metrics", methods=["GET"])
+@admin_required
+def metrics():
+    if request.args.get("format") == "prometheus":
+        return registry.prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+    return jsonify(registry.snapshot()), 200
+
+
+# ----------------------------------
+# GET /metrics/users
+# ----------------------------------
+@system_bp.route("/metrics/users", methods=["GET"])
+@admin_required
+def metrics_users():
+    from ai.telemetry import telemetry
+
+    by = request.args.get("by", "cost_usd")
+    limit = min(int(request.args.get("limit", 20)), 500)
+    return jsonify(telemetry.top_users(by=by, limit=limit)), 200
+
+
+# ----------------------------------
+# GET /metrics/users/<user_id>
+# ----------------------------------
+@system_bp.route("/metrics/users/<user_id>", methods=["GET"])
+@admin_required
+def metrics_user(user_id):
+    from ai.telemetry import telemetry
+
+    stats = telemetry.user_stats(user_id)
+    if not stats:
+        return jsonify({"error": "No LLM usage recorded for user"}), 404
+    return jsonify(stats), 200
@@ -0,0 +1,85 @@
+import pytest
+
+from ai.extract import ExtractionError, JSONStreamParser, _repair, extract_json
+
+
+# ----------------------------------
+# _repair
+# ----------------------------------
+def test_repair_trailing_commas():
+    assert _repair('{"a": [1, 2,], "b": 3,}') == {"a": [1, 2], "b": 3}
+
+
+def test_repair_smart_quotes():
+    assert _repair("{“title”: “Dal”}") == {"title": "Dal"}
+
+
+def test_repair_raw_newline_in_string():
+    assert _repair('{"step": "Boil\nthe water"}') == {"step": "Boil\nthe water"}
+
+
+def test_repair_truncated_tail():
+    assert _repair('[{"day": "Mon"}, {"day": "Tue", "lunch": "Ri')[0] == {"day": "Mon"}
+
+
+def test_repair_gives_up_on_garbage():
+    with pytest.raises(ExtractionError):
+        _repair("not json at all")
+
+
+def test_extract_json_skips_fences_and_preamble():
+    text = 'Here you go:\n```json\n[{"day": "Mon"},]\n```'
+    assert extract_json(text, expect=list) == [{"day": "Mon"}]
+
+
+# ----------------------------------
+# JSONStreamParser
+# ----------------------------------
+def feed_all(parser, chunks):
+    items = []
+    for chunk in chunks:
+        items += parser.feed(chunk)
+    return items
+
+
+def test_stream_array_elements_across_chunks():
+    parser = JSONStreamParser()
+    items = feed_all(parser, ['```json\n[{"day": "Mon", "x": "a,b"},', ' {"day"', ': "Tue"}]'])
+    assert items == [{"day": "Mon", "x": "a,b"}, {"day": "Tue"}]
+    assert parser.done
+
+
+def test_stream_element_returned_when_complete():
+    parser = JSONStreamParser()
+    assert parser.feed('[{"a": 1}, {"b":') == [{"a": 1}]
+    assert parser.feed(' 2}]') == [{"b": 2}]
+
+
+def test_stream_brackets_inside_strings():
+    parser = JSONStreamParser()
+    assert parser.feed('[{"s": "] } \\" ,"}, 2]') == [{"s": '] } " ,'}, 2]
+
+
+def test_stream_object_members():
+    parser = JSONStreamParser()
+    items = feed_all(parser, ['{"title": "Dal", "steps": ', '["a", "b"]}'])
+    assert items == [("title", "Dal"), ("steps", ["a", "b"])]
+
+
+def test_stream_repairs_element():
+    parser = JSONStreamParser()
+    assert parser.feed('[{"day": "Mon",}]') == [{"day": "Mon"}]
+
+
+def test_stream_skips_unrepairable_element():
+    parser = JSONStreamParser()
+    assert parser.feed('[{"day": "Mon"}, nonsense, {"day": "Tue"}]') == [
+        {"day": "Mon"}, {"day": "Tue"}
+    ]
+
+
+def test_stream_not_done_until_closed():
+    parser = JSONStreamParser()
+    parser.feed('[{"day": "Mon"}')
+    assert not parser.done
+    assert parser.feed("") == []
@@ -0,0 +1,31 @@
+import pytest
+
+from recipes.groceries import parse_quantity
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2 cups", (480.0, "volume")),
+    ("1 1/2 cups", (360.0, "volume")),
+    ("½ tsp", (2.5, "volume")),
+    ("1½ tbsp", (22.5, "volume")),
+    ("250 g", (250.0, "mass")),
+    ("1.5kg", (1500.0, "mass")),
+    ("2-3 cloves", (3.0, "count")),
+    ("1 to 2 lbs", (907.2, "mass")),
+    ("3", (3.0, "count")),
+    ("4 onions", (4.0, "count")),
+    (2, (2.0, "count")),
+])
+def test_parse_quantity(text, expected):
+    amount, dimension = parse_quantity(text)
+    assert dimension == expected[1]
+    assert amount == pytest.approx(expected[0])
+
+
+@pytest.mark.parametrize("text", ["a pinch", "to taste", "", None, True, ["1 cup"]])
+def test_parse_quantity_without_number(text):
+    assert parse_quantity(text) == (None, None)
+
+
+def test_parse_quantity_zero_denominator():
+    assert parse_quantity("1/0 cup") == (None, None)
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from utils.local_store import LocalStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalStore(str(tmp_path / "local.sqlite3"))
+
+
+# ----------------------------------
+# incr
+# ----------------------------------
+def test_incr_counts(store):
+    assert store.incr("n", "k") == (True, 1)
+    assert store.incr("n", "k", 2) == (True, 3)
+    assert store.total("n", "k") == 3
+
+
+def test_incr_stops_at_limit(store):
+    for count in (1, 2, 3):
+        assert store.incr("n", "k", limit=3) == (True, count)
+    assert store.incr("n", "k", limit=3) == (False, 3)
+    assert store.total("n", "k") == 3
+
+
+def test_incr_larger_than_limit(store):
+    assert store.incr("n", "k", 5, limit=3) == (False, 0)
+
+
+def test_incr_limit_includes_base(store):
+    store.incr("n", "k")
+    store.set_base("n", "k", 2)
+    assert store.incr("n", "k", limit=3) == (False, 3)
+
+
+def test_incr_restarts_after_expiry(store):
+    past = time.time() - 1
+    store.incr("n", "k", 3, expires_at=past)
+    assert store.incr("n", "k", limit=3, expires_at=time.time() + 60) == (True, 1)
+
+
+def test_incr_keys_are_separate(store):
+    store.incr("n", "a", limit=1)
+    assert store.incr("n", "b", limit=1) == (True, 1)
+    assert store.incr("m", "a", limit=1) == (True, 1)
+
+
+# ----------------------------------
+# throttle (GCRA)
+# ----------------------------------
+def test_throttle_allows_burst_then_limits(store):
+    now = 1000.0
+    # 1 request per second, 2 more as burst
+    results = [store.throttle("t", "k", 1.0, 2.0, now=now)[0] for _ in range(4)]
+    assert results == [True, True, True, False]
+
+
+def test_throttle_retry_after(store):
+    now = 1000.0
+    store.throttle("t", "k", 1.0, 0.0, now=now)
+    allowed, retry_after = store.throttle("t", "k", 1.0, 0.0, now=now + 0.25)
+    assert not allowed
+    assert retry_after == pytest.approx(0.75)
+
+
+def test_throttle_recovers_over_time(store):
+    now = 1000.0
+    store.throttle("t", "k", 1.0, 0.0, now=now)
+    assert not store.throttle("t", "k", 1.0, 0.0, now=now + 0.5)[0]
+    assert store.throttle("t", "k", 1.0, 0.0, now=now + 1.0)[0]
+
+
+def test_throttle_state_expires(store):
+    store.throttle("t", "k", 1.0, 0.0, now=time.time() - 10)
+    store.purge()
+    assert store.throttle("t", "k", 1.0, 0.0)[0]
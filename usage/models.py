@@ -0,0 +1,16 @@
+from datetime import datetime
+from database import db
+
+
+class UsageDaily(db.Model):
+    """
+    Daily quota usage per user and node, synced from each node's local
+    counters; a user's usage for the day is the sum over nodes
+    """
+    __tablename__ = "usage_daily"
+
+    user_id = db.Column(db.UUID(as_uuid=True), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    node = db.Column(db.String(64), primary_key=True)
+    used = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,277 @@
+import os
+import uuid
+import socket
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from flask import current_app
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import db
+from usage.models import UsageDaily
+from utils.local_store import local_store
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaEngine:
+    """
+    Daily generation quotas per user, enforced from the node-local store.
+
+    Counters are keyed "<user>:<UTC day>" in utils.local_store, so every
+    worker on the node sees the same count and a check is one SQLite
+    read (an increment one capped upsert) instead of a Postgres round
+    trip. The tier, which decides the limit, is cached there as well.
+
+    Every `sync_interval` seconds one worker per node pushes changed
+    counters to usage_daily (this node's row) and pulls what other nodes
+    counted for the same users into the counters' `base`. Across nodes
+    a user can therefore overshoot by what the other nodes counted since
+    the last sync.
+    """
+
+    NAMESPACE = "quota"
+    TIER_NAMESPACE = "quota_tier"
+
+    def __init__(self, limits: Dict[str, int], node: str, sync_interval: float = 10,
+                 tier_ttl: float = 300, store=local_store):
+        # limit <= 0 means unlimited
+        self.limits = limits
+        self.node = node[:64]
+        self.sync_interval = sync_interval
+        self.tier_ttl = tier_ttl
+        self.store = store
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._app = None
+
+        self.checks = 0
+        self.increments = 0
+        self.denied = 0
+        self.syncs = 0
+        self.sync_errors = 0
+        self.rows_pushed = 0
+        self.sync_seconds_last = None
+
+    # ----------------------------------
+    # Keys and limits
+    # ----------------------------------
+    @staticmethod
+    def _day() -> date:
+        return datetime.now(timezone.utc).date()
+
+    @staticmethod
+    def _resets_at(day: date) -> datetime:
+        return datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+
+    def _key(self, user_id, day: date) -> str:
+        return f"{user_id}:{day.isoformat()}"
+
+    def tier(self, user_id) -> str:
+        tier = self.store.get(self.TIER_NAMESPACE, str(user_id))
+        if tier is None:
+            from subscription.service import SubscriptionService
+            tier = SubscriptionService.get_tier(user_id)
+            self.store.set(self.TIER_NAMESPACE, str(user_id), tier, ttl=self.tier_ttl)
+        return tier
+
+    def forget_tier(self, user_id) -> None:
+        """
+        Call when a subscription changes so the new limit applies at once
+        """
+        self.store.delete(self.TIER_NAMESPACE, str(user_id))
+
+    def limit_for(self, tier: str) -> Optional[int]:
+        limit = self.limits.get(tier, self.limits.get("free"))
+        return limit if limit and limit > 0 else None
+
+    # ----------------------------------
+    # Checks
+    # ----------------------------------
+    def check(self, user_id) -> Dict:
+        self.start()
+        day = self._day()
+        tier = self.tier(user_id)
+        limit = self.limit_for(tier)
+        used = self.store.total(self.NAMESPACE, self._key(user_id, day))
+
+        with self._lock:
+            self.checks += 1
+        return self._result(limit is None or used < limit, used, limit, tier, day)
+
+    def increment(self, user_id, amount: int = 1) -> Dict:
+        """
+        Count `amount` uses unless that would exceed today's limit
+        """
+        self.start()
+        day = self._day()
+        tier = self.tier(user_id)
+        limit = self.limit_for(tier)
+        applied, used = self.store.incr(
+            self.NAMESPACE, self._key(user_id, day), amount,
+            limit=limit,
+            # Kept past midnight until it has been synced
+            expires_at=self._resets_at(day).timestamp() + 86400
+        )
+
+        with self._lock:
+            self.increments += 1
+            if not applied:
+                self.denied += 1
+        return self._result(applied, used, limit, tier, day)
+
+    def _result(self, allowed: bool, used: int, limit: Optional[int], tier: str, day: date) -> Dict:
+        return {
+            "allowed": allowed,
+            "used": used,
+            "limit": limit,
+            "remaining": None if limit is None else max(limit - used, 0),
+            "tier": tier,
+            "resets_at": self._resets_at(day).isoformat()
+        }
+
+    # ----------------------------------
+    # Postgres sync
+    # ----------------------------------
+    def sync(self) -> int:
+        """
+        Push changed counters and pull other nodes' counts for today's
+        active users. Needs an app context; returns rows pushed.
+        """
+        started = time.monotonic()
+        rows = self.store.unsynced(self.NAMESPACE)
+        pushed = []
+        for key, count in rows:
+            user_id, _, day = key.rpartition(":")
+            try:
+                pushed.append({
+                    "user_id": uuid.UUID(user_id),
+                    "day": date.fromisoformat(day),
+                    "node": self.node,
+                    "used": count,
+                    "updated_at": datetime.utcnow()
+                })
+            except ValueError:
+                continue
+
+        try:
+            if pushed:
+                stmt = pg_insert(UsageDaily).values(pushed)
+                db.session.execute(stmt.on_conflict_do_update(
+                    index_elements=["user_id", "day", "node"],
+                    set_={
+                        "used": func.greatest(UsageDaily.used, stmt.excluded.used),
+                        "updated_at": stmt.excluded.updated_at
+                    }
+                ))
+            db.session.commit()
+            self.store.mark_synced(self.NAMESPACE, rows)
+            self._pull()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self.sync_errors += 1
+            raise
+
+        with self._lock:
+            self.syncs += 1
+            self.rows_pushed += len(pushed)
+            self.sync_seconds_last = round(time.monotonic() - started, 4)
+        return len(pushed)
+
+    def _pull(self) -> None:
+        today = self._day()
+        keys = self.store.keys(self.NAMESPACE, suffix=f":{today.isoformat()}")
+        users = {}
+        for key in keys:
+            try:
+                users[uuid.UUID(key.rpartition(":")[0])] = key
+            except ValueError:
+                continue
+        if not users:
+            return
+
+        rows = (
+            db.session.query(
+                UsageDaily.user_id,
+                func.coalesce(func.sum(UsageDaily.used).filter(UsageDaily.node != self.node), 0),
+                func.max(UsageDaily.used).filter(UsageDaily.node == self.node)
+            )
+            .filter(
+                tuple_(UsageDaily.day, UsageDaily.user_id).in_([(today, u) for u in users])
+            )
+            .group_by(UsageDaily.user_id)
+            .all()
+        )
+        db.session.commit()
+        for user_id, others, own in rows:
+            self.store.set_base(self.NAMESPACE, users[user_id], int(others), floor=own)
+
+    # ----------------------------------
+    # Background sync
+    # ----------------------------------
+    def start(self) -> None:
+        """
+        Start this worker's sync thread (from a request, which provides
+        the app); the node-wide lease decides which worker actually syncs
+        """
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._app = current_app._get_current_object()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="quota-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                if not self.store.lease("quota-sync", self.sync_interval * 0.9):
+                    continue
+                with self._app.app_context():
+                    self.sync()
+                    db.session.remove()
+                self.store.purge()
+            except Exception as e:
+                logger.warning("Quota sync failed: %s", e)
+
+    # ----------------------------------
+    # Stats
+    # ----------------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "node": self.node,
+                "limits": self.limits,
+                "checks": self.checks,
+                "increments": self.increments,
+                "denied": self.denied,
+                "syncs": self.syncs,
+                "sync_errors": self.sync_errors,
+                "rows_pushed": self.rows_pushed,
+                "sync_seconds_last": self.sync_seconds_last
+            }
+
+
+quota_engine = QuotaEngine(
+    limits={
+        "anonymous": int(os.getenv("GUEST_DAILY_LIMIT", 3)),
+        "guest": int(os.getenv("GUEST_DAILY_LIMIT", 3)),
+        "free": int(os.getenv("FREE_DAILY_LIMIT", 5)),
+        "pro": int(os.getenv("PRO_DAILY_LIMIT", 0))
+    },
+    node=os.getenv("NODE_ID") or socket.gethostname(),
+    sync_interval=float(os.getenv("QUOTA_SYNC_INTERVAL", 10)),
+    tier_ttl=float(os.getenv("QUOTA_TIER_TTL", 300))
+)
+registry.register("quota", quota_engine.stats)
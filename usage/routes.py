@@ -25,7 +25,7 @@ def usage_check():
 def usage_increment():
     user_id = get_jwt_identity()
     result = UsageService.increment_usage(user_id)
-    return jsonify(result)
+    return jsonify(result), 200 if result["allowed"] else 429
 
 
 # ----------------------------------
@@ -1,59 +1,24 @@
-from datetime import datetime, date
-from database import db
-from models import User
+from usage.quota import quota_engine
 
 
 class UsageService:
     """
-    Handles per-user usage limits (daily quotas)
+    Handles per-user usage limits (daily quotas by subscription tier).
+    Counting happens in the node-local quota engine (usage.quota).
     """
 
-    # Example limits (can be subscription-based later)
-    FREE_DAILY_LIMIT = 5
-
     @staticmethod
-    def _today():
-        return date.today()
+    def check_usage(user_id):
+        return quota_engine.check(user_id)
 
     @staticmethod
-    def _get_usage_record(user_id):
+    def increment_usage(user_id, amount=1):
         """
-        Placeholder usage record.
-        Replace with DB/Redis-backed implementation.
+        Count one use; "allowed" is False (and nothing is counted) once
+        today's limit is reached
         """
-        # For now, return a simple in-memory style object
-        return {
-            "used": 0,
-            "date": UsageService._today()
-        }
-
-    @staticmethod
-    def check_usage(user_id):
-        usage = UsageService._get_usage_record(user_id)
-
-        allowed = usage["used"] < UsageService.FREE_DAILY_LIMIT
-
-        return {
-            "allowed": allowed,
-            "used": usage["used"],
-            "limit": UsageService.FREE_DAILY_LIMIT
-        }
-
-    @staticmethod
-    def increment_usage(user_id):
-        usage = UsageService._get_usage_record(user_id)
-        usage["used"] += 1
-
-        return {
-            "used": usage["used"],
-            "limit": UsageService.FREE_DAILY_LIMIT
-        }
+        return quota_engine.increment(user_id, amount)
 
     @staticmethod
     def status(user_id):
-        usage = UsageService._get_usage_record(user_id)
-
-        return {
-            "used": usage["used"],
-            "limit": UsageService.FREE
-        }
\ No newline at end of file
+        return quota_engine.check(user_id)
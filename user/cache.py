@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from database import db
+from models import User
+from utils.metrics import registry
+
+
+class CachedUser:
+    """
+    The User columns the API returns, without the ORM instance
+    (read-only; mutate through User and invalidate)
+    """
+
+    __slots__ = (
+        "id", "email", "phone", "name", "is_active", "is_guest",
+        "is_pro_user", "created_at", "expires_at"
+    )
+
+    COLUMNS = (
+        User.id, User.email, User.phone, User.name, User.is_active,
+        User.is_guest, User.is_pro_user, User.created_at
+    )
+
+    def __init__(self, row, expires_at: float):
+        (self.id, self.email, self.phone, self.name, self.is_active,
+         self.is_guest, self.is_pro_user, self.created_at) = row
+        self.expires_at = expires_at
+
+
+class UserCache:
+    """
+    Read-through, per-process cache of users by id for JWT-authenticated
+    lookups (session, profile, usage tier).
+
+    Bounded LRU of slotted entries, each living `ttl` seconds. Writes
+    through UserService (and password reset) invalidate the entry in
+    this process; other workers pick the change up within `ttl`.
+    Missing users are not cached.
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[uuid.UUID, CachedUser]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate(); a load that raced an invalidation isn't stored
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(user_id) -> Optional[uuid.UUID]:
+        if isinstance(user_id, uuid.UUID):
+            return user_id
+        try:
+            return uuid.UUID(str(user_id))
+        except ValueError:
+            return None
+
+    def get(self, user_id) -> Optional[CachedUser]:
+        key = self._key(user_id)
+        if key is None:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+
+        row = db.session.query(*CachedUser.COLUMNS).filter(User.id == key).first()
+        if row is None:
+            return None
+
+        entry = CachedUser(row, now + self.ttl)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return entry
+
+    def invalidate(self, user_id) -> None:
+        key = self._key(user_id)
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if key is not None:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+user_cache = UserCache(
+    ttl=float(os.getenv("USER_CACHE_TTL", 60)),
+    max_entries=int(os.getenv("USER_CACHE_SIZE", 10000))
+)
+registry.register("user_cache", user_cache.stats)
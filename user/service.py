@@ -3,11 +3,13 @@ from models import User
 from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation
 
+from user.cache import user_cache
+
 class UserService:
 
     @staticmethod
     def get_profile(user_id):
-        return User.query.get(user_id)
+        return user_cache.get(user_id)
 
     @staticmethod
     def update_profile(user_id, data):
@@ -23,6 +25,7 @@ class UserService:
 
         try:
             db.session.commit()
+            user_cache.invalidate(user_id)
             return user
 
         except IntegrityError as e:
@@ -42,6 +45,7 @@ class UserService:
 
         user.is_active = False
         db.session.commit()
+        user_cache.invalidate(user_id)
         return True
 
     @staticmethod
@@ -52,4 +56,5 @@ class UserService:
 
         user.is_active = True
         db.session.commit()
+        user_cache.invalidate(user_id)
         return True
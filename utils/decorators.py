@@ -1,5 +1,7 @@
+import os
+import hmac
 from functools import wraps
-from flask import jsonify
+from flask import jsonify, request
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 
 from subscription.service import SubscriptionService
@@ -36,3 +38,22 @@ def subscription_required(fn):
 
         return fn(*args, **kwargs)
     return wrapper
+
+
+def admin_required(fn):
+    """
+    Restrict endpoint to callers presenting the ADMIN_API_KEY
+    in the X-Admin-Key header
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        expected = os.getenv("ADMIN_API_KEY")
+        provided = request.headers.get("X-Admin-Key", "")
+
+        if not expected or not hmac.compare_digest(provided, expected):
+            return jsonify({
+                "error": "Admin access required"
+            }), 403
+
+        return fn(*args, **kwargs)
+    return wrapper
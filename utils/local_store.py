@@ -0,0 +1,316 @@
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import registry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    count      INTEGER NOT NULL DEFAULT 0,
+    base       INTEGER NOT NULL DEFAULT 0,
+    synced     INTEGER NOT NULL DEFAULT 0,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS kv (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at) WHERE expires_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS counters_expires ON counters (expires_at) WHERE expires_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS leases (
+    name     TEXT PRIMARY KEY,
+    holder   TEXT,
+    until_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Capped increment in one statement; a counter past its expiry restarts
+# from zero. No row is returned when the cap would be exceeded.
+_INCR_SQL = """
+    INSERT INTO counters (namespace, key, count, expires_at)
+    VALUES (:namespace, :key, :amount, :expires_at)
+    ON CONFLICT (namespace, key) DO UPDATE SET
+        count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END,
+        base = CASE WHEN expires_at <= :now THEN 0 ELSE base END,
+        synced = CASE WHEN expires_at <= :now THEN 0 ELSE synced END,
+        expires_at = excluded.expires_at
+    WHERE :limit IS NULL
+       OR (CASE WHEN expires_at <= :now THEN 0 ELSE count + base END) + :amount <= :limit
+    RETURNING count, base
+"""
+
+
+# GCRA step: the stored value is the theoretical arrival time (TAT).
+# Nothing is written (no row returned) when the request is over the limit.
+_THROTTLE_SQL = """
+    INSERT INTO kv (namespace, key, value, expires_at)
+    VALUES (:namespace, :key, :now + :cost, :now + :cost)
+    ON CONFLICT (namespace, key) DO UPDATE SET
+        value = MAX(CAST(value AS REAL), :now) + :cost,
+        expires_at = MAX(CAST(value AS REAL), :now) + :cost
+    WHERE MAX(CAST(value AS REAL), :now) - :now <= :tolerance
+    RETURNING value
+"""
+
+
+class LocalStore:
+    """
+    Node-local shared state: a SQLite file in WAL mode that every worker
+    process on the machine opens, so counters and small values are
+    shared across gunicorn workers without a network round trip.
+
+    Every operation is a single autocommit statement (reads take a few
+    microseconds, writes tens); SQLite serializes writers across
+    processes. Connections are per thread and reopened after fork.
+
+    - counters: atomic (optionally capped) increments, plus a `base`
+      for counts known from elsewhere and a `synced` watermark for
+      pushing deltas to Postgres
+    - kv: JSON values with an optional expiry (also GCRA rate limit state)
+    - leases: "one process on this node does X every N seconds"
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.busy_errors = 0
+
+    # ----------------------------------
+    # Connections
+    # ----------------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(
+            self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(_SCHEMA)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _execute(self, sql: str, params=(), write: bool = False) -> sqlite3.Cursor:
+        try:
+            cursor = self._conn().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                with self._lock:
+                    self.busy_errors += 1
+            raise
+        with self._lock:
+            if write:
+                self.writes += 1
+            else:
+                self.reads += 1
+        return cursor
+
+    # ----------------------------------
+    # Counters
+    # ----------------------------------
+    def incr(self, namespace: str, key: str, amount: int = 1,
+             limit: Optional[int] = None, expires_at: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        Add `amount` unless that would take count + base past `limit`.
+        An expired counter starts again from zero. Returns (applied,
+        count + base after the call).
+        """
+        if limit is not None and amount > limit:
+            return False, self.total(namespace, key)
+
+        row = self._execute(_INCR_SQL, {
+            "namespace": namespace, "key": key, "amount": amount,
+            "expires_at": expires_at, "now": time.time(), "limit": limit
+        }, write=True).fetchone()
+        if row is None:
+            return False, self.total(namespace, key)
+        return True, row[0] + row[1]
+
+    def total(self, namespace: str, key: str) -> int:
+        row = self._execute(
+            "SELECT count + base FROM counters WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def reset(self, namespace: str, key: str) -> None:
+        self._execute(
+            "DELETE FROM counters WHERE namespace = ? AND key = ?", (namespace, key), write=True
+        )
+
+    def set_base(self, namespace: str, key: str, base: int,
+                 floor: Optional[int] = None) -> None:
+        """
+        Record counts from elsewhere (e.g. other nodes); `floor` raises
+        the local count to at least that value (e.g. after a lost file)
+        """
+        self._execute(
+            "UPDATE counters SET base = ?, count = MAX(count, COALESCE(?, 0)), "
+            "synced = MAX(synced, COALESCE(?, 0)) WHERE namespace = ? AND key = ?",
+            (base, floor, floor, namespace, key),
+            write=True
+        )
+
+    def unsynced(self, namespace: str, limit: int = 5000) -> List[Tuple[str, int]]:
+        """
+        (key, count) of counters changed since their last mark_synced
+        """
+        return self._execute(
+            "SELECT key, count FROM counters WHERE namespace = ? AND count <> synced LIMIT ?",
+            (namespace, limit)
+        ).fetchall()
+
+    def mark_synced(self, namespace: str, rows: List[Tuple[str, int]]) -> None:
+        if rows:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "UPDATE counters SET synced = MAX(synced, ?) WHERE namespace = ? AND key = ?",
+                    [(count, namespace, key) for key, count in rows]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            with self._lock:
+                self.writes += 1
+
+    def keys(self, namespace: str, suffix: str = "", limit: int = 5000) -> List[str]:
+        return [
+            row[0] for row in self._execute(
+                "SELECT key FROM counters WHERE namespace = ? AND key LIKE ? "
+                "AND (expires_at IS NULL OR expires_at > ?) LIMIT ?",
+                (namespace, f"%{suffix}", time.time(), limit)
+            )
+        ]
+
+    # ----------------------------------
+    # Values
+    # ----------------------------------
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        row = self._execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._execute(
+            "INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET "
+            "value = excluded.value, expires_at = excluded.expires_at",
+            (namespace, key, json.dumps(value), time.time() + ttl if ttl else None),
+            write=True
+        )
+
+    def throttle(self, namespace: str, key: str, cost: float, tolerance: float,
+                 now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        One GCRA decision shared by every worker on the node: `cost` is
+        the emission interval (seconds per request), `tolerance` the
+        burst allowance. Returns (allowed, seconds until allowed).
+        """
+        now = time.time() if now is None else now
+        row = self._execute(_THROTTLE_SQL, {
+            "namespace": namespace, "key": key, "now": now,
+            "cost": cost, "tolerance": tolerance
+        }, write=True).fetchone()
+        if row is not None:
+            return True, 0.0
+        tat = self._execute(
+            "SELECT CAST(value AS REAL) FROM kv WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        return False, max(0.0, (tat[0] if tat else now) - now - tolerance)
+
+    def pop_if(self, namespace: str, key: str, value: Any) -> bool:
+        """
+        Delete an unexpired entry only if it holds `value`; True for
+        exactly one of any concurrent callers
+        """
+        return self._execute(
+            "DELETE FROM kv WHERE namespace = ? AND key = ? AND value = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, json.dumps(value), time.time()),
+            write=True
+        ).rowcount == 1
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._execute(
+            "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key), write=True
+        )
+
+    # ----------------------------------
+    # Maintenance
+    # ----------------------------------
+    def lease(self, name: str, seconds: float) -> bool:
+        """
+        True for exactly one caller per `seconds` across the node
+        """
+        now = time.time()
+        row = self._execute(
+            "INSERT INTO leases (name, holder, until_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, until_at = excluded.until_at "
+            "WHERE leases.until_at <= ? RETURNING holder",
+            (name, f"{os.getpid()}:{threading.get_ident()}", now + seconds, now),
+            write=True
+        ).fetchone()
+        return row is not None
+
+    def purge(self, grace: float = 86400) -> int:
+        """
+        Bulk-delete expired rows (index range scans); counters that were
+        never synced get `grace` more seconds for the sync to catch up
+        """
+        now = time.time()
+        removed = self._execute(
+            "DELETE FROM counters WHERE expires_at IS NOT NULL AND expires_at <= ? "
+            "AND (count = synced OR expires_at <= ?)",
+            (now, now - grace), write=True
+        ).rowcount
+        removed += self._execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,), write=True
+        ).rowcount
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "reads": self.reads,
+                "writes": self.writes,
+                "busy_errors": self.busy_errors
+            }
+
+
+# One file per node, shared by every worker process on it
+local_store = LocalStore(
+    os.getenv("LOCAL_STORE_PATH") or os.path.join(tempfile.gettempdir(), "avionmeals-local.sqlite3")
+)
+registry.register("local_store", local_store.stats)
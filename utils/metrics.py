@@ -0,0 +1,107 @@
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence
+
+
+# Common bucket bounds
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2, 3, 5, 8, 13, 20, 30, 60, 120
+)
+TOKEN_BUCKETS = (25, 50, 100, 200, 400, 800, 1600, 3200, 6400, 12800)
+COST_BUCKETS = (1e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 5e-2)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; observe() is a bisect plus a few adds.
+    Not locked: callers serialize updates.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float):
+        """
+        Upper bound of the bucket holding the q-th observation
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max
+        }
+
+    def prometheus(self, name: str, labels: Dict[str, str]) -> List[str]:
+        base = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        sep = "," if base else ""
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{base}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{base}}} {self.sum}")
+        lines.append(f"{name}_count{{{base}}} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Named stats sources collected by GET /metrics
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._prometheus = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, stats: Callable[[], Dict],
+                 prometheus: Callable[[], List[str]] = None) -> None:
+        with self._lock:
+            self._sources[name] = stats
+            if prometheus:
+                self._prometheus[name] = prometheus
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            sources = dict(self._sources)
+        return {name: stats() for name, stats in sources.items()}
+
+    def prometheus(self) -> str:
+        with self._lock:
+            sources = dict(self._prometheus)
+        lines = []
+        for render in sources.values():
+            lines.extend(render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from utils.local_store import local_store
+from utils.metrics import registry
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """
+    "10/minute" -> (10, 60.0); also "5/s", "100/hour", "30/10s"
+    """
+    count, _, period = rate.strip().lower().partition("/")
+    period = period.strip() or "second"
+    digits = "".join(ch for ch in period if ch.isdigit() or ch == ".")
+    unit = period[len(digits):].strip()
+    unit = next((name for name in _PERIODS if name.startswith(unit)), None)
+    if unit is None or int(count) <= 0:
+        raise ValueError(f"Invalid rate: {rate}")
+    return int(count), float(digits or 1) * _PERIODS[unit]
+
+
+class RateLimit:
+    """
+    One named limit, enforced with GCRA (generic cell rate algorithm).
+
+    State is a single float per key, the theoretical arrival time (TAT),
+    so a decision is a dict lookup and a comparison under one lock.
+    `burst` requests may arrive back to back; after that they are spaced
+    `period / count` apart. With `shared`, the TAT lives in the node's
+    local store instead, so all workers on the node share one budget.
+    """
+
+    def __init__(self, name: str, rate: str, burst: Optional[int] = None,
+                 shared: bool = False, max_keys: int = 100000):
+        count, period = parse_rate(rate)
+        self.name = name
+        self.rate = rate
+        self.interval = period / count
+        self.burst = max(1, burst or count)
+        self.tolerance = self.interval * (self.burst - 1)
+        self.shared = shared
+        self.max_keys = max_keys
+
+        self._tat: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        Count one request for `key`; returns (allowed, retry after seconds)
+        """
+        now = time.time() if now is None else now
+
+        if self.shared:
+            allowed, retry_after = local_store.throttle(
+                "ratelimit", f"{self.name}:{key}", self.interval, self.tolerance, now
+            )
+            with self._lock:
+                if allowed:
+                    self.allowed += 1
+                else:
+                    self.limited += 1
+            return allowed, retry_after
+
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            if tat - now > self.tolerance:
+                self.limited += 1
+                return False, tat - now - self.tolerance
+
+            if key not in self._tat and len(self._tat) >= self.max_keys:
+                self._prune(now)
+            self._tat[key] = tat + self.interval
+            self.allowed += 1
+            return True, 0.0
+
+    def _prune(self, now: float) -> None:
+        """
+        Drop keys whose TAT has passed (they are back to a full burst)
+        """
+        for key in [k for k, tat in self._tat.items() if tat <= now]:
+            del self._tat[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "shared": self.shared,
+                "keys": len(self._tat),
+                "allowed": self.allowed,
+                "limited": self.limited
+            }
+
+
+class RateLimiter:
+    """
+    Named limits, declared per route (@rate_limit) or per blueprint
+    (limit_blueprint). Callers are identified by JWT identity, else by
+    client IP; body fields such as user_id are deliberately ignored.
+    Checks run before the view, so a rejected call costs no DB or LLM work.
+    """
+
+    def __init__(self, enabled: bool = True, shared: bool = False, trust_proxy: bool = False):
+        self.enabled = enabled
+        self.shared = shared
+        self.trust_proxy = trust_proxy
+        self._limits: Dict[str, RateLimit] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, rate: str, burst: Optional[int] = None) -> RateLimit:
+        """
+        The limit called `name`; routes naming the same limit share it
+        """
+        with self._lock:
+            limit = self._limits.get(name)
+            if limit is None:
+                limit = self._limits[name] = RateLimit(name, rate, burst, shared=self.shared)
+            return limit
+
+    def client_key(self) -> str:
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        if identity:
+            return f"user:{identity}"
+
+        address = request.remote_addr
+        if self.trust_proxy and request.access_route:
+            address = request.access_route[0]
+        return f"ip:{address or 'unknown'}"
+
+    def check(self, limit: RateLimit):
+        """
+        None if the request may proceed, else a 429 response
+        """
+        if not self.enabled:
+            return None
+
+        allowed, retry_after = limit.hit(self.client_key())
+        if allowed:
+            return None
+
+        retry_after = max(1, int(retry_after + 0.999))
+        response = jsonify({
+            "error": "Too many requests. Please slow down.",
+            "retry_after": retry_after
+        })
+        response.status_code = 429
+        response.headers["Retry-After"] = str(retry_after)
+        return response
+
+    def limit(self, name: str, rate: str, burst: Optional[int] = None):
+        """
+        Route decorator; apply directly below @jwt_required (above
+        @llm_endpoint, which already does DB work)
+        """
+        limit = self.get(name, rate, burst)
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                rejected = self.check(limit)
+                if rejected is not None:
+                    return rejected
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def limit_blueprint(self, blueprint, name: str, rate: str, burst: Optional[int] = None) -> None:
+        """
+        Apply one limit to every route of a blueprint
+        """
+        limit = self.get(name, rate, burst)
+        blueprint.before_request(lambda: self.check(limit))
+
+    # ----------------------------------
+    # Stats
+    # ----------------------------------
+    def stats(self) -> Dict:
+        with self._lock:
+            limits = dict(self._limits)
+        return {
+            "enabled": self.enabled,
+            "shared": self.shared,
+            "limits": {name: limit.stats() for name, limit in limits.items()}
+        }
+
+    def prometheus(self) -> List[str]:
+        lines = []
+        for name, limit in self.stats()["limits"].items():
+            for result in ("allowed", "limited"):
+                lines.append(
+                    f'ratelimit_requests_total{{limit="{name}",result="{result}"}} {limit[result]}'
+                )
+        return lines
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+limiter = RateLimiter(
+    enabled=_flag("RATELIMIT_ENABLED", "true"),
+    shared=_flag("RATELIMIT_SHARED", "false"),
+    trust_proxy=_flag("RATELIMIT_TRUST_PROXY", "false")
+)
+rate_limit = limiter.limit
+registry.register("ratelimit", limiter.stats, limiter.prometheus)
+
+# Limits for LLM-backed endpoints (aliased routes share one limit)
+GENERATE_RATE = os.getenv("RATELIMIT_GENERATE", "10/minute")
+GENERATE_BURST = int(os.getenv("RATELIMIT_GENERATE_BURST", 5))
+BATCH_RATE = os.getenv("RATELIMIT_BATCH", "2/minute")
+BATCH_BURST = int(os.getenv("RATELIMIT_BATCH_BURST", 2))
@@ -1,4 +1,6 @@
-from flask import jsonify
+import json
+import contextvars
+from flask import jsonify, request, Response, stream_with_context
 
 
 def success_response(data=None, message="Success", status_code=200):
@@ -14,3 +16,44 @@ def error_response(message="Error", status_code=400):
         "success": False,
         "message": message
     }), status_code
+
+
+def stream_response(events):
+    """
+    Stream an iterable of dict events as NDJSON, or as Server-Sent
+    Events when the client asks for text/event-stream
+    """
+    sse = "text/event-stream" in request.headers.get("Accept", "")
+    # Events are produced after the view returns; keep its context vars
+    context = contextvars.copy_context()
+    events = iter(events)
+
+    def generate():
+        try:
+            while True:
+                try:
+                    event = context.run(next, events)
+                except StopIteration:
+                    return
+                line = json.dumps(event, default=str)
+                yield f"data: {line}\n\n" if sse else line + "\n"
+        finally:
+            # Client went away: let the producer clean up (e.g. release
+            # reserved credits) while the request context still exists
+            close = getattr(events, "close", None)
+            if close is not None:
+                context.run(close)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def wants_stream(data=None):
+    """
+    Opt-in streaming via ?stream=1 or {"stream": true}
+    """
+    flag = request.args.get("stream", (data or {}).get("stream", False))
+    return str(flag).lower() in ("1", "true", "yes")